@@ -1,25 +1,186 @@
 """FastAPI application — ties all backend modules together into a web API.
 
-Provides three endpoints:
-- GET  /health  — simple health check
-- POST /route   — route a prompt to the best model and return the LLM response
-- GET  /stats   — return usage statistics
+Provides these endpoints:
+- GET  /health        — simple health check
+- GET  /models        — the model catalogue (with ETag, reloaded when its file changes)
+- POST /route         — route a prompt to the best model and return the LLM response
+- POST /route/stream  — same as /route, but streams the answer as Server-Sent Events
+- POST /route/batch   — route a list of prompts with bounded concurrency
+- GET  /stats         — return usage statistics (optionally as a time series)
+- GET  /metrics       — counters and histograms in the Prometheus text format
+- GET  /accuracy      — error distributions of the cost and token estimates, with drift flags
+- GET  /spend         — spend and caps of the calling tenant for today and this month
+- GET  /logs/export   — stream filtered log entries as NDJSON or CSV
 
 Run with: uvicorn backend.app:app --reload
 API docs: http://localhost:8000/docs
 """
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from collections.abc import Collection
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import chain, islice
+
+import httpx
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+
+from backend import circuit_breaker, latency_tracker, metrics, rate_limiter, single_flight, tokenizer
+from backend.circuit_breaker import CircuitOpenError
+from backend.cost_estimator import (
+   PromptAnalysis,
+   analyze_prompt,
+   calculate_actual_cost,
+   count_input_tokens,
+   estimate_cost,
+   estimate_output_tokens,
+   estimate_tokens,
+)
+from backend.estimate_accuracy import ACCURACY_DRIFT_THRESHOLD, ACCURACY_EXCEEDED_THRESHOLD, ACCURACY_MIN_SAMPLES
+from backend.llm_client import call_llm, close_client, get_headers, start_client, stream_llm
+from backend.logging_service import (
+   get_estimate_accuracy,
+   get_series,
+   get_stats,
+   iter_log_records,
+   log_request,
+   save_stats_checkpoint,
+   start_log_writer,
+   stop_log_writer,
+)
+from backend.prompt_compressor import Compression, compress_prompt
+from backend.response_cache import cache_key, get_cache
+from backend.semantic_cache import get_semantic_cache
+from backend.routing import get_routing_index, select_model, select_models
+from backend.spend_ledger import (
+   SPEND_CAPS_REFRESH_INTERVAL,
+   Reservation,
+   SpendCapExceeded,
+   get_ledger,
+   start_ledger,
+   stop_ledger,
+)
+from backend.schemas import (
+   AccuracyResponse,
+   BatchItemResult,
+   BatchRouteRequest,
+   BatchRouteResponse,
+   CompressionInfo,
+   HealthResponse,
+   ModelsResponse,
+   RouteRequest,
+   RouteResponse,
+   SpendResponse,
+   StatsResponse,
+)
+from backend.model_config import MODEL_CATALOG_POLL_INTERVAL, get_catalogue, get_model, reload_catalogue
+
+# Max concurrent LLM calls within one /route/batch request, in total and per model
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+BATCH_MAX_CONCURRENCY_PER_MODEL = int(os.getenv("BATCH_MAX_CONCURRENCY_PER_MODEL", "4"))
+# How long a /route/batch item waits for rate limit capacity on its model before failing with 429
+BATCH_RATE_LIMIT_WAIT_SECONDS = float(os.getenv("BATCH_RATE_LIMIT_WAIT_SECONDS", "60"))
+# How long a hedged request waits for the primary model before firing the backup,
+# used while the primary has too few latency samples for a p95
+HEDGE_DELAY_MS = float(os.getenv("HEDGE_DELAY_MS", "2000"))
+# Accepted X-API-Key values, comma-separated (empty = trust the tenant headers as sent)
+ROUTER_API_KEYS = {key.strip() for key in os.getenv("ROUTER_API_KEYS", "").split(",") if key.strip()}
 
-from backend.cost_estimator import calculate_actual_cost, estimate_cost, estimate_tokens, estimate_output_tokens
-from backend.llm_client import call_llm
-from backend.logging_service import get_stats, log_request
-from backend.routing import select_model
-from backend.schemas import HealthResponse, RouteRequest, RouteResponse, StatsResponse
-from backend.model_config import MODELS
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AI Model Budget Router")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+   """Run startup and shutdown tasks around the lifetime of the app."""
+   # Write request logs from a background thread so /route never blocks on file I/O
+   start_log_writer()
+   # One pooled HTTP client for all Groq calls (keeps connections alive)
+   start_client()
+   # Open the spend ledger database, and keep its per-tenant caps up to date
+   await asyncio.to_thread(start_ledger)
+   caps_watcher = asyncio.create_task(refresh_spend_caps()) if SPEND_CAPS_REFRESH_INTERVAL > 0 else None
+   # Pick up changes to the model catalogue file without a restart
+   watcher = asyncio.create_task(watch_model_catalogue()) if MODEL_CATALOG_POLL_INTERVAL > 0 else None
+   # Load the tokenizer vocabularies now (not in the first request) and warn about missing ones
+   await asyncio.to_thread(tokenizer.load_tokenizers, get_routing_index().tokenizers)
+   # Share this worker's metrics with the others, so /metrics covers all workers
+   flusher = asyncio.create_task(flush_metrics()) if metrics.METRICS_FLUSH_INTERVAL > 0 else None
+   yield
+   if watcher is not None:
+      watcher.cancel()
+   if flusher is not None:
+      flusher.cancel()
+      # Keep this worker's final counts in the totals the other workers report
+      await asyncio.to_thread(metrics.write_snapshot, metrics.snapshot())
+   if caps_watcher is not None:
+      caps_watcher.cancel()
+   await close_client()
+   # Let settlements still running in worker threads finish before closing the ledger
+   await asyncio.gather(*_background_tasks, return_exceptions=True)
+   stop_ledger()
+   # Flush every queued log entry before the process exits
+   stop_log_writer()
+   # Persist the running /stats aggregate so the next start only reads the log tail
+   save_stats_checkpoint()
+
+
+async def watch_model_catalogue() -> None:
+   """Reload the model catalogue whenever its file changes (runs until cancelled)."""
+   while True:
+      await asyncio.sleep(MODEL_CATALOG_POLL_INTERVAL)
+      if reload_catalogue():
+         # Build the routing index for the new version now, not in the next request
+         index = get_routing_index()
+         await asyncio.to_thread(tokenizer.load_tokenizers, index.tokenizers)
+
+
+async def flush_metrics() -> None:
+   """Write this worker's metrics snapshot periodically (runs until cancelled).
+
+   The snapshot is copied here, on the event loop that records the metrics;
+   only writing it runs in a thread. A failed write is logged and retried
+   with the next snapshot.
+   """
+   while True:
+      await asyncio.sleep(metrics.METRICS_FLUSH_INTERVAL)
+      try:
+         await asyncio.to_thread(metrics.write_snapshot, metrics.snapshot())
+      except Exception:
+         logger.exception("Could not write the metrics snapshot")
+
+
+async def refresh_spend_caps() -> None:
+   """Re-read the per-tenant spend caps periodically (runs until cancelled)."""
+   while True:
+      await asyncio.sleep(SPEND_CAPS_REFRESH_INTERVAL)
+      ledger = get_ledger()
+      if ledger is not None:
+         await asyncio.to_thread(ledger.refresh_caps)
+
+
+# Tasks started from callbacks and cancelled requests (e.g. settling spend),
+# referenced here until they finish so they are not garbage collected
+_background_tasks: set[asyncio.Task] = set()
+
+
+def run_in_background(coroutine) -> None:
+   """Run a coroutine that nobody awaits."""
+   task = asyncio.ensure_future(coroutine)
+   _background_tasks.add(task)
+   task.add_done_callback(_background_tasks.discard)
+
+
+app = FastAPI(title="AI Model Budget Router", lifespan=lifespan)
 
 # Allow the Streamlit frontend (different port) to call this API
 app.add_middleware(
@@ -28,6 +189,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request counts, durations and in-flight requests for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -36,65 +199,1034 @@ async def health():
    return HealthResponse(status="ok")
 
 
+@app.get("/models", response_model=ModelsResponse)
+async def models(response: Response, if_none_match: str | None = Header(default=None)):
+   """Return the model catalogue.
+
+   The ETag changes with the catalogue's content; clients that send it back
+   in If-None-Match get an empty 304 while it is unchanged.
+   """
+   catalogue = get_catalogue()
+   etag = f'"{catalogue.etag}"'
+   if if_none_match is not None:
+      tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+      if etag in tags or "*" in tags:
+         return Response(status_code=304, headers={"ETag": etag})
+   response.headers["ETag"] = etag
+   response.headers["Cache-Control"] = "no-cache"
+   return ModelsResponse(models=catalogue.models, quality_thresholds=catalogue.quality_thresholds)
+
+
+def get_tenant(
+   x_api_key: str | None = Header(default=None),
+   x_tenant_id: str | None = Header(default=None),
+) -> str:
+   """Identify the tenant a request is charged to.
+
+   The API key wins over the tenant header; only a hash of the key is used,
+   so keys never end up in the ledger or the logs. Requests with neither
+   share the tenant "anonymous".
+
+   Without ROUTER_API_KEYS both headers are taken as sent, so they must be
+   set (and client values stripped) by a trusted proxy in front of the API;
+   otherwise a client can spread its spend across made-up tenants. With
+   ROUTER_API_KEYS, every request needs one of those keys and the tenant
+   header is ignored.
+
+   Raises:
+      HTTPException: 401 if ROUTER_API_KEYS is set and the key is missing or unknown.
+   """
+   if ROUTER_API_KEYS:
+      if x_api_key not in ROUTER_API_KEYS:
+         raise HTTPException(status_code=401, detail="Missing or unknown X-API-Key.")
+      x_tenant_id = None
+   if x_api_key:
+      return "key-" + hashlib.sha256(x_api_key.encode()).hexdigest()[:16]
+   if x_tenant_id:
+      return x_tenant_id
+   return "anonymous"
+
+
+@dataclass
+class RoutePlan:
+   """Routing decision and pre-call estimates for one request."""
+   model_id: str
+   routing_reason: str
+   input_tokens_est: int
+   output_tokens_est: int
+   cost_est: float
+
+   @property
+   def reserved_tokens(self) -> int:
+      """Tokens reserved with the rate limiter for this call."""
+      return self.input_tokens_est + self.output_tokens_est
+
+   def estimates(self) -> dict:
+      """The estimates as log entry fields, compared with the actuals by estimate_accuracy."""
+      return {
+         "input_tokens_est": self.input_tokens_est,
+         "output_tokens_est": self.output_tokens_est,
+         "estimated_cost": self.cost_est,
+      }
+
+
+def compress_request(request: RouteRequest) -> tuple[RouteRequest, Compression | None]:
+   """Run the prompt compression stage if the request asks for it (before step 1).
+
+   Returns:
+      The request to route (with the compressed prompt if compression was
+      applied) and the compression result, None if not requested.
+   """
+   if not request.compress:
+      return request, None
+   start = time.perf_counter()
+   compression = compress_prompt(request.prompt, request.task_type, request.compress_target_tokens)
+   metrics.observe_stage("compress", start)
+   if compression.applied:
+      request = request.model_copy(update={"prompt": compression.prompt})
+   return request, compression
+
+
+def compression_info(compression: Compression, model_id: str) -> CompressionInfo:
+   """Report a compression result, pricing the removed tokens at the model that answered."""
+   return CompressionInfo(
+      applied=compression.applied,
+      original_tokens=compression.original_tokens,
+      compressed_tokens=compression.compressed_tokens,
+      saved_cost=estimate_cost(model_id, compression.original_tokens - compression.compressed_tokens, 0),
+      latency_ms=compression.latency_ms,
+   )
+
+
+async def count_tokens_in_thread(prompts: list[str]) -> None:
+   """Count the input tokens of long prompts in a worker thread before routing.
+
+   BPE encoding is CPU-bound; done here, the counts land in the tokenizer's
+   cache and plan_route / select_models find them there instead of encoding
+   on the event loop.
+   """
+   threshold = tokenizer.TOKENIZER_THREAD_MIN_CHARS
+   long_prompts = [prompt for prompt in prompts if threshold and len(prompt) >= threshold]
+   if long_prompts:
+      await asyncio.to_thread(tokenizer.warm_cache, get_routing_index().tokenizers, long_prompts)
+
+
+def plan_route(
+   request: RouteRequest,
+   analysis: PromptAnalysis | None = None,
+   exclude: Collection[str] = (),
+   first_choice: tuple[str, str] | None = None,
+   reserve: bool = True,
+) -> RoutePlan:
+   """Select a model and estimate the cost (steps 1 and 2 of the /route flow).
+
+   Also reserves rate limit capacity for the chosen model. If the model is
+   saturated, the next-best candidate is selected instead of waiting. Models
+   whose circuit breaker is open are skipped, and with a latency target so
+   are models whose recent p95 latency exceeds it.
+
+   Args:
+      request: The routing request.
+      analysis: Precomputed prompt analysis; computed if omitted.
+      exclude: Rate limited models not to use (e.g. ones that just answered 429).
+      first_choice: (model_id, reason) already selected for this request.
+      reserve: If False, only plan; the caller reserves capacity itself
+         right before the call (see route_batch).
+
+   Raises:
+      HTTPException: 400 if no model fits the budget (and latency target),
+         429 if every model that fits is rate limited, 503 if every model
+         that fits is unavailable (circuit open).
+   """
+   # Analyse the prompt once; routing and cost estimation share the result
+   if analysis is None:
+      analysis = analyze_prompt(request.prompt)
+   rate_limited = set(exclude)
+   unavailable = circuit_breaker.unavailable_models()
+   too_slow = set()
+   if request.max_latency_ms is not None:
+      too_slow = latency_tracker.slow_models(request.max_latency_ms)
+   if first_choice is not None and first_choice[0] in unavailable | too_slow:
+      first_choice = None
+
+   while True:
+      # Step 1: Select the best model — raises ValueError if nothing fits the budget
+      if first_choice is not None:
+         model_id, routing_reason = first_choice
+         first_choice = None
+      else:
+         start = time.perf_counter()
+         try:
+            model_id, routing_reason = select_model(
+               request.prompt, request.task_type, request.budget, request.quality,
+               analysis=analysis, exclude=rate_limited | unavailable | too_slow,
+            )
+         except ValueError as e:
+            if rate_limited:
+               raise HTTPException(status_code=429, detail="All models within the budget are rate limited.")
+            if unavailable:
+               raise HTTPException(
+                  status_code=503, detail="All models within the budget are temporarily unavailable (circuit open)."
+               )
+            if too_slow:
+               raise HTTPException(
+                  status_code=400,
+                  detail=f"No model within the budget meets the latency target of {request.max_latency_ms} ms.",
+               )
+            raise HTTPException(status_code=400, detail=str(e))
+         finally:
+            metrics.observe_stage("select_model", start)
+
+      start = time.perf_counter()
+      try:
+         plan = estimate_plan(request, analysis, model_id, routing_reason)
+      finally:
+         metrics.observe_stage("estimate", start)
+
+      # Reserve one request and the estimated tokens; skip the model if it is saturated
+      if not reserve or rate_limiter.try_acquire(model_id, plan.reserved_tokens):
+         return plan
+      rate_limited.add(model_id)
+
+
+def estimate_plan(request: RouteRequest, analysis: PromptAnalysis, model_id: str, routing_reason: str) -> RoutePlan:
+   """Estimate tokens and cost for the selected model (step 2 of the /route flow).
+
+   Raises:
+      HTTPException: 400 if the estimated cost exceeds the budget.
+   """
+   # Step 2: Estimate tokens and cost before calling the API
+   input_tokens_est = count_input_tokens(model_id, request.prompt, analysis)
+   output_tokens_est = estimate_output_tokens(
+      input_tokens_est, request.task_type, get_model(model_id)["max_tokens"], model_id
+   )
+   cost_est = estimate_cost(model_id, input_tokens_est, output_tokens_est)
+
+   # Safety check: reject if estimated cost exceeds the user's budget
+   if cost_est > request.budget:
+      raise HTTPException(status_code=400, detail=f"Estimated cost ${cost_est} exceeds budget ${request.budget}.")
+
+   return RoutePlan(model_id, routing_reason, input_tokens_est, output_tokens_est, cost_est)
+
+
+def cost_log_entry(
+   model_id: str, usage: dict, cost: float, routing_reason: str, cached: bool = False, coalesced: bool = False
+) -> dict:
+   """Build the log entry for a completed request.
+
+   A cache hit is logged with actual_cost 0 and the cost it would have had
+   as saved_cost, so /stats can report the hit rate and dollars saved. So is
+   a request that shared the LLM call of an identical one (coalesced).
+   """
+   entry = {
+      "model": model_id,
+      "input_tokens": usage["input_tokens"],
+      "output_tokens": usage["output_tokens"],
+      "actual_cost": 0.0 if cached or coalesced else cost,
+      "routing_reason": routing_reason,
+      "cache_hit": cached,
+   }
+   if coalesced:
+      entry["coalesced"] = True
+   if cached or coalesced:
+      entry["saved_cost"] = cost
+   elif "latency_ms" in usage:
+      entry["latency_ms"] = usage["latency_ms"]
+   return entry
+
+
+async def lookup_cache(request: RouteRequest, plan: RoutePlan) -> tuple[dict | None, float | None]:
+   """Look up a cached answer: identical prompt first, then a similar one.
+
+   A blocking cache backend (SQLite) is read in a worker thread.
+
+   Returns:
+      (answer, similarity): answer is None on a miss; similarity is set
+      for a hit of the semantic cache only.
+   """
+   cache = get_cache()
+   if cache is not None:
+      key = cache_key(plan.model_id, request.prompt, plan.output_tokens_est)
+      if getattr(cache, "blocking", False):
+         answer = await asyncio.to_thread(cache.get, key)
+      else:
+         answer = cache.get(key)
+      if answer is not None:
+         return answer, None
+   semantic = get_semantic_cache()
+   if semantic is not None:
+      hit = semantic.get(plan.model_id, request.task_type, request.prompt, plan.output_tokens_est)
+      if hit is not None:
+         return hit
+   return None, None
+
+
+def store_cache(request: RouteRequest, plan: RoutePlan, answer: dict) -> None:
+   """Store a fresh answer in the exact and the semantic cache.
+
+   A blocking cache backend (SQLite) is written in a worker thread, in the
+   background: the response does not wait for it.
+   """
+   cache = get_cache()
+   if cache is not None:
+      key = cache_key(plan.model_id, request.prompt, plan.output_tokens_est)
+      if getattr(cache, "blocking", False):
+         run_in_background(asyncio.to_thread(cache.set, key, answer))
+      else:
+         cache.set(key, answer)
+   semantic = get_semantic_cache()
+   if semantic is not None:
+      semantic.set(plan.model_id, request.task_type, request.prompt, answer)
+
+
+def record_metrics(
+   plan: RoutePlan, usage: dict, actual_cost: float, similarity: float | None, cached: bool, coalesced: bool = False
+) -> None:
+   """Count a completed request in /metrics: a cache hit, a coalesced request or an LLM call."""
+   if cached:
+      metrics.CACHE_HITS.inc("exact" if similarity is None else "semantic")
+   elif coalesced:
+      metrics.COALESCED.inc()
+   else:
+      metrics.observe_call(plan.model_id, usage["input_tokens"], usage["output_tokens"], plan.cost_est, actual_cost)
+
+
+async def reserve_spend(tenant: str, plan: RoutePlan) -> Reservation | None:
+   """Reserve the estimated cost of a planned call in the tenant's spend ledger.
+
+   The ledger transaction runs in a worker thread, since it may wait for
+   another worker's lock. Returns None (without touching the database) if
+   spend tracking is off or no cap applies to the tenant.
+
+   Raises:
+      HTTPException: 402 if the call would exceed one of the tenant's caps.
+   """
+   ledger = get_ledger()
+   if ledger is None or not ledger.has_cap(tenant):
+      return None
+   reserving = asyncio.ensure_future(asyncio.to_thread(ledger.reserve, tenant, plan.cost_est))
+   try:
+      return await asyncio.shield(reserving)
+   except SpendCapExceeded as e:
+      raise HTTPException(status_code=402, detail=str(e))
+   except asyncio.CancelledError:
+      # The thread goes on and may still reserve: give the reservation back then
+      def give_back(task: asyncio.Task) -> None:
+         if task.exception() is None:
+            run_in_background(settle_spend(task.result(), 0.0))
+
+      reserving.add_done_callback(give_back)
+      raise
+
+
+async def settle_spend(reservation: Reservation | None, actual_cost: float) -> None:
+   """Replace a reservation from reserve_spend with the actual cost (in a worker thread)."""
+   ledger = get_ledger()
+   if reservation is not None and ledger is not None:
+      await asyncio.to_thread(ledger.settle, reservation, actual_cost)
+
+
 @app.post("/route", response_model=RouteResponse)
-async def route(request: RouteRequest):
+async def route(request: RouteRequest, tenant: str = Depends(get_tenant)):
    """Main endpoint: select a model, call the LLM, and return the response.
 
    Flow:
+   0. Compress the prompt if the request asks for it.
    1. Pick the best model for the given task, budget, and quality level.
    2. Estimate cost upfront so we can reject requests that exceed the budget.
-   3. Call the Groq API and get the actual response.
-   4. Calculate the real cost based on actual token usage.
+   3. Reserve the estimate in the tenant's spend ledger and call the Groq API.
+   4. Calculate the real cost based on actual token usage and settle the reservation.
    5. Log the request for the /stats endpoint.
    6. Return the response with cost and routing details.
    """
-   # Step 1: Select the best model — raises ValueError if nothing fits the budget
+   request, compression = compress_request(request)
+   await count_tokens_in_thread([request.prompt])
+   # Steps 1 + 2: model selection and budget check
+   plan = plan_route(request)
+   # Steps 3 to 6
+   response = await execute(request, plan, tenant)
+   if compression is not None:
+      response.compression = compression_info(compression, response.model)
+   return response
+
+
+async def execute(request: RouteRequest, plan: RoutePlan, tenant: str) -> RouteResponse:
+   """Run a planned request for a tenant, hedged if the request asks for it."""
+   if request.hedge:
+      return await execute_hedged(request, plan, tenant)
+   return await execute_with_fallback(request, plan, tenant)
+
+
+async def execute_with_fallback(request: RouteRequest, plan: RoutePlan, tenant: str) -> RouteResponse:
+   """Run execute_route; if the model is unavailable (see should_fall_back), retry with the next-best model."""
+   unavailable = set()
+   while True:
+      try:
+         return await execute_route(request, plan, tenant)
+      except HTTPException as e:
+         if not should_fall_back(e, plan.model_id):
+            raise
+         unavailable.add(plan.model_id)
+         plan = plan_route(request, exclude=unavailable)
+
+
+def should_fall_back(e: HTTPException, model_id: str) -> bool:
+   """True if a failed call should be repeated with the next-best model.
+
+   That is if the model is rate limited (429), its circuit breaker is open
+   (503), or the call failed (502) and thereby opened the breaker.
+   """
+   if e.status_code in (429, 503):
+      return True
+   return e.status_code == 502 and model_id in circuit_breaker.unavailable_models()
+
+
+def plan_hedge(request: RouteRequest, plan: RoutePlan) -> RoutePlan | None:
+   """Plan the backup call of a hedged request.
+
+   The backup is the best other model whose estimated cost fits what is
+   left of the budget after the primary's estimate, so both calls together
+   stay within the budget. Returns None if there is no such model.
+   """
+   remaining = round(request.budget - plan.cost_est, 8)
+   if remaining <= 0:
+      return None
    try:
-      model_id, routing_reason = select_model(request.prompt, request.task_type, request.budget, request.quality)
-   except ValueError as e:
-      raise HTTPException(status_code=400, detail=str(e))
+      return plan_route(request.model_copy(update={"budget": remaining}), exclude={plan.model_id})
+   except HTTPException:
+      return None
 
-   # Step 2: Estimate tokens and cost before calling the API
-   input_tokens_est = estimate_tokens(request.prompt)
-   output_tokens_est = estimate_output_tokens(input_tokens_est, request.task_type, MODELS[model_id]["max_tokens"])
-   cost_est = estimate_cost(model_id, input_tokens_est, output_tokens_est)
 
-   # Safety check: reject if estimated cost exceeds the user's budget
-   if cost_est > request.budget:
-      raise HTTPException(status_code=400, detail=f"Estimated cost ${cost_est} exceeds budget ${request.budget}.")
+async def execute_hedged(request: RouteRequest, plan: RoutePlan, tenant: str) -> RouteResponse:
+   """Run a request with a backup model if the primary is slower than usual.
+
+   Waits for the primary model up to its recent p95 latency (HEDGE_DELAY_MS
+   while unknown). If it has not answered by then, the same prompt is sent to
+   the backup from plan_hedge, the first successful answer wins and the other
+   call is cancelled. Both calls are logged; the response's actual_cost is
+   what the request cost in total.
+
+   Only calls that went upstream cost something: a loser that shared an
+   identical request's call (coalesced) or was answered from the cache is
+   free, and a cancelled loser is billed for its prompt and the part of the
+   answer it had streamed so far. A cancelled loser whose call goes on for
+   identical requests is billed when that call ends, after this response.
+   """
+   delay_ms = latency_tracker.p95(plan.model_id) or HEDGE_DELAY_MS
+   primary_progress, backup_progress = {}, {}
+   primary = asyncio.create_task(execute_route(request, plan, tenant, hedge="primary", progress=primary_progress))
+   done, _ = await asyncio.wait({primary}, timeout=delay_ms / 1000)
+   backup = None if done else plan_hedge(request, plan)
+
+   if backup is None:
+      # No hedge: behave like execute_with_fallback
+      try:
+         return await primary
+      except HTTPException as e:
+         if not should_fall_back(e, plan.model_id):
+            raise
+      return await execute_with_fallback(request, plan_route(request, exclude={plan.model_id}), tenant)
+
+   secondary = asyncio.create_task(execute_route(request, backup, tenant, hedge="backup", progress=backup_progress))
+   pending = {primary, secondary}
+   while pending:
+      done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+      # Prefer the primary if both finished at the same time
+      for task in (primary, secondary):
+         if task in done and task.exception() is None:
+            winner = task
+            break
+      else:
+         continue
+
+      # Cancel the slower call; execute_route logs it as cancelled
+      for task in pending:
+         task.cancel()
+      await asyncio.gather(*pending, return_exceptions=True)
 
-   # Step 3: Call the Groq API — RuntimeError means missing API key, other errors are upstream failures
+      loser, loser_progress = (secondary, backup_progress) if winner is primary else (primary, primary_progress)
+      if loser.cancelled():
+         # What execute_route charged for it; nothing if it never called upstream
+         loser_cost = loser_progress.get("cost", 0.0)
+      elif loser.exception() is None:
+         loser_cost = loser.result().actual_cost
+      else:
+         loser_cost = 0.0
+      response = winner.result()
+      return response.model_copy(update={
+         "actual_cost": round(response.actual_cost + loser_cost, 8),
+         "routing_reason": f"{response.routing_reason} (hedged with {backup.model_id} after {delay_ms:.0f} ms)",
+         "hedged": True,
+      })
+
+   # Both calls failed: report the primary's error
+   raise primary.exception()
+
+
+async def execute_route(
+   request: RouteRequest,
+   plan: RoutePlan,
+   tenant: str,
+   hedge: str | None = None,
+   progress: dict | None = None,
+) -> RouteResponse:
+   """Call the LLM for a planned request, log it and build the response (steps 3 to 6).
+
+   Args:
+      request: The routing request.
+      plan: Model and estimates from plan_route.
+      tenant: Tenant whose spend ledger is charged (cache hits and
+         coalesced requests are free).
+      hedge: Role of the call in a hedged request ("primary" or "backup"),
+         added to the log entry. Hedged calls stream the answer, so one that
+         is cancelled while waiting for the LLM is logged with hedge
+         "cancelled" and billed for its prompt plus the output so far.
+      progress: For hedged calls, filled while the call runs: "chunks" and
+         "usage" of the answer so far, and "cost" once a cancelled call has
+         been billed.
+
+   Identical requests (model, prompt, max_tokens) in flight at the same
+   time share one LLM call (see backend.single_flight). If the request
+   that started it is cancelled while others still wait, the call goes on
+   and that request is billed and logged when it finishes.
+
+   Raises:
+      HTTPException: 402 if the call would exceed the tenant's spend cap, 500
+         if the API key is missing, 429 if the model is rate limited
+         upstream, 503 if its circuit breaker is open, 502 if the upstream
+         call fails otherwise (after llm_client's retries).
+   """
+   model_id = plan.model_id
+
+   # Step 3: Reuse the answer of an identical (or similar) earlier request if it is cached
+   start = time.perf_counter()
    try:
-      llm_response = await call_llm(model_id, request.prompt, max_tokens=output_tokens_est)
-   except RuntimeError as e:
-      raise HTTPException(status_code=500, detail=str(e))
-   except Exception as e:
-      raise HTTPException(status_code=502, detail=f"Error calling LLM: {str(e)}")
+      llm_response, similarity = await lookup_cache(request, plan)
+   except asyncio.CancelledError:
+      rate_limiter.release(model_id, plan.reserved_tokens)
+      raise
+   metrics.observe_stage("cache_lookup", start)
+   cached = llm_response is not None
+
+   # An identical request may be calling the LLM right now: share its answer
+   flight_key = (model_id, request.prompt, plan.output_tokens_est)
+   flight = single_flight.get(flight_key) if not cached else None
+   coalesced = flight is not None
+
+   # Otherwise reserve the estimate and call the Groq API — RuntimeError means
+   # missing API key, other errors are upstream failures
+   reservation = None
+   if cached:
+      rate_limiter.release(model_id, plan.reserved_tokens)
+   elif coalesced:
+      rate_limiter.release(model_id, plan.reserved_tokens)
+      try:
+         llm_response = await flight.wait()
+      except RuntimeError as e:
+         raise HTTPException(status_code=500, detail=str(e))
+      except Exception as e:
+         raise upstream_error(e)
+   else:
+      try:
+         reservation = await reserve_spend(tenant, plan)
+      except (HTTPException, asyncio.CancelledError):
+         rate_limiter.release(model_id, plan.reserved_tokens)
+         raise
+
+      def settle_cancelled() -> None:
+         if progress is not None and "chunks" not in progress:
+            # Cancelled before the call even started: nothing went upstream
+            rate_limiter.release(model_id, plan.reserved_tokens)
+            run_in_background(settle_spend(reservation, 0.0))
+            return
+         # The prompt was sent, so count its input, plus what a hedged call streamed so far
+         if progress is not None:
+            usage = streamed_usage(plan, progress["chunks"], progress["usage"])
+         else:
+            usage = {"input_tokens": plan.input_tokens_est, "output_tokens": 0}
+         rate_limiter.settle(model_id, plan.reserved_tokens, usage["input_tokens"] + usage["output_tokens"])
+         cost = calculate_actual_cost(model_id, usage["input_tokens"], usage["output_tokens"])
+         run_in_background(settle_spend(reservation, cost))
+         if progress is not None:
+            progress["cost"] = cost
+         if hedge is not None:
+            entry = cost_log_entry(model_id, usage, cost, plan.routing_reason)
+            log_request({**entry, "task_type": request.task_type, "tenant": tenant, "hedge": "cancelled"})
+
+      def settle_for_followers(task: asyncio.Task) -> None:
+         # This request is gone, but the call went on for its followers: bill it when it ends
+         if task.cancelled():
+            settle_cancelled()
+         elif task.exception() is not None:
+            rate_limiter.settle(model_id, plan.reserved_tokens, 0)
+            run_in_background(settle_spend(reservation, 0.0))
+         else:
+            usage = task.result()
+            rate_limiter.settle(model_id, plan.reserved_tokens, usage["input_tokens"] + usage["output_tokens"])
+            store_cache(request, plan, usage)
+            cost = calculate_actual_cost(model_id, usage["input_tokens"], usage["output_tokens"])
+            run_in_background(settle_spend(reservation, cost))
+            metrics.observe_call(model_id, usage["input_tokens"], usage["output_tokens"], plan.cost_est, cost)
+            entry = cost_log_entry(model_id, usage, cost, plan.routing_reason)
+            log_request({
+               **entry,
+               "task_type": request.task_type,
+               "max_tokens": plan.output_tokens_est,
+               **plan.estimates(),
+               "tenant": tenant,
+            })
+
+      if hedge is not None:
+         progress = {} if progress is None else progress
+         flight = single_flight.start(flight_key, lambda: collect_stream(request.prompt, plan, progress))
+      else:
+         flight = single_flight.start(
+            flight_key, lambda: call_llm(model_id, request.prompt, max_tokens=plan.output_tokens_est)
+         )
+      start = time.perf_counter()
+      try:
+         llm_response = await flight.wait()
+      except RuntimeError as e:
+         rate_limiter.release(model_id, plan.reserved_tokens)
+         await settle_spend(reservation, 0.0)
+         raise HTTPException(status_code=500, detail=str(e))
+      except asyncio.CancelledError:
+         # E.g. the losing call of a hedged request; the call was cancelled
+         # too unless an identical request is still waiting for it
+         if flight.waiters == 0 and not flight.task.done():
+            settle_cancelled()
+         else:
+            flight.task.add_done_callback(settle_for_followers)
+         raise
+      except Exception as e:
+         rate_limiter.settle(model_id, plan.reserved_tokens, 0)
+         await settle_spend(reservation, 0.0)
+         raise upstream_error(e)
+      metrics.observe_stage("llm_call", start)
+      rate_limiter.settle(model_id, plan.reserved_tokens, llm_response["input_tokens"] + llm_response["output_tokens"])
+      store_cache(request, plan, llm_response)
 
    # Step 4: Calculate actual cost using the real token counts from the API response
    actual_cost = calculate_actual_cost(model_id, llm_response["input_tokens"], llm_response["output_tokens"])
+   await settle_spend(reservation, actual_cost)
 
    # Step 5: Log the request so /stats can aggregate it later
-   log_request({
-      "model": model_id,
-      "input_tokens": llm_response["input_tokens"],
-      "output_tokens": llm_response["output_tokens"],
-      "actual_cost": actual_cost,
-      "routing_reason": routing_reason,
-   })
+   entry = cost_log_entry(model_id, llm_response, actual_cost, plan.routing_reason, cached, coalesced)
+   entry["task_type"] = request.task_type
+   entry["max_tokens"] = plan.output_tokens_est
+   entry.update(plan.estimates())
+   entry["tenant"] = tenant
+   if similarity is not None:
+      entry["semantic_similarity"] = round(similarity, 4)
+   if hedge is not None:
+      entry["hedge"] = hedge
+   start = time.perf_counter()
+   log_request(entry)
+   metrics.observe_stage("log_request", start)
+   record_metrics(plan, llm_response, actual_cost, similarity, cached, coalesced)
+   if cached or coalesced:
+      actual_cost = 0.0
 
    # Step 6: Build and return the response
    return RouteResponse(
       model=model_id,
       response=llm_response["content"],
-      estimated_cost=cost_est,
+      estimated_cost=plan.cost_est,
       actual_cost=actual_cost,
       tokens_used=llm_response["input_tokens"] + llm_response["output_tokens"],
-      routing_reason=routing_reason,
+      routing_reason=plan.routing_reason,
+      cached=cached,
+      coalesced=coalesced,
+   )
+
+
+async def collect_stream(prompt: str, plan: RoutePlan, progress: dict) -> dict:
+   """Call the LLM like call_llm, but stream the answer and record it in progress as it arrives.
+
+   Used for hedged calls: if one is cancelled, progress tells what it has
+   generated (and cost) so far.
+
+   Returns:
+      The same fields as call_llm; our own estimates if the server reported no usage.
+   """
+   chunks = progress["chunks"] = []
+   progress["usage"] = None
+   start = time.perf_counter()
+   async for item in stream_llm(plan.model_id, prompt, max_tokens=plan.output_tokens_est):
+      if "content" in item:
+         chunks.append(item["content"])
+      else:
+         progress["usage"] = item
+   usage = streamed_usage(plan, chunks, progress["usage"])
+   return {"content": "".join(chunks), **usage, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
+def streamed_usage(plan: RoutePlan, chunks: list[str], usage: dict | None) -> dict:
+   """Return the token usage of a (possibly unfinished) stream.
+
+   The server's usage if it reported one, otherwise the estimated input
+   tokens and the estimated tokens of the chunks received so far.
+   """
+   if usage is not None:
+      return usage
+   return {"input_tokens": plan.input_tokens_est, "output_tokens": estimate_tokens("".join(chunks))}
+
+
+def upstream_error(e: Exception) -> HTTPException:
+   """Map an exception from the LLM call to the HTTP error we return."""
+   if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429:
+      return HTTPException(status_code=429, detail=f"Model rate limited: {str(e)}")
+   if isinstance(e, CircuitOpenError):
+      return HTTPException(status_code=503, detail=str(e))
+   return HTTPException(status_code=502, detail=f"Error calling LLM: {str(e)}")
+
+
+@app.post("/route/batch", response_model=BatchRouteResponse)
+async def route_batch(batch: BatchRouteRequest, tenant: str = Depends(get_tenant)):
+   """Route many prompts in one call.
+
+   Models are selected for the whole batch at once, then the LLM calls run
+   concurrently — at most BATCH_MAX_CONCURRENCY in total and
+   BATCH_MAX_CONCURRENCY_PER_MODEL per model. Results come back in request
+   order; a failing item gets an error instead of failing the whole batch.
+   If the batch has a budget and the sum of the items' estimated costs
+   exceeds it, the whole batch is rejected with 400 before any call is made.
+
+   Rate limit capacity is reserved per item only once it holds its
+   concurrency slots, right before the call. An item whose model is
+   saturated waits for capacity (up to BATCH_RATE_LIMIT_WAIT_SECONDS)
+   instead of failing, so batches larger than the models' per-minute limits
+   are spread over time rather than answered with 429s.
+   """
+   requests, compressions = zip(*map(compress_request, batch.requests))
+   await count_tokens_in_thread([request.prompt for request in requests])
+   analyses = [analyze_prompt(request.prompt) for request in requests]
+   selections = select_models(
+      [(r.prompt, r.task_type, r.budget, r.quality) for r in requests], analyses=analyses
    )
 
+   # Plan every item, then enforce the batch budget on the sum of the estimated costs
+   plans: list[RoutePlan | HTTPException] = []
+   for request, analysis, selection in zip(requests, analyses, selections):
+      try:
+         if isinstance(selection, ValueError):
+            raise HTTPException(status_code=400, detail=str(selection))
+         plans.append(plan_route(request, analysis, first_choice=selection, reserve=False))
+      except HTTPException as e:
+         plans.append(e)
+   total_estimated_cost = round(sum(plan.cost_est for plan in plans if not isinstance(plan, HTTPException)), 8)
+   if batch.budget is not None and total_estimated_cost > batch.budget:
+      raise HTTPException(
+         status_code=400,
+         detail=f"Estimated batch cost ${total_estimated_cost} exceeds the batch budget ${batch.budget}.",
+      )
+
+   overall_limit = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+   model_limits = {
+      plan.model_id: asyncio.Semaphore(BATCH_MAX_CONCURRENCY_PER_MODEL)
+      for plan in plans if not isinstance(plan, HTTPException)
+   }
+
+   async def run(index: int, request: RouteRequest, plan: RoutePlan | HTTPException) -> BatchItemResult:
+      try:
+         if isinstance(plan, HTTPException):
+            raise plan
+         async with overall_limit, model_limits[plan.model_id]:
+            if not await rate_limiter.acquire(plan.model_id, plan.reserved_tokens, BATCH_RATE_LIMIT_WAIT_SECONDS):
+               raise HTTPException(
+                  status_code=429,
+                  detail=f"Model {plan.model_id} stayed rate limited for {BATCH_RATE_LIMIT_WAIT_SECONDS:g} s.",
+               )
+            result = await execute(request, plan, tenant)
+         if compressions[index] is not None:
+            result.compression = compression_info(compressions[index], result.model)
+         return BatchItemResult(index=index, status_code=200, result=result)
+      except HTTPException as e:
+         return BatchItemResult(index=index, status_code=e.status_code, error=e.detail)
+
+   results = await asyncio.gather(*(run(i, r, p) for i, (r, p) in enumerate(zip(requests, plans))))
+
+   return BatchRouteResponse(
+      results=results,
+      total_estimated_cost=total_estimated_cost,
+      total_actual_cost=round(sum(item.result.actual_cost for item in results if item.result), 8),
+   )
+
+
+def sse_event(event: str, data: dict) -> str:
+   """Format one Server-Sent Event."""
+   return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/route/stream")
+async def route_stream(request: RouteRequest, tenant: str = Depends(get_tenant)):
+   """Like /route, but forwards the answer as Server-Sent Events while it is generated.
+
+   Events, in order:
+   - "route": the chosen model, routing reason and estimated cost
+   - "token": {"content": "..."} for every chunk of the answer
+   - "done":  token usage, actual cost and estimated cost (same fields as /route)
+   - "error": {"detail": "..."} if the upstream call fails mid-stream
+   """
+   request, compression = compress_request(request)
+   await count_tokens_in_thread([request.prompt])
+   plan = plan_route(request)
+   model_id = plan.model_id
+
+   # Fail with a normal HTTP error (not mid-stream) if the API key is missing
+   try:
+      get_headers(model_id)
+   except RuntimeError as e:
+      rate_limiter.release(model_id, plan.reserved_tokens)
+      raise HTTPException(status_code=500, detail=str(e))
+
+   start = time.perf_counter()
+   try:
+      cached_response, similarity = await lookup_cache(request, plan)
+   except asyncio.CancelledError:
+      rate_limiter.release(model_id, plan.reserved_tokens)
+      raise
+   metrics.observe_stage("cache_lookup", start)
+   # Reserve the estimate up front, so a spend cap is a normal HTTP error too
+   reservation = None
+   if cached_response is None:
+      try:
+         reservation = await reserve_spend(tenant, plan)
+      except (HTTPException, asyncio.CancelledError):
+         rate_limiter.release(model_id, plan.reserved_tokens)
+         raise
+
+   cached = cached_response is not None
+
+   def settle_stream(usage: dict, cancelled: bool = False) -> float:
+      """Settle the reservations with the usage of the stream, log it and return its cost."""
+      if not cached:
+         rate_limiter.settle(model_id, plan.reserved_tokens, usage["input_tokens"] + usage["output_tokens"])
+      actual_cost = calculate_actual_cost(model_id, usage["input_tokens"], usage["output_tokens"])
+      # In the background: a disconnected stream cannot await anything any more
+      run_in_background(settle_spend(reservation, actual_cost))
+      entry = cost_log_entry(model_id, usage, actual_cost, plan.routing_reason, cached)
+      if similarity is not None:
+         entry["semantic_similarity"] = round(similarity, 4)
+      if cancelled:
+         entry["cancelled"] = True
+      start = time.perf_counter()
+      log_request({
+         **entry,
+         "task_type": request.task_type,
+         "max_tokens": plan.output_tokens_est,
+         **plan.estimates(),
+         "tenant": tenant,
+         "stream": True,
+      })
+      metrics.observe_stage("log_request", start)
+      record_metrics(plan, usage, actual_cost, similarity, cached)
+      return actual_cost
+
+   async def events():
+      chunks = []
+      usage = None
+      sent = settled = False
+      if cached:
+         rate_limiter.release(model_id, plan.reserved_tokens)
+         usage = cached_response
+      try:
+         yield sse_event("route", {
+            "model": model_id,
+            "routing_reason": plan.routing_reason,
+            "estimated_cost": plan.cost_est,
+         })
+
+         if cached:
+            # Cache hit: send the stored answer as a single chunk
+            yield sse_event("token", {"content": cached_response["content"]})
+         else:
+            start = time.perf_counter()
+            sent = True
+            try:
+               async for item in stream_llm(model_id, request.prompt, max_tokens=plan.output_tokens_est):
+                  if "content" in item:
+                     chunks.append(item["content"])
+                     yield sse_event("token", item)
+                  else:
+                     usage = item
+            except Exception as e:
+               settled = True
+               rate_limiter.settle(model_id, plan.reserved_tokens, 0)
+               await settle_spend(reservation, 0.0)
+               yield sse_event("error", {"detail": upstream_error(e).detail})
+               return
+
+            # Fall back to our own estimates if the server didn't report usage
+            usage = streamed_usage(plan, chunks, usage)
+            usage["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            store_cache(request, plan, {"content": "".join(chunks), **usage})
+
+         settled = True
+         actual_cost = settle_stream(usage)
+      finally:
+         if settled:
+            pass                 # completed, or failed upstream and settled above
+         elif cached or sent:
+            # The client disconnected (CancelledError or GeneratorExit): the
+            # provider still bills the prompt and what was generated so far
+            settle_stream(streamed_usage(plan, chunks, usage), cancelled=True)
+         else:
+            # Gone before the LLM call started
+            rate_limiter.release(model_id, plan.reserved_tokens)
+            run_in_background(settle_spend(reservation, 0.0))
+
+      done = {
+         "model": model_id,
+         "estimated_cost": plan.cost_est,
+         "actual_cost": 0.0 if cached else actual_cost,
+         "tokens_used": usage["input_tokens"] + usage["output_tokens"],
+         "routing_reason": plan.routing_reason,
+         "cached": cached,
+      }
+      if compression is not None:
+         done["compression"] = compression_info(compression, model_id).model_dump()
+      yield sse_event("done", done)
+
+   return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+   """Return request, stage, upstream, cost, token and cache metrics of all workers for Prometheus."""
+   return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 
 @app.get("/stats", response_model=StatsResponse)
-async def stats():
-   """Return aggregated usage statistics (total requests, costs, model usage)."""
-   return StatsResponse(**get_stats())
+async def stats(
+   from_ms: int | None = Query(default=None, alias="from", description="Series start, ms since the epoch"),
+   to_ms: int | None = Query(default=None, alias="to", description="Series end, ms since the epoch (default: now)"),
+   bucket: str = Query(default="hour", pattern="^(minute|hour)$"),
+):
+   """Return aggregated usage statistics (total requests, costs, model usage, latency).
+
+   With `from` (and optionally `to`), the response also contains `series`:
+   per-model requests, tokens, cost and latency per minute or hour bucket,
+   read from pre-aggregated rollups.
+   """
+   series = None
+   if from_ms is not None:
+      if to_ms is None:
+         to_ms = int(time.time() * 1000)
+      if to_ms <= from_ms:
+         raise HTTPException(status_code=400, detail="'to' must be after 'from'.")
+      series = get_series(from_ms, to_ms, bucket)
+   return StatsResponse(
+      **get_stats(),
+      latency=latency_tracker.snapshot(),
+      circuit_breakers=circuit_breaker.snapshot(),
+      series=series,
+   )
+
+
+
+@app.get("/accuracy", response_model=AccuracyResponse)
+async def accuracy():
+   """Return how far the token and cost estimates are off, per model and task type.
+
+   Input token estimates drift when their p90 relative error exceeds
+   ACCURACY_DRIFT_THRESHOLD; output token and cost estimates, which are
+   deliberately high, when they were exceeded in more than
+   ACCURACY_EXCEEDED_THRESHOLD of the calls (see backend.estimate_accuracy).
+   """
+   estimates = get_estimate_accuracy()
+   return AccuracyResponse(
+      drift_threshold=ACCURACY_DRIFT_THRESHOLD,
+      exceeded_threshold=ACCURACY_EXCEEDED_THRESHOLD,
+      min_samples=ACCURACY_MIN_SAMPLES,
+      drifting=sum(item["drift"] for item in estimates),
+      estimates=estimates,
+   )
+
+
+@app.get("/spend", response_model=SpendResponse)
+async def spend(tenant: str = Depends(get_tenant)):
+   """Return the calling tenant's spend, open reservations and caps for today and this month (UTC).
+
+   Spend is only recorded while a cap applies to the tenant.
+   """
+   ledger = get_ledger()
+   if ledger is None:
+      raise HTTPException(status_code=404, detail="Spend tracking is off (SPEND_LEDGER=off).")
+   return SpendResponse(tenant=tenant, **await asyncio.to_thread(ledger.usage, tenant))
+
+# Columns of the CSV export; all other fields of an entry go into "extra" as JSON
+EXPORT_CSV_COLUMNS = (
+   "timestamp",
+   "model",
+   "input_tokens",
+   "output_tokens",
+   "actual_cost",
+   "cache_hit",
+   "latency_ms",
+   "routing_reason",
+)
+
+
+@app.get("/logs/export")
+async def export_logs(
+   format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+   from_ms: int | None = Query(default=None, alias="from", description="Only entries at or after this time, ms since the epoch"),
+   to_ms: int | None = Query(default=None, alias="to", description="Only entries before this time, ms since the epoch"),
+   model: str | None = Query(default=None, description="Only entries for this model ID"),
+   min_cost: float | None = Query(default=None, ge=0, description="Only entries with at least this actual cost (USD)"),
+   cursor: str | None = Query(default=None, description="Continue after the entry with this cursor"),
+   limit: int | None = Query(default=None, ge=1, description="Maximum number of entries"),
+):
+   """Stream the matching request log entries, oldest first.
+
+   Entries are read and written one at a time, so the export runs in
+   constant memory however large the log is. Every entry carries a cursor
+   (`_cursor` in NDJSON, the `cursor` column in CSV); pass the last one back
+   as `cursor` to fetch the next page.
+   """
+   start = datetime.fromtimestamp(from_ms / 1000, timezone.utc) if from_ms is not None else None
+   end = datetime.fromtimestamp(to_ms / 1000, timezone.utc) if to_ms is not None else None
+   records = iter_log_records(start, end, model, min_cost, cursor)
+   # Read up to the first match before responding, so a bad cursor is a 400
+   try:
+      first = await asyncio.to_thread(next, records, None)
+   except ValueError as e:
+      raise HTTPException(status_code=400, detail=str(e))
+   records = chain([first], records) if first is not None else iter(())
+   if limit is not None:
+      records = islice(records, limit)
+
+   # Plain generators: Starlette iterates them in a worker thread
+   if format == "csv":
+      return StreamingResponse(export_csv(records), media_type="text/csv")
+   return StreamingResponse(export_ndjson(records), media_type="application/x-ndjson")
+
+
+def export_ndjson(records):
+   """Format (cursor, entry) pairs as NDJSON lines."""
+   for record_cursor, entry in records:
+      yield json.dumps({**entry, "_cursor": record_cursor}) + "\n"
+
+
+def export_csv(records):
+   """Format (cursor, entry) pairs as CSV rows with a header row."""
+   buffer = io.StringIO()
+   writer = csv.writer(buffer)
+
+   def flush() -> str:
+      row = buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+      return row
+
+   writer.writerow(("cursor", *EXPORT_CSV_COLUMNS, "extra"))
+   yield flush()
+   for record_cursor, entry in records:
+      extra = {key: value for key, value in entry.items() if key not in EXPORT_CSV_COLUMNS}
+      writer.writerow((
+         record_cursor,
+         *(entry.get(column, "") for column in EXPORT_CSV_COLUMNS),
+         json.dumps(extra) if extra else "",
+      ))
+      yield flush()
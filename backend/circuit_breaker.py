@@ -0,0 +1,136 @@
+"""Circuit breaker per model, fed by llm_client and used by routing.
+
+A model's breaker opens after BREAKER_FAILURE_THRESHOLD failed calls within
+BREAKER_WINDOW_SECONDS. Failures are server errors (5xx) and connection
+problems; 429s are the rate limiter's business and client errors (4xx) say
+nothing about the model's health. While the breaker is open, routing skips
+the model and llm_client refuses to call it. After BREAKER_OPEN_SECONDS it
+is half-open: one trial call is let through, which closes the breaker if it
+succeeds and opens it again if it fails.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+# Failed calls within the window that open a model's breaker
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "60"))
+# How long an open breaker stays open before a trial call is allowed
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+
+class CircuitOpenError(Exception):
+    """Raised by llm_client when a model's breaker is open.
+
+    Attributes:
+        model_id: The model.
+    """
+
+    def __init__(self, model_id: str):
+        super().__init__(f"Model {model_id!r} is temporarily unavailable (circuit open).")
+        self.model_id = model_id
+
+
+class ModelBreaker:
+    """Breaker state of one model: "closed", "open" or "half_open"."""
+
+    def __init__(self):
+        self.state = "closed"
+        self.failures: deque[float] = deque()   # times of recent failures
+        self.opened_at = 0.0
+        self.trial_started = 0.0                # when the half-open trial call started
+        self.opens = 0                          # how often the breaker opened
+
+    def open(self, now: float) -> None:
+        self.state = "open"
+        self.opened_at = now
+        self.opens += 1
+        self.failures.clear()
+
+    def unavailable(self, now: float) -> bool:
+        """True while calls are refused: open, or half-open with a trial in flight.
+
+        A trial that never reports back (e.g. a cancelled hedge call) expires
+        after BREAKER_OPEN_SECONDS.
+        """
+        if self.state == "open":
+            return now < self.opened_at + BREAKER_OPEN_SECONDS
+        if self.state == "half_open":
+            return now < self.trial_started + BREAKER_OPEN_SECONDS
+        return False
+
+
+_lock = threading.Lock()
+_breakers: dict[str, ModelBreaker] = {}
+
+
+def allow(model_id: str) -> bool:
+    """Return whether a call to a model may go ahead.
+
+    If the breaker is due for a trial call, this call becomes the trial.
+    """
+    with _lock:
+        breaker = _breakers.get(model_id)
+        if breaker is None or breaker.state == "closed":
+            return True
+        now = time.monotonic()
+        if breaker.unavailable(now):
+            return False
+        breaker.state = "half_open"
+        breaker.trial_started = now
+        return True
+
+
+def record_success(model_id: str) -> None:
+    """Record a successful call (closes a half-open breaker)."""
+    with _lock:
+        breaker = _breakers.get(model_id)
+        if breaker is not None:
+            breaker.state = "closed"
+            breaker.failures.clear()
+
+
+def record_failure(model_id: str) -> None:
+    """Record a failed call; opens the breaker at the threshold or after a failed trial."""
+    now = time.monotonic()
+    with _lock:
+        if model_id not in _breakers:
+            _breakers[model_id] = ModelBreaker()
+        breaker = _breakers[model_id]
+        if breaker.state == "half_open":
+            breaker.open(now)
+            return
+        if breaker.state == "open":
+            return
+        breaker.failures.append(now)
+        while breaker.failures[0] < now - BREAKER_WINDOW_SECONDS:
+            breaker.failures.popleft()
+        if len(breaker.failures) >= BREAKER_FAILURE_THRESHOLD:
+            breaker.open(now)
+
+
+def unavailable_models() -> set[str]:
+    """Return the models routing should skip right now."""
+    now = time.monotonic()
+    with _lock:
+        return {model_id for model_id, breaker in _breakers.items() if breaker.unavailable(now)}
+
+
+def snapshot() -> dict[str, dict]:
+    """Return the breaker state of every model that has failed so far (for /stats)."""
+    now = time.monotonic()
+    with _lock:
+        result = {}
+        for model_id, breaker in _breakers.items():
+            while breaker.failures and breaker.failures[0] < now - BREAKER_WINDOW_SECONDS:
+                breaker.failures.popleft()
+            retry_in = breaker.opened_at + BREAKER_OPEN_SECONDS - now if breaker.state == "open" else 0.0
+            result[model_id] = {
+                "state": breaker.state,
+                "recent_failures": len(breaker.failures),
+                "opens": breaker.opens,
+                "retry_in_s": round(max(0.0, retry_in), 1),
+            }
+        return result
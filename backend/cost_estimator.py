@@ -1,6 +1,91 @@
-"""Token estimation and cost calculation utilities."""
+"""Token estimation and cost calculation utilities.
 
-from backend.model_config import MODELS
+Input tokens are counted exactly with the model's tokenizer when its
+vocabulary is available (see backend.tokenizer); otherwise, and for output
+text, a fast character heuristic estimates them. Output tokens are predicted
+from the input with a per (model, task type) ratio learned from the request
+log (see backend.output_calibrator), or a static multiplier until enough
+calls were logged.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+
+from backend import model_config, tokenizer
+from backend.logging_service import get_output_ratios
+
+# Characters that indicate code in a prompt
+CODE_CHARS = "{}();=<>[]"
+
+# Number of recently analysed prompts kept in the LRU cache (0 disables it)
+PROMPT_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class PromptAnalysis:
+    """Features of a prompt, computed once and shared by the routing pipeline.
+
+    Attributes:
+        length: Number of characters.
+        code_chars: Number of code indicator characters (see CODE_CHARS).
+        whitespace_chars: Number of whitespace characters.
+        word_count: Number of whitespace-separated words.
+        tokens: Estimated input token count (minimum 1).
+    """
+    length: int
+    code_chars: int
+    whitespace_chars: int
+    word_count: int
+    tokens: int
+
+
+def _analyze(text: str) -> PromptAnalysis:
+    """Compute all prompt features with a single split plus C-level counts."""
+    length = len(text)
+    words = text.split()
+    # split() drops exactly the whitespace characters, so everything that
+    # isn't part of a word is whitespace
+    word_chars = sum(map(len, words))
+    whitespace_chars = length - word_chars
+    code_chars = sum(text.count(c) for c in CODE_CHARS)
+
+    if not words:
+        tokens = 1
+    else:
+        code_ratio = code_chars / length
+        whitespace_ratio = whitespace_chars / length
+        avg_word_len = word_chars / len(words)
+
+        if code_ratio > 0.05:
+            chars_per_token = 3.0
+        elif avg_word_len > 7:
+            chars_per_token = 5.0
+        else:
+            chars_per_token = 4.0
+
+        if whitespace_ratio > 0.3:
+            chars_per_token *= 0.9
+
+        tokens = max(1, int(length / chars_per_token))
+
+    return PromptAnalysis(length, code_chars, whitespace_chars, len(words), tokens)
+
+
+_analyze_cached = lru_cache(maxsize=PROMPT_CACHE_SIZE)(_analyze)
+
+
+def analyze_prompt(text: str) -> PromptAnalysis:
+    """Analyse a prompt, reusing the result for recently seen prompts.
+
+    Args:
+        text: The prompt to analyse.
+
+    Returns:
+        PromptAnalysis with character counts and the estimated token count.
+    """
+    if PROMPT_CACHE_SIZE:
+        return _analyze_cached(text)
+    return _analyze(text)
 
 
 def estimate_tokens(text: str) -> int:
@@ -16,30 +101,30 @@ def estimate_tokens(text: str) -> int:
     Returns:
         Estimated token count (minimum 1).
     """
-    if not text.strip():
-        return 1
+    return analyze_prompt(text).tokens
 
-    length = len(text)
 
-    code_indicators = sum(1 for c in text if c in '{}();=<>[]')
-    code_ratio = code_indicators / max(length, 1)
+def count_input_tokens(model_id: str, prompt: str, analysis: PromptAnalysis | None = None) -> int:
+    """Count the input tokens of a prompt for a model.
 
-    whitespace_ratio = sum(1 for c in text if c.isspace()) / max(length, 1)
+    Uses the tokenizer of the model's family ("tokenizer" in MODELS) if its
+    vocabulary is available, otherwise the heuristic estimate.
 
-    words = text.split()
-    avg_word_len = sum(len(w) for w in words) / max(len(words), 1)
-
-    if code_ratio > 0.05:
-        chars_per_token = 3.0
-    elif avg_word_len > 7:
-        chars_per_token = 5.0
-    else:
-        chars_per_token = 4.0
-
-    if whitespace_ratio > 0.3:
-        chars_per_token *= 0.9
+    Args:
+        model_id: The model identifier.
+        prompt: The user prompt.
+        analysis: Precomputed analysis of the prompt, for the heuristic fallback.
 
-    return max(1, int(length / chars_per_token))
+    Returns:
+        Input token count (minimum 1).
+    """
+    family = model_config.MODELS.get(model_id, {}).get("tokenizer")
+    count = tokenizer.count_tokens(family, prompt) if family else None
+    if count is None:
+        if analysis is None:
+            analysis = analyze_prompt(prompt)
+        return analysis.tokens
+    return max(1, count)
 
 
 OUTPUT_MULTIPLIERS = {
@@ -57,21 +142,35 @@ MIN_OUTPUT_TOKENS = {
 }
 
 
-def estimate_output_tokens(input_tokens: int, task_type: str, model_max_tokens: int) -> int:
+def output_multiplier(model_id: str | None, task_type: str) -> float:
+    """Return the expected output/input token ratio of a model for a task type.
+
+    The calibrated quantile from the request log if the model has enough
+    logged calls for the task type, otherwise the static OUTPUT_MULTIPLIERS.
+    """
+    ratio = get_output_ratios(task_type).get(model_id) if model_id is not None else None
+    return OUTPUT_MULTIPLIERS.get(task_type, 1.5) if ratio is None else ratio
+
+
+def estimate_output_tokens(
+    input_tokens: int, task_type: str, model_max_tokens: int, model_id: str | None = None
+) -> int:
     """Estimate output tokens based on task type and input length.
 
-    Uses task-specific multipliers and minimum output floors. Result is
-    capped at the model's max_tokens.
+    Multiplies the input tokens by the output ratio (learned per model, see
+    output_multiplier) and applies a task-specific minimum. Result is capped
+    at the model's max_tokens.
 
     Args:
         input_tokens: Estimated input token count.
         task_type: Task category (e.g. "general", "code", "email", "summarize").
         model_max_tokens: Maximum tokens the model can generate.
+        model_id: The model, to use its calibrated ratio; static multipliers if omitted.
 
     Returns:
         Estimated output token count.
     """
-    multiplier = OUTPUT_MULTIPLIERS.get(task_type, 1.5)
+    multiplier = output_multiplier(model_id, task_type)
     min_output = MIN_OUTPUT_TOKENS.get(task_type, 150)
 
     estimated = max(min_output, int(input_tokens * multiplier))
@@ -92,9 +191,9 @@ def estimate_cost(model_id: str, input_tokens: int, output_tokens: int) -> float
     Returns:
         Estimated cost in USD.
     """
-    model_config = MODELS[model_id]
-    input_cost = input_tokens * model_config["input_price_per_token"]
-    output_cost = output_tokens * model_config["output_price_per_token"]
+    config = model_config.get_model(model_id)
+    input_cost = input_tokens * config["input_price_per_token"]
+    output_cost = output_tokens * config["output_price_per_token"]
     total_cost = input_cost + output_cost
     return round(total_cost, 8)
 
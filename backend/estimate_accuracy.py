@@ -0,0 +1,168 @@
+"""Accuracy of the pre-call estimates, tracked from the request log.
+
+Every call that reached a model is logged with its estimates
+(input_tokens_est, output_tokens_est, estimated_cost) next to the actual
+input_tokens, output_tokens and actual_cost. For every (model, task type)
+this module keeps, per quantity, the streaming distribution of the relative
+error |estimate − actual| / actual — its p50 and p90 as P² estimators (see
+output_calibrator) — plus the mean signed error, which shows whether the
+estimates run high (positive) or low (negative). Like the output
+calibration, the state lives in logging_service's running aggregate.
+
+Drift is decided after at least ACCURACY_MIN_SAMPLES calls, and
+differently for the two kinds of estimates:
+
+- Input tokens are meant to be exact: they drift when their p90 error is
+  above ACCURACY_DRIFT_THRESHOLD.
+- Output tokens, and so the cost, are deliberately high: the estimate is
+  the OUTPUT_QUANTILE (p90) of the output/input ratio, and at least
+  MIN_OUTPUT_TOKENS. Their relative errors are large by design (a 15-token
+  answer to a 150-token reservation is 900% off), so they drift when they
+  run low instead: when the actual value exceeded the estimate in more than
+  ACCURACY_EXCEEDED_THRESHOLD of the calls. A calibrated p90 is exceeded in
+  about 10% of them.
+
+A drifting estimate makes the budget guard reject requests that would have
+been cheap enough, or let expensive ones through. Entering and leaving
+drift is logged as a warning, but only for entries counted as they are
+written: when logging_service rebuilds its aggregate from the log at
+startup, the flags are updated silently, so a restart does not repeat
+every change the log ever saw.
+"""
+
+import logging
+import os
+
+from backend import output_calibrator
+
+# p90 relative error above which input token estimates count as drifting (0.5 = 50%)
+ACCURACY_DRIFT_THRESHOLD = float(os.getenv("ACCURACY_DRIFT_THRESHOLD", "0.5"))
+# Share of calls above their output token / cost estimate from which those count as drifting
+# (default: twice the share a calibrated OUTPUT_QUANTILE lets through)
+ACCURACY_EXCEEDED_THRESHOLD = float(
+    os.getenv("ACCURACY_EXCEEDED_THRESHOLD", str(round(2 * (1 - output_calibrator.OUTPUT_QUANTILE), 4)))
+)
+# Calls a (model, task type) needs before it can be flagged
+ACCURACY_MIN_SAMPLES = int(os.getenv("ACCURACY_MIN_SAMPLES", "20"))
+
+# Quantity → (log field of the estimate, log field of the actual value)
+QUANTITIES = {
+    "input_tokens": ("input_tokens_est", "input_tokens"),
+    "output_tokens": ("output_tokens_est", "output_tokens"),
+    "cost": ("estimated_cost", "actual_cost"),
+}
+# Quantities estimated as upper bounds, which drift when exceeded too often
+UPPER_BOUNDS = ("output_tokens", "cost")
+
+logger = logging.getLogger(__name__)
+
+
+def new_state() -> dict:
+    """Return the error distribution of one quantity before any observation."""
+    return {
+        "n": 0,
+        "error_sum": 0.0,          # sum of signed relative errors, for the mean
+        "exceeded": 0,             # calls whose actual value was above the estimate
+        "p50": output_calibrator.new_state(0.5),
+        "p90": output_calibrator.new_state(0.9),
+        "drifting": False,
+    }
+
+
+def observe(accuracy: dict, entry: dict, replay: bool = False) -> None:
+    """Update the error distributions with one log entry.
+
+    Cache hits and coalesced requests made no call of their own, cancelled
+    calls (hedge losers, streams whose client disconnected) never finished,
+    and entries logged before estimates were recorded have nothing to
+    compare; they are skipped. So is a quantity whose actual
+    value is 0 (no relative error).
+
+    Args:
+        accuracy: model → task type → quantity → state (updated in place).
+        entry: Log entry as written by the API.
+        replay: The entry is recounted from the log; update the drift flags
+            without logging their changes.
+    """
+    model = entry.get("model")
+    task_type = entry.get("task_type")
+    if not model or not task_type or "estimated_cost" not in entry:
+        return
+    if entry.get("cache_hit") or entry.get("coalesced") or entry.get("cancelled") or entry.get("hedge") == "cancelled":
+        return
+    states = accuracy.setdefault(model, {}).setdefault(task_type, {})
+    for quantity, (estimate_field, actual_field) in QUANTITIES.items():
+        estimate, actual = entry.get(estimate_field), entry.get(actual_field)
+        if estimate is None or not actual:
+            continue
+        if quantity not in states:
+            states[quantity] = new_state()
+        state = states[quantity]
+        error = (estimate - actual) / actual
+        state["n"] += 1
+        state["error_sum"] += error
+        state["exceeded"] += actual > estimate
+        output_calibrator.add(state["p50"], abs(error))
+        output_calibrator.add(state["p90"], abs(error))
+        _check_drift(state, model, task_type, quantity, replay)
+
+
+def compatible(accuracy: dict) -> bool:
+    """True if saved state (e.g. from a checkpoint) has every field this version keeps."""
+    keys = new_state().keys()
+    return all(
+        keys <= state.keys() for tasks in accuracy.values() for states in tasks.values() for state in states.values()
+    )
+
+
+def _check_drift(state: dict, model: str, task_type: str, quantity: str, replay: bool) -> None:
+    """Update the drift flag of a quantity and log when it changes (unless replaying)."""
+    if quantity in UPPER_BOUNDS:
+        value, threshold = state["exceeded"] / state["n"], ACCURACY_EXCEEDED_THRESHOLD
+    else:
+        value, threshold = output_calibrator.value(state["p90"]), ACCURACY_DRIFT_THRESHOLD
+    drifting = state["n"] >= ACCURACY_MIN_SAMPLES and value > threshold
+    changed, state["drifting"] = drifting != state["drifting"], drifting
+    if not changed or replay:
+        return
+    if drifting and quantity in UPPER_BOUNDS:
+        logger.warning(
+            "Estimate drift for %s / %s: %s above its estimate in %.0f%% of calls (threshold %.0f%%)",
+            model, task_type, quantity, value * 100, threshold * 100,
+        )
+    elif drifting:
+        logger.warning(
+            "Estimate drift for %s / %s: p90 %s error %.0f%% (threshold %.0f%%)",
+            model, task_type, quantity, value * 100, threshold * 100,
+        )
+    else:
+        logger.info("Estimates for %s / %s %s are back within the threshold", model, task_type, quantity)
+
+
+def summary(accuracy: dict) -> list[dict]:
+    """Return the error distributions as a list for the API, one item per (model, task type).
+
+    Each quantity has samples, p50_error and p90_error (relative, 0.25 =
+    25%), mean_error (signed), exceeded (share of calls above the estimate)
+    and drift.
+    """
+    result = []
+    for model, tasks in sorted(accuracy.items()):
+        for task_type, states in sorted(tasks.items()):
+            quantities = {}
+            for quantity, state in states.items():
+                quantities[quantity] = {
+                    "samples": state["n"],
+                    "p50_error": round(output_calibrator.value(state["p50"]), 4),
+                    "p90_error": round(output_calibrator.value(state["p90"]), 4),
+                    "mean_error": round(state["error_sum"] / state["n"], 4),
+                    "exceeded": round(state["exceeded"] / state["n"], 4),
+                    "drift": state["drifting"],
+                }
+            result.append({
+                "model": model,
+                "task_type": task_type,
+                "drift": any(q["drift"] for q in quantities.values()),
+                **quantities,
+            })
+    return result
@@ -0,0 +1,133 @@
+"""Observed latency per model, fed by llm_client and used by routing.
+
+For every model we keep the wall-clock latency of the last LATENCY_WINDOW
+successful calls from the past LATENCY_MAX_AGE seconds (for p50/p95) plus
+exponentially weighted moving averages (EWMA) of the latency and of the output
+speed in tokens per second. Requests with a latency target (max_latency_ms)
+skip models whose recent p95 is above it.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+# Number of recent calls per model used for the percentiles
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "200"))
+# Weight of the newest sample in the moving averages
+LATENCY_EWMA_ALPHA = float(os.getenv("LATENCY_EWMA_ALPHA", "0.2"))
+# A model needs at least this many samples before it can be excluded
+LATENCY_MIN_SAMPLES = int(os.getenv("LATENCY_MIN_SAMPLES", "5"))
+# Samples older than this (seconds) are dropped, so an excluded model that
+# gets no traffic becomes eligible again
+LATENCY_MAX_AGE = float(os.getenv("LATENCY_MAX_AGE", "300"))
+
+
+class ModelLatency:
+    """Rolling latency statistics for one model."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.times: deque[float] = deque(maxlen=window)   # when each sample was taken
+        self.ewma_ms: float | None = None
+        self.tokens_per_second: float | None = None
+        self._sorted: list[float] | None = None     # cache for percentile()
+
+    def prune(self, now: float) -> None:
+        """Drop samples older than LATENCY_MAX_AGE."""
+        while self.times and self.times[0] < now - LATENCY_MAX_AGE:
+            self.times.popleft()
+            self.samples.popleft()
+            self._sorted = None
+
+    def record(self, latency_ms: float, output_tokens: int) -> None:
+        """Add one successful call."""
+        self.samples.append(latency_ms)
+        self.times.append(time.monotonic())
+        self._sorted = None
+        self.ewma_ms = _ewma(self.ewma_ms, latency_ms)
+        if latency_ms > 0:
+            self.tokens_per_second = _ewma(self.tokens_per_second, output_tokens / (latency_ms / 1000))
+
+    def percentile(self, q: float) -> float | None:
+        """Return the q-th percentile (0–100) of the window, None without samples."""
+        if not self.samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        rank = min(len(self._sorted) - 1, int(q / 100 * len(self._sorted)))
+        return self._sorted[rank]
+
+
+def _ewma(current: float | None, sample: float) -> float:
+    """Blend a new sample into a moving average."""
+    if current is None:
+        return sample
+    return LATENCY_EWMA_ALPHA * sample + (1 - LATENCY_EWMA_ALPHA) * current
+
+
+_lock = threading.Lock()
+_models: dict[str, ModelLatency] = {}
+
+
+def record(model_id: str, latency_ms: float, output_tokens: int) -> None:
+    """Record the latency of a successful call to a model.
+
+    Args:
+        model_id: The model identifier.
+        latency_ms: Wall-clock time of the call in milliseconds.
+        output_tokens: Tokens the model generated.
+    """
+    with _lock:
+        if model_id not in _models:
+            _models[model_id] = ModelLatency()
+        _models[model_id].record(latency_ms, output_tokens)
+
+
+def p95(model_id: str) -> float | None:
+    """Return a model's recent p95 latency in ms (None with too few samples)."""
+    with _lock:
+        stats = _models.get(model_id)
+        if stats is None:
+            return None
+        stats.prune(time.monotonic())
+        if len(stats.samples) < LATENCY_MIN_SAMPLES:
+            return None
+        return stats.percentile(95)
+
+
+def slow_models(max_latency_ms: float) -> set[str]:
+    """Return the models whose recent p95 latency exceeds max_latency_ms.
+
+    Models with fewer than LATENCY_MIN_SAMPLES samples are never reported.
+    """
+    now = time.monotonic()
+    with _lock:
+        slow = set()
+        for model_id, stats in _models.items():
+            stats.prune(now)
+            if len(stats.samples) >= LATENCY_MIN_SAMPLES and stats.percentile(95) > max_latency_ms:
+                slow.add(model_id)
+        return slow
+
+
+def snapshot() -> dict[str, dict]:
+    """Return the current latency statistics per model (for /stats)."""
+    now = time.monotonic()
+    with _lock:
+        for stats in _models.values():
+            stats.prune(now)
+        return {
+            model_id: {
+                "samples": len(stats.samples),
+                "p50_ms": _round(stats.percentile(50)),
+                "p95_ms": _round(stats.percentile(95)),
+                "ewma_ms": _round(stats.ewma_ms),
+                "tokens_per_second": _round(stats.tokens_per_second),
+            }
+            for model_id, stats in _models.items()
+        }
+
+
+def _round(value: float | None) -> float | None:
+    return None if value is None else round(value, 1)
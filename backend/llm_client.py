@@ -1,44 +1,187 @@
-"""LLM API Client — communicates with the Groq API to get AI model responses.
+"""LLM API Client — sends prompts to the model's provider and returns the responses.
 
 Uses async HTTP requests (httpx) because network calls take time.
-While waiting for Groq's response, the server can handle other requests.
+While waiting for the provider's response, the server can handle other requests.
+
+Each model in the catalogue names its provider (Groq, a local llama.cpp or
+vLLM server, ... — see backend.providers). Every provider gets its own
+long-lived, pooled httpx.AsyncClient with the provider's limits and
+timeouts, created on its first call after start_client (run in the FastAPI
+lifespan). It keeps connections open, so only the first request to a
+provider pays for the TCP + TLS handshake.
+
+call_llm waits for the complete answer; stream_llm yields it chunk by chunk
+as the model generates it. Transient failures (429, 5xx, connection errors)
+are retried up to LLM_MAX_RETRIES times with decorrelated jitter, and every
+outcome feeds the model's circuit breaker (see backend.circuit_breaker).
 
 Groq API Docs: https://console.groq.com/docs/api-reference#chat-create
 """
 
+import asyncio
+import importlib.util
+import json
+import logging
 import os
+import random
+import time
+from collections.abc import AsyncIterator
 
 import httpx
 from dotenv import load_dotenv
 
+from backend import circuit_breaker, latency_tracker, metrics, model_config, rate_limiter
+from backend.circuit_breaker import CircuitOpenError
+from backend.providers import (
+    LLM_CONNECT_TIMEOUT,
+    LLM_HTTP2,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_READ_TIMEOUT,
+    Provider,
+    build_provider,
+)
+from backend.rate_limiter import parse_duration
+
 # Load .env file into os.environ so we can read secrets like GROQ_API_KEY
 load_dotenv()
 
-# The Groq API endpoint for chat completions (same format as OpenAI)
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+# Retries of a failed call: max extra attempts, base and cap of the jittered delay in ms
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_MS = float(os.getenv("LLM_RETRY_BASE_MS", "100"))
+LLM_RETRY_MAX_MS = float(os.getenv("LLM_RETRY_MAX_MS", "2000"))
+
+# Upstream responses and connection errors worth another attempt
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+RETRY_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+
+logger = logging.getLogger(__name__)
 
+# True between start_client and close_client; before that every call uses a one-off client
+_started = False
+# Client used for every provider instead of their own (set by start_client, e.g. for tests)
+_shared_client: httpx.AsyncClient | None = None
+# Provider name → (provider, its pooled client)
+_clients: dict[str, tuple[Provider, httpx.AsyncClient]] = {}
+# Clients of providers whose settings changed in a catalogue reload, closed by close_client
+_replaced_clients: list[httpx.AsyncClient] = []
+# Provider name → (catalogue entry, provider built from it)
+_providers: dict[str, tuple[dict, Provider]] = {}
 
-def get_api_key() -> str:
-    """Read the Groq API key from environment variables.
+
+def get_provider(model_id: str) -> tuple[Provider, str]:
+    """Return the provider serving a model and the model name to send to it.
+
+    The provider is rebuilt when its catalogue entry changed.
+
+    Raises:
+        KeyError: If the model or its provider is not in the catalogue.
+    """
+    config = model_config.get_model(model_id)
+    name = config.get("provider", model_config.DEFAULT_PROVIDER)
+    provider_config = model_config.get_catalogue().providers[name]
+    cached = _providers.get(name)
+    if cached is None or cached[0] != provider_config:
+        cached = _providers[name] = (provider_config, build_provider(name, provider_config))
+    return cached[1], config.get("provider_model", model_id)
+
+
+def get_headers(model_id: str) -> dict:
+    """Return the request headers for a model's provider.
 
     Returns:
-        The API key string.
+        Dict with the Content-Type and (if the provider needs one) Authorization headers.
 
     Raises:
-        RuntimeError: If GROQ_API_KEY is not set in the environment.
+        RuntimeError: If the provider's API key variable is not set in the environment.
+    """
+    provider, _ = get_provider(model_id)
+    return provider.headers()
+
+
+def create_client(
+    max_connections: int = LLM_MAX_CONNECTIONS,
+    max_keepalive_connections: int = LLM_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY,
+    http2: bool = LLM_HTTP2,
+    connect_timeout: float = LLM_CONNECT_TIMEOUT,
+    read_timeout: float = LLM_READ_TIMEOUT,
+) -> httpx.AsyncClient:
+    """Build a pooled AsyncClient with the given limits and timeouts.
+
+    Args:
+        max_connections: Max open connections in the pool.
+        max_keepalive_connections: Max idle connections kept open for reuse.
+        keepalive_expiry: Seconds an idle connection is kept open.
+        http2: Use HTTP/2 (needs the optional "h2" package: pip install httpx[http2]).
+        connect_timeout: Seconds to wait for a connection to be established.
+        read_timeout: Seconds to wait for the response.
+
+    Returns:
+        A new httpx.AsyncClient.
     """
-    # Read the API key from environment variables (loaded from .env by dotenv)
-    api_key = os.getenv("GROQ_API_KEY")
-    # Fail early with a clear error if the key is missing
-    if not api_key:
-        raise RuntimeError("GROQ_API_KEY environment variable is not set.")
-    return api_key
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1.")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+
+def start_client(client: httpx.AsyncClient | None = None) -> None:
+    """Enable the pooled clients used by call_llm and stream_llm.
+
+    Args:
+        client: Client to use for every provider (e.g. one pointed at a mock
+            server in tests). If omitted, each provider gets its own pooled
+            client from create_client() on its first call.
+    """
+    global _started, _shared_client
+    _started = True
+    _shared_client = client
+
 
+def _client_for(provider: Provider) -> httpx.AsyncClient | None:
+    """Return the pooled client for a provider (None before start_client)."""
+    if _shared_client is not None or not _started:
+        return _shared_client
+    entry = _clients.get(provider.name)
+    if entry is None or entry[0] is not provider:
+        if entry is not None:
+            _replaced_clients.append(entry[1])
+        entry = _clients[provider.name] = (provider, create_client(**provider.client_settings))
+    return entry[1]
 
-async def call_llm(model_id: str, prompt: str, max_tokens: int = 1024) -> dict:
-    """Send a prompt to the Groq API and return the response.
 
-    The Groq server returns JSON like this:
+async def close_client() -> None:
+    """Close all clients and their open connections."""
+    global _started, _shared_client
+    clients = [client for _, client in _clients.values()] + _replaced_clients
+    if _shared_client is not None:
+        clients.append(_shared_client)
+    _started, _shared_client = False, None
+    _clients.clear()
+    _replaced_clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+async def call_llm(
+    model_id: str,
+    prompt: str,
+    max_tokens: int = 1024,
+    client: httpx.AsyncClient | None = None,
+    provider: Provider | None = None,
+) -> dict:
+    """Send a prompt to the model's provider and return the response.
+
+    The server returns JSON like this (OpenAI chat completions format):
 
         {
           "choices": [
@@ -54,49 +197,257 @@ async def call_llm(model_id: str, prompt: str, max_tokens: int = 1024) -> dict:
           }
         }
 
-    We only keep the 3 fields we need: content, input_tokens, output_tokens.
+    We only keep the 3 fields we need: content, input_tokens, output_tokens
+    (plus the latency we measured ourselves).
 
     Args:
         model_id: The model to use (e.g. "llama-3.3-70b-versatile").
         prompt: The user's message to send to the model.
         max_tokens: Maximum number of tokens the model may generate (default: 1024).
+        client: Client to send the request with. Defaults to the provider's
+            pooled client; without one a temporary client is used for this single call.
+        provider: Provider to call, with model_id as the model name; defaults
+            to the model's provider from the catalogue.
 
     Returns:
-        Dict with "content", "input_tokens", "output_tokens".
+        Dict with "content", "input_tokens", "output_tokens" and the call's
+        wall-clock "latency_ms" (of the successful attempt).
+
+    Raises:
+        RuntimeError: If the provider's API key is not set.
+        CircuitOpenError: If the model's circuit breaker is open.
+        httpx.HTTPError: If the call still fails after the retries.
     """
-    # --- 1. Authentication: get the API key ---
-    api_key = get_api_key()
+    # --- 1. Which API serves the model, and under which name ---
+    if provider is None:
+        provider, model = get_provider(model_id)
+    else:
+        model = model_id
 
-    # --- 2. Headers: metadata sent with every request ---
-    headers = {
-        "Authorization": f"Bearer {api_key}",  # "Bearer" = standard prefix for API tokens
-        "Content-Type": "application/json",     # tells the server we're sending JSON
-    }
+    # --- 2. Authentication and headers (built once per provider, then reused) ---
+    headers = provider.headers()
 
     # --- 3. Payload: the actual data we send (our "letter") ---
-    payload = {
-        "model": model_id,                                      # which AI model to use
-        "messages": [{"role": "user", "content": prompt}],      # chat history (just 1 message)
-        "max_tokens": max_tokens,                                # limit response length
+    payload = provider.payload(model, prompt, max_tokens)
+
+    # --- 4. Send the request and wait for the response (unless the model is known to be down) ---
+    if not circuit_breaker.allow(model_id):
+        raise CircuitOpenError(model_id)
+    client = client if client is not None else _client_for(provider)
+    if client is None:
+        # No pooled clients (e.g. called from a script) — use a one-off client
+        async with create_client(**provider.client_settings) as temp_client:
+            return await _post_with_retries(temp_client, provider, model_id, headers, payload)
+    return await _post_with_retries(client, provider, model_id, headers, payload)
+
+
+async def _post_with_retries(
+    client: httpx.AsyncClient, provider: Provider, model_id: str, headers: dict, payload: dict
+) -> dict:
+    """Run _post, retrying transient failures; reports the outcome to the circuit breaker."""
+    attempt, delay_ms = 0, LLM_RETRY_BASE_MS
+    while True:
+        try:
+            response = await _post(client, provider, model_id, headers, payload)
+        except Exception as e:
+            delay_ms = _retry_delay_ms(model_id, e, attempt, delay_ms)
+            if delay_ms is None:
+                raise
+            logger.info("Retrying %s in %.0f ms after: %s", model_id, delay_ms, e)
+            await asyncio.sleep(delay_ms / 1000)
+            if not circuit_breaker.allow(model_id):
+                raise
+            attempt += 1
+            continue
+        circuit_breaker.record_success(model_id)
+        return response
+
+
+def _retry_delay_ms(model_id: str, error: Exception, attempt: int, previous_ms: float) -> float | None:
+    """Record a failed attempt and decide whether and when to retry it.
+
+    Server errors and connection problems count against the model's circuit
+    breaker. The delay uses decorrelated jitter — random between
+    LLM_RETRY_BASE_MS and three times the previous delay, capped at
+    LLM_RETRY_MAX_MS — but is at least the server's Retry-After. If the
+    server asks to wait longer than LLM_RETRY_MAX_MS, the call is not
+    retried, so the router can fall back to another model instead.
+
+    Returns:
+        Milliseconds to wait before the next attempt, None to give up.
+    """
+    retry_after = None
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        if status_code >= 500:
+            circuit_breaker.record_failure(model_id)
+        if status_code not in RETRY_STATUS_CODES:
+            return None
+        retry_after = parse_duration(error.response.headers.get("retry-after", ""))
+    elif isinstance(error, httpx.TransportError):
+        circuit_breaker.record_failure(model_id)
+        if not isinstance(error, RETRY_TRANSPORT_ERRORS):
+            return None
+    else:
+        return None
+
+    if attempt >= LLM_MAX_RETRIES:
+        return None
+    delay_ms = min(LLM_RETRY_MAX_MS, random.uniform(LLM_RETRY_BASE_MS, previous_ms * 3))
+    if retry_after is not None:
+        if retry_after * 1000 > LLM_RETRY_MAX_MS:
+            return None
+        delay_ms = max(delay_ms, retry_after * 1000)
+    return delay_ms
+
+
+async def _post(client: httpx.AsyncClient, provider: Provider, model_id: str, headers: dict, payload: dict) -> dict:
+    """Send the chat completion request and extract the fields we need."""
+    # "await" = pause here until the response arrives (non-blocking)
+    start = time.perf_counter()
+    try:
+        response = await client.post(provider.chat_url, headers=headers, json=payload)
+    except httpx.TransportError:
+        metrics.UPSTREAM_REQUESTS.inc(model_id, "error")
+        raise
+    latency_ms = (time.perf_counter() - start) * 1000
+    metrics.UPSTREAM_REQUESTS.inc(model_id, str(response.status_code))
+    # Let the rate limiter adapt to the limits the server reports
+    rate_limiter.update_from_headers(model_id, response.status_code, response.headers)
+    # Raise an error if the server returned an error status (401, 500, etc.)
+    response.raise_for_status()
+
+    # --- 5. Parse the JSON response and extract what we need ---
+    data = response.json()
+    content = data["choices"][0]["message"]["content"]   # the AI's answer
+    input_tokens = data["usage"]["prompt_tokens"]        # tokens used for our prompt
+    output_tokens = data["usage"]["completion_tokens"]   # tokens the AI generated
+
+    # Feed the observed latency into latency-aware routing
+    latency_tracker.record(model_id, latency_ms, output_tokens)
+    metrics.UPSTREAM_DURATION.observe(latency_ms / 1000, model_id)
+
+    return {
+        "content": content,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "latency_ms": round(latency_ms, 1),
     }
 
-    # --- 4. Send the request and wait for the response ---
-    # "async with" opens a connection and auto-closes it when done
-    # "timeout=60.0" means: give up after 60 seconds if no response
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        # "await" = pause here until the response arrives (non-blocking)
-        response = await client.post(GROQ_API_URL, headers=headers, json=payload)
-        # Raise an error if the server returned an error status (401, 500, etc.)
-        response.raise_for_status()
-
-        # --- 5. Parse the JSON response and extract what we need ---
-        data = response.json()
-        content = data["choices"][0]["message"]["content"]   # the AI's answer
-        input_tokens = data["usage"]["prompt_tokens"]        # tokens used for our prompt
-        output_tokens = data["usage"]["completion_tokens"]   # tokens the AI generated
-
-        return {
-            "content": content,
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens,
-        }
+
+async def stream_llm(
+    model_id: str,
+    prompt: str,
+    max_tokens: int = 1024,
+    client: httpx.AsyncClient | None = None,
+    provider: Provider | None = None,
+) -> AsyncIterator[dict]:
+    """Send a prompt to the model's provider with streaming and yield the answer piece by piece.
+
+    With "stream": true the server sends Server-Sent Events, one line per chunk:
+
+        data: {"choices": [{"delta": {"content": "The"}}]}
+        data: {"choices": [{"delta": {"content": " answer"}}]}
+        data: {"choices": [], "usage": {"prompt_tokens": 24, "completion_tokens": 87}}
+        data: [DONE]
+
+    The usage is requested via stream_options; where else a provider may
+    report it (Groq: "x_groq.usage") is up to Provider.stream_usage.
+
+    Args:
+        model_id: The model to use (e.g. "llama-3.3-70b-versatile").
+        prompt: The user's message to send to the model.
+        max_tokens: Maximum number of tokens the model may generate (default: 1024).
+        client: Client to send the request with (defaults to the provider's pooled client).
+        provider: Provider to call, with model_id as the model name; defaults
+            to the model's provider from the catalogue.
+
+    Yields:
+        {"content": "..."} for every text chunk, then once
+        {"input_tokens": ..., "output_tokens": ...} if the server reported usage.
+    """
+    if provider is None:
+        provider, model = get_provider(model_id)
+    else:
+        model = model_id
+    headers = provider.headers()
+    payload = provider.payload(model, prompt, max_tokens, stream=True)
+
+    if not circuit_breaker.allow(model_id):
+        raise CircuitOpenError(model_id)
+    client = client if client is not None else _client_for(provider)
+    if client is None:
+        async with create_client(**provider.client_settings) as temp_client:
+            async for item in _stream_with_retries(temp_client, provider, model_id, headers, payload):
+                yield item
+        return
+    async for item in _stream_with_retries(client, provider, model_id, headers, payload):
+        yield item
+
+
+async def _stream_with_retries(
+    client: httpx.AsyncClient, provider: Provider, model_id: str, headers: dict, payload: dict
+) -> AsyncIterator[dict]:
+    """Run _stream, retrying failures that happen before the first chunk."""
+    attempt, delay_ms = 0, LLM_RETRY_BASE_MS
+    while True:
+        started = False
+        try:
+            async for item in _stream(client, provider, model_id, headers, payload):
+                started = True
+                yield item
+        except Exception as e:
+            delay_ms = _retry_delay_ms(model_id, e, attempt, delay_ms)
+            # Part of the answer is already out, so the call cannot be repeated
+            if delay_ms is None or started:
+                raise
+            logger.info("Retrying %s in %.0f ms after: %s", model_id, delay_ms, e)
+            await asyncio.sleep(delay_ms / 1000)
+            if not circuit_breaker.allow(model_id):
+                raise
+            attempt += 1
+            continue
+        circuit_breaker.record_success(model_id)
+        return
+
+
+async def _stream(
+    client: httpx.AsyncClient, provider: Provider, model_id: str, headers: dict, payload: dict
+) -> AsyncIterator[dict]:
+    """Send the streaming request and translate SSE chunks into dicts."""
+    start = time.perf_counter()
+    output_tokens = 0
+    status_code = None
+    try:
+        async with client.stream("POST", provider.chat_url, headers=headers, json=payload) as response:
+            status_code = response.status_code
+            metrics.UPSTREAM_REQUESTS.inc(model_id, str(status_code))
+            rate_limiter.update_from_headers(model_id, status_code, response.headers)
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                # Only "data:" lines carry chunks; blank lines separate events
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+
+                for choice in chunk.get("choices", []):
+                    content = choice.get("delta", {}).get("content")
+                    if content:
+                        output_tokens += 1      # roughly one token per chunk until usage arrives
+                        yield {"content": content}
+
+                usage = provider.stream_usage(chunk)
+                if usage:
+                    output_tokens = usage["completion_tokens"]
+                    yield {"input_tokens": usage["prompt_tokens"], "output_tokens": usage["completion_tokens"]}
+    except httpx.TransportError:
+        if status_code is None:
+            metrics.UPSTREAM_REQUESTS.inc(model_id, "error")
+        raise
+
+    latency_ms = (time.perf_counter() - start) * 1000
+    latency_tracker.record(model_id, latency_ms, output_tokens)
+    metrics.UPSTREAM_DURATION.observe(latency_ms / 1000, model_id)
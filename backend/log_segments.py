@@ -0,0 +1,300 @@
+"""Columnar storage for closed request log segments.
+
+logging_service writes new entries to a JSONL file and rotates it into a
+segments directory once it covers a full time bucket or grows too large. A
+rotated file is then compacted into a compressed numpy .npz archive with one
+array per column:
+
+- timestamp: int64 microseconds since the epoch (UTC)
+- model: int32 index into the `models` array (-1 = entry has no model)
+- input_tokens / output_tokens: int64 (-1 = field missing)
+- actual_cost: float64 (NaN = field missing)
+- extra / extra_offsets: every other field as JSON, concatenated into one
+  byte array; row i is extra[extra_offsets[i]:extra_offsets[i + 1]]
+
+A manifest.json in the segments directory records the row count, the
+min/max timestamp and the models of every compacted segment, so filtered
+reads only open the segments that can contain matching entries.
+"""
+
+import json
+import os
+from collections.abc import Iterator
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+MANIFEST_NAME = "manifest.json"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_micros(value: str | datetime) -> int:
+    """Convert an ISO timestamp or datetime to microseconds since the epoch.
+
+    Naive values are taken as UTC.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros: int) -> str:
+    """Convert microseconds since the epoch back to an ISO timestamp (UTC)."""
+    return (_EPOCH + timedelta(microseconds=int(micros))).isoformat()
+
+
+def _is_count(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def compact(source: Path, target: Path) -> dict:
+    """Compact a JSONL segment into a columnar .npz file.
+
+    Args:
+        source: Closed JSONL segment.
+        target: Path of the .npz file to write (replaced atomically).
+
+    Returns:
+        Manifest record with "rows", "min_timestamp", "max_timestamp"
+        (None for an empty segment) and "models".
+
+    Raises:
+        FileNotFoundError: If source is gone (compacted by another process).
+    """
+    timestamps, model_codes, input_tokens, output_tokens, costs = [], [], [], [], []
+    models: dict[str, int] = {}
+    extra = bytearray()
+    extra_offsets = [0]
+
+    with source.open("rb") as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break                    # incomplete last line
+            line = raw.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+
+            rest = dict(entry)
+            try:
+                timestamps.append(to_micros(rest.pop("timestamp")))
+            except (KeyError, TypeError, ValueError):
+                # Keep an unusable timestamp verbatim in the extra fields
+                timestamps.append(0)
+                if "timestamp" in entry:
+                    rest["timestamp"] = entry["timestamp"]
+            model = rest.get("model")
+            if isinstance(model, str):
+                model_codes.append(models.setdefault(rest.pop("model"), len(models)))
+            else:
+                model_codes.append(-1)
+            for column, key in ((input_tokens, "input_tokens"), (output_tokens, "output_tokens")):
+                column.append(rest.pop(key) if _is_count(rest.get(key)) else -1)
+            costs.append(float(rest.pop("actual_cost")) if _is_number(rest.get("actual_cost")) else np.nan)
+
+            if rest:
+                extra += json.dumps(rest).encode()
+            extra_offsets.append(len(extra))
+
+    columns = {
+        "timestamp": np.array(timestamps, dtype=np.int64),
+        "model": np.array(model_codes, dtype=np.int32),
+        "models": np.array(list(models), dtype=np.str_),
+        "input_tokens": np.array(input_tokens, dtype=np.int64),
+        "output_tokens": np.array(output_tokens, dtype=np.int64),
+        "actual_cost": np.array(costs, dtype=np.float64),
+        "extra": np.frombuffer(bytes(extra), dtype=np.uint8),
+        "extra_offsets": np.array(extra_offsets, dtype=np.int64),
+    }
+    # Unique temporary name, in case another process compacts the same segment
+    tmp = target.with_suffix(f".{os.getpid()}.tmp")
+    with tmp.open("wb") as f:
+        np.savez_compressed(f, **columns)
+    os.replace(tmp, target)
+    return _record(columns["timestamp"], list(models))
+
+
+def _record(timestamps: np.ndarray, models: list[str]) -> dict:
+    """Build the manifest record for a segment from its columns."""
+    if timestamps.size == 0:
+        return {"rows": 0, "min_timestamp": None, "max_timestamp": None, "models": []}
+    return {
+        "rows": int(timestamps.size),
+        "min_timestamp": from_micros(timestamps.min()),
+        "max_timestamp": from_micros(timestamps.max()),
+        "models": sorted(models),
+    }
+
+
+def iter_segment(
+    path: Path,
+    start: int | None = None,
+    end: int | None = None,
+    model: str | None = None,
+    min_cost: float | None = None,
+    row: int = 0,
+    offset: int = 0,
+) -> Iterator[tuple[int, int, dict]]:
+    """Yield the matching entries of a segment in write order, with their position.
+
+    Args:
+        path: A compacted .npz segment or a .jsonl file (a segment waiting
+            for compaction, or the current log file).
+        start: Only entries at or after this time (microseconds since the epoch).
+        end: Only entries before this time (microseconds since the epoch).
+        model: Only entries for this model ID.
+        min_cost: Only entries whose actual_cost is at least this much.
+        row: Index of the first entry to consider.
+        offset: For .jsonl files, the byte offset at which entry `row`
+            starts (0 = unknown, skip `row` entries from the start instead).
+
+    Yields:
+        (row, offset, entry): the position right after the entry — the
+        `row` and `offset` to pass to continue behind it (offset is always 0
+        for .npz segments) — and the entry itself.
+    """
+    if path.suffix == ".jsonl":
+        yield from _iter_jsonl(path, start, end, model, min_cost, row, offset)
+        return
+
+    with np.load(path) as data:
+        timestamps = data["timestamp"]
+        models = data["models"].tolist()
+        model_codes = data["model"]
+        costs = data["actual_cost"]
+        selected = np.zeros(timestamps.size, dtype=bool)
+        selected[row:] = True
+        if start is not None:
+            selected &= timestamps >= start
+        if end is not None:
+            selected &= timestamps < end
+        if model is not None:
+            selected &= model_codes == (models.index(model) if model in models else -2)
+        if min_cost is not None:
+            selected &= costs >= min_cost      # NaN (no cost) never matches
+        rows = np.flatnonzero(selected)
+        if rows.size == 0:
+            return
+        input_tokens = data["input_tokens"]
+        output_tokens = data["output_tokens"]
+        extra = data["extra"].tobytes()
+        extra_offsets = data["extra_offsets"]
+
+    for i in rows.tolist():
+        entry = {"timestamp": from_micros(timestamps[i])}
+        if model_codes[i] >= 0:
+            entry["model"] = models[model_codes[i]]
+        if input_tokens[i] >= 0:
+            entry["input_tokens"] = int(input_tokens[i])
+        if output_tokens[i] >= 0:
+            entry["output_tokens"] = int(output_tokens[i])
+        if not np.isnan(costs[i]):
+            entry["actual_cost"] = float(costs[i])
+        if extra_offsets[i + 1] > extra_offsets[i]:
+            entry.update(json.loads(extra[extra_offsets[i]:extra_offsets[i + 1]]))
+        yield i + 1, 0, entry
+
+
+def _iter_jsonl(
+    path: Path,
+    start: int | None,
+    end: int | None,
+    model: str | None,
+    min_cost: float | None,
+    row: int,
+    offset: int,
+) -> Iterator[tuple[int, int, dict]]:
+    with path.open("rb") as f:
+        yield from iter_jsonl(f, start, end, model, min_cost, row, offset)
+
+
+def iter_jsonl(
+    f,
+    start: int | None = None,
+    end: int | None = None,
+    model: str | None = None,
+    min_cost: float | None = None,
+    row: int = 0,
+    offset: int = 0,
+) -> Iterator[tuple[int, int, dict]]:
+    """iter_segment for an already open JSONL file (binary mode).
+
+    Reading from an open file keeps the positions consistent even if the
+    file is renamed (rotated) meanwhile.
+    """
+    if offset:
+        f.seek(offset)
+        current = row
+    else:
+        f.seek(0)
+        current = 0
+    for raw in f:
+        if not raw.endswith(b"\n"):
+            break                        # incomplete line, still being written
+        offset += len(raw)
+        line = raw.strip()
+        if not line:
+            continue
+        current += 1
+        if current <= row:
+            continue
+        entry = json.loads(line)
+        if start is not None or end is not None:
+            micros = to_micros(entry["timestamp"])
+            if (start is not None and micros < start) or (end is not None and micros >= end):
+                continue
+        if model is not None and entry.get("model") != model:
+            continue
+        if min_cost is not None and not entry.get("actual_cost", 0) >= min_cost:
+            continue
+        yield current, offset, entry
+
+
+def count_rows(path: Path) -> int:
+    """Return the number of complete entries in a .jsonl segment."""
+    with path.open("rb") as f:
+        return sum(1 for raw in f if raw.endswith(b"\n") and raw.strip())
+
+
+def load_manifest(directory: Path) -> dict[str, dict]:
+    """Return the manifest of a segments directory (segment name → record).
+
+    Compacted segments missing from the manifest (e.g. after two processes
+    compacted at the same time) are added from their timestamp column, and
+    records of deleted segments are dropped.
+    """
+    path = directory / MANIFEST_NAME
+    try:
+        manifest = json.loads(path.read_text())
+    except (OSError, ValueError):
+        manifest = {}
+
+    on_disk = {p.stem for p in directory.glob("*.npz")}
+    changed = False
+    for name in list(manifest):
+        if name not in on_disk:
+            del manifest[name]
+            changed = True
+    for name in on_disk - manifest.keys():
+        with np.load(directory / f"{name}.npz") as data:
+            manifest[name] = _record(data["timestamp"], data["models"].tolist())
+        changed = True
+    if changed:
+        save_manifest(directory, manifest)
+    return manifest
+
+
+def save_manifest(directory: Path, manifest: dict[str, dict]) -> None:
+    """Write the manifest atomically."""
+    path = directory / MANIFEST_NAME
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(dict(sorted(manifest.items())), indent=1))
+    os.replace(tmp, path)
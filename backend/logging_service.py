@@ -6,88 +6,914 @@ This makes it easy to append new entries without reading the whole file.
 Example log file (requests.jsonl):
     {"timestamp": "2026-02-12T14:30:00+00:00", "model": "llama-3.3-70b-versatile", "cost": 0.001}
     {"timestamp": "2026-02-12T14:31:00+00:00", "model": "openai/gpt-oss-20b", "cost": 0.0002}
+
+Statistics are kept as a running aggregate in memory, so /stats never has to
+re-read the whole log. The aggregate remembers the byte offset up to which the
+log has been counted and is saved to a small checkpoint file next to the log
+(requests.stats.json). On startup only the part of the log written after the
+checkpoint is read. The aggregate also keeps per-minute and per-hour rollups
+per model (requests, tokens, cost, latency), so get_series can answer time
+range queries without touching the log, the output_calibrator state
+(output/input token ratio quantiles per model and task type) and the
+estimate_accuracy state (estimate error distributions).
+
+Inside the API, entries are handed to a background LogWriter thread that keeps
+the file open and writes them in batches, so logging never blocks the event
+loop. Without a running writer (scripts, notebooks) log_request writes directly.
+
+The log file only holds the current segment: once its entries span more than
+one LOG_SEGMENT_SECONDS bucket (an hour by default) or it grows past
+LOG_SEGMENT_MAX_BYTES, it is moved to logs/requests.segments/ and compacted
+into a columnar .npz file (see log_segments). iter_log_records / read_logs
+stream the segments and the current file in order, filtered by time range,
+model and cost, and skip segments that cannot contain a match.
 """
 
 import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timezone
 from pathlib import Path
 
+from backend import estimate_accuracy, log_segments, output_calibrator
+
+try:
+    import fcntl
+except ImportError:                  # Windows
+    fcntl = None
+
 # Path to the logs directory and log file (relative to project root)
 # __file__ = this file → .parent = backend/ → .parent = project root → / "logs"
 LOGS_DIR = Path(__file__).resolve().parent.parent / "logs"
 LOG_FILE = LOGS_DIR / "requests.jsonl"
 
+# Save the stats checkpoint after this many new entries (plus on shutdown)
+CHECKPOINT_EVERY = 1000
 
-def log_request(data: dict) -> None:
-    """Append a request log entry as a JSON line to the log file.
+# Background writer settings (see LogWriter)
+LOG_FLUSH_INTERVAL_MS = float(os.getenv("LOG_FLUSH_INTERVAL_MS", "50"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_FSYNC = os.getenv("LOG_FSYNC", "off")
 
-    Args:
-        data: Dictionary with the data to log (e.g. model, cost, tokens).
+# Segment rotation: start a new segment when the entries of the current one
+# span more than one time bucket of this many seconds, or when it is larger
+# than this many bytes (0 disables either rule)
+LOG_SEGMENT_SECONDS = int(os.getenv("LOG_SEGMENT_SECONDS", "3600"))
+LOG_SEGMENT_MAX_BYTES = int(os.getenv("LOG_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Rollup bucket sizes in milliseconds, and how many of the newest buckets are
+# kept per size (default: one day of minutes, 90 days of hours)
+ROLLUP_BUCKETS = {"minute": 60_000, "hour": 3_600_000}
+ROLLUP_RETENTION = {
+    "minute": int(os.getenv("ROLLUP_MINUTE_RETENTION", "1440")),
+    "hour": int(os.getenv("ROLLUP_HOUR_RETENTION", "2160")),
+}
+
+logger = logging.getLogger(__name__)
+
+# Running aggregate — only ever touched while holding _stats_lock
+_stats_lock = threading.Lock()
+_stats: dict | None = None
+# (log file, task type → model → ratio): calibrated output ratios, replaced
+# as a whole whenever the aggregate changes, so routing reads them without the lock
+_output_ratios: tuple[str, dict[str, dict[str, float]]] | None = None
+
+
+def _checkpoint_file() -> Path:
+    """Return the checkpoint path that belongs to the current LOG_FILE."""
+    return LOG_FILE.with_suffix(".stats.json")
+
+
+def _segments_dir() -> Path:
+    """Return the directory for the closed segments of the current LOG_FILE."""
+    return LOG_FILE.with_suffix(".segments")
+
+
+def _segment_name(first_timestamp: str) -> str:
+    """Name a segment after the timestamp of its first entry, e.g. requests-20260212T143000123456."""
+    first = datetime.fromisoformat(first_timestamp).astimezone(timezone.utc)
+    return f"{LOG_FILE.stem}-{first:%Y%m%dT%H%M%S%f}"
+
+
+def _segment_paths() -> dict[str, Path]:
+    """Return every closed segment of LOG_FILE by name, oldest first.
+
+    A segment is either compacted (.npz) or still waiting for compaction (.jsonl).
+    """
+    directory = _segments_dir()
+    if not directory.exists():
+        return {}
+    paths = {p.stem: p for p in directory.glob("*.jsonl")}
+    # Prefer the compacted file if the .jsonl has not been removed yet
+    paths.update({p.stem: p for p in directory.glob("*.npz")})
+    return dict(sorted(paths.items()))
+
+
+def _empty_stats() -> dict:
+    """Return a zeroed-out aggregate for the current LOG_FILE."""
+    return {
+        "log_file": str(LOG_FILE),
+        "offset": 0,                # bytes of LOG_FILE already counted
+        "inode": None,              # identity of the LOG_FILE the offset refers to
+        "lines": 0,                 # entries of LOG_FILE already counted
+        "segment_start": None,      # timestamp of the first entry in LOG_FILE
+        "segments": {},             # closed segment name → entries counted
+        "total_requests": 0,
+        "total_cost": 0.0,
+        "total_input_tokens": 0,
+        "total_output_tokens": 0,
+        "cache_hits": 0,
+        "cache_savings": 0.0,
+        "model_usage": {},
+        # bucket size → bucket start (ms, as string) → model →
+        # [requests, input_tokens, output_tokens, cost, latency_ms sum, latency samples]
+        "rollups": {bucket: {} for bucket in ROLLUP_BUCKETS},
+        # output_calibrator state: model → task type → quantile estimator
+        "output_ratios": {"quantile": output_calibrator.OUTPUT_QUANTILE, "models": {}},
+        # estimate_accuracy state: model → task type → quantity → error distribution
+        "estimate_accuracy": {},
+        "unsaved": 0,               # entries counted since the last checkpoint
+    }
+
+
+def _apply_entry(stats: dict, entry: dict, replay: bool = False) -> None:
+    """Add one log entry to the running aggregate.
+
+    `replay` marks entries recounted while the aggregate is rebuilt (at
+    startup or after the log was truncated); their drift changes are not
+    logged again.
+    """
+    stats["total_requests"] += 1
+    # .get() returns 0 if the key is missing (defensive programming)
+    stats["total_cost"] += entry.get("actual_cost", 0)
+    stats["total_input_tokens"] += entry.get("input_tokens", 0)
+    stats["total_output_tokens"] += entry.get("output_tokens", 0)
+    if entry.get("cache_hit"):
+        stats["cache_hits"] += 1
+        stats["cache_savings"] += entry.get("saved_cost", 0)
+    model = entry.get("model")
+    if model:
+        stats["model_usage"][model] = stats["model_usage"].get(model, 0) + 1
+    if "timestamp" in entry:
+        _apply_rollups(stats["rollups"], entry)
+    output_calibrator.observe(stats["output_ratios"]["models"], entry)
+    estimate_accuracy.observe(stats["estimate_accuracy"], entry, replay=replay)
+    stats["unsaved"] += 1
+
+
+def _apply_rollups(rollups: dict, entry: dict) -> None:
+    """Add one log entry to its minute and hour buckets."""
+    millis = log_segments.to_micros(entry["timestamp"]) // 1000
+    model = entry.get("model") or "unknown"
+    latency = entry.get("latency_ms")
+    for bucket, size in ROLLUP_BUCKETS.items():
+        buckets = rollups[bucket]
+        start = str(millis - millis % size)
+        if start not in buckets:
+            buckets[start] = {}
+            # Drop buckets that fell out of the retention window
+            cutoff = millis - ROLLUP_RETENTION[bucket] * size
+            for old in [key for key in buckets if int(key) < cutoff]:
+                del buckets[old]
+        row = buckets[start].setdefault(model, [0, 0, 0, 0.0, 0.0, 0])
+        row[0] += 1
+        row[1] += entry.get("input_tokens", 0)
+        row[2] += entry.get("output_tokens", 0)
+        row[3] += entry.get("actual_cost", 0)
+        if latency is not None:
+            row[4] += latency
+            row[5] += 1
+
+
+def _apply_active_entry(stats: dict, entry: dict, replay: bool = False) -> None:
+    """Add an entry of the current LOG_FILE to the aggregate (see _apply_entry)."""
+    if stats["lines"] == 0:
+        stats["segment_start"] = entry.get("timestamp")
+    stats["lines"] += 1
+    _apply_entry(stats, entry, replay)
+
+
+def _publish_output_ratios(stats: dict) -> None:
+    """Publish the calibrated output ratios of the aggregate for get_output_ratios.
+
+    Must be called with _stats_lock held.
+    """
+    global _output_ratios
+    _output_ratios = (stats["log_file"], output_calibrator.all_ratios(stats["output_ratios"]["models"]))
+
+
+def _catch_up(stats: dict, replay: bool = False) -> None:
+    """Count every complete log line written after stats["offset"].
+
+    Only whole lines are counted; a half-written last line is left for the
+    next call. This also picks up lines appended by other worker processes,
+    and segments they rotated. `replay` is passed on to _apply_entry.
+    """
+    _read_tail(stats, replay)
+    _publish_output_ratios(stats)
+
+
+def _read_tail(stats: dict, replay: bool) -> None:
+    """See _catch_up."""
+    # Open first and look at the open file, so size and identity belong to
+    # the file we read even if it is rotated right now
+    try:
+        f = LOG_FILE.open("rb")
+    except FileNotFoundError:
+        f = None
+    with f or nullcontext():
+        if f is None:
+            size, inode = 0, None
+        else:
+            status = os.fstat(f.fileno())
+            size, inode = status.st_size, status.st_ino
+
+        replaced = stats["inode"] is not None and inode != stats["inode"]
+        if not replaced and stats["lines"] and _first_timestamp(f) != stats["segment_start"]:
+            replaced = True          # a new file that got the old one's inode number
+        if replaced:
+            # The file was replaced — rotated into a segment (maybe by another
+            # process) or deleted. Without a segment for it, start from scratch.
+            if not _close_segment(stats, replay):
+                _reset_stats(stats)
+                replay = True
+        elif size < stats["offset"]:
+            # The file got smaller (truncated) — start counting from scratch
+            _reset_stats(stats)
+            replay = True
+        stats["inode"] = inode
+        if size == stats["offset"]:
+            return
+
+        f.seek(stats["offset"])
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break                    # incomplete line, still being written
+            stats["offset"] += len(raw)
+            line = raw.strip()
+            if line:
+                _apply_active_entry(stats, json.loads(line), replay)
+
+
+def _first_timestamp(f) -> str | None:
+    """Return the timestamp of the first entry in an open log file."""
+    f.seek(0)
+    line = f.readline()
+    if not line.endswith(b"\n"):
+        return None
+    return json.loads(line).get("timestamp")
+
+
+def _reset_stats(stats: dict) -> None:
+    """Recount everything from the closed segments (the current file follows in _catch_up)."""
+    stats.clear()
+    stats.update(_empty_stats())
+    _sync_segments(stats, replay=True)
+
+
+def _close_segment(stats: dict, replay: bool = False) -> bool:
+    """Mark the entries counted so far as belonging to the segment LOG_FILE was rotated into.
+
+    `replay` is passed on to _apply_entry.
+
+    Returns:
+        False if there is no such segment (the file was deleted instead).
+    """
+    if stats["segment_start"] is not None:
+        name = _segment_name(stats["segment_start"])
+        if name not in _segment_paths():
+            return False
+        stats["segments"][name] = stats["lines"]
+    stats.update(offset=0, lines=0, segment_start=None, inode=None)
+    # Count what was written to the old file after our last look, plus
+    # segments other processes closed in the meantime
+    _sync_segments(stats, replay)
+    return True
+
+
+def _sync_segments(stats: dict, replay: bool = False) -> None:
+    """Count the entries of closed segments that are not in the aggregate yet (see _apply_entry)."""
+    while True:
+        paths = _segment_paths()
+        if not paths:
+            return
+        manifest = log_segments.load_manifest(_segments_dir())
+        try:
+            for name, path in paths.items():
+                if path.suffix == ".npz":
+                    rows = manifest[name]["rows"]
+                else:
+                    rows = log_segments.count_rows(path)
+                counted = stats["segments"].get(name, 0)
+                if rows > counted:
+                    for row, _, entry in log_segments.iter_segment(path, row=counted):
+                        if row > rows:
+                            break
+                        _apply_entry(stats, entry, replay)
+                    stats["segments"][name] = rows
+            return
+        except FileNotFoundError:
+            # Another process compacted a .jsonl segment meanwhile — look again
+            continue
+
+
+def _load_stats() -> dict:
+    """Rebuild the aggregate from the checkpoint plus the log tail behind it."""
+    stats = _empty_stats()
+    checkpoint = _checkpoint_file()
+    if checkpoint.exists():
+        try:
+            saved = json.loads(checkpoint.read_text())
+        except (OSError, ValueError):
+            saved = None             # unreadable checkpoint → full rebuild
+        if saved and saved.get("log_file") == str(LOG_FILE):
+            stats.update(saved)
+        # Estimators for another quantile cannot be reused, and a checkpoint
+        # from before accuracy tracking (or its latest fields) lacks its state → full rebuild
+        if (
+            stats["output_ratios"]["quantile"] != output_calibrator.OUTPUT_QUANTILE
+            or (saved and "estimate_accuracy" not in saved)
+            or not estimate_accuracy.compatible(stats["estimate_accuracy"])
+        ):
+            stats = _empty_stats()
+    stats["unsaved"] = 0
+    # The lines the checkpoint counted in LOG_FILE belong to a segment if the
+    # file was rotated since; close it first so they are not counted again
+    if stats["segment_start"] is not None and _segment_name(stats["segment_start"]) in _segment_paths():
+        _close_segment(stats, replay=True)
+    # Pick up segments closed while the checkpoint was not updated
+    _sync_segments(stats, replay=True)
+    _catch_up(stats, replay=True)
+    return stats
+
+
+def _current_stats() -> dict:
+    """Return the aggregate for LOG_FILE, loading it on first use.
+
+    Must be called with _stats_lock held.
     """
+    global _stats
+    # Reload when LOG_FILE was pointed somewhere else (e.g. by tests)
+    if _stats is None or _stats["log_file"] != str(LOG_FILE):
+        _stats = _load_stats()
+    return _stats
+
+
+def _save_checkpoint(stats: dict) -> None:
+    """Write the aggregate to the checkpoint file atomically."""
+    LOGS_DIR.mkdir(exist_ok=True)
+    data = {key: value for key, value in stats.items() if key != "unsaved"}
+    tmp = _checkpoint_file().with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data))
+    # os.replace is atomic, so a crash never leaves a half-written checkpoint
+    os.replace(tmp, _checkpoint_file())
+    stats["unsaved"] = 0
+
+
+def save_stats_checkpoint() -> None:
+    """Persist the running aggregate (called on application shutdown)."""
+    with _stats_lock:
+        if _stats is not None and _stats["log_file"] == str(LOG_FILE):
+            _save_checkpoint(_stats)
+
+
+@contextmanager
+def _file_lock(exclusive: bool = False):
+    """Coordinate writers (shared) and rotation (exclusive) across processes.
+
+    Holding the shared lock while opening and writing LOG_FILE guarantees
+    that nobody appends to a file after it was rotated. Without fcntl
+    (Windows) this is a no-op; renaming a file another process has open fails
+    there anyway, so rotation is simply retried later.
+    """
+    if fcntl is None:
+        yield
+        return
+    LOGS_DIR.mkdir(exist_ok=True)
+    # Lock the logs/ directory itself, so no lock file is left behind
+    fd = os.open(LOG_FILE.parent, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+    finally:
+        os.close(fd)                 # closing releases the lock
+
+
+def _open_log_file():
+    """Open LOG_FILE for appending, creating the logs/ directory if needed."""
     # Create the logs/ directory if it doesn't exist yet
     LOGS_DIR.mkdir(exist_ok=True)
+    # Open the file in append mode ("ab") so we add to the end, never overwrite
+    return LOG_FILE.open("ab")
+
+
+def _write_entries(f, entries: list[dict], fsync: bool = False) -> None:
+    """Append entries to an open log file as one write and update the aggregate.
+
+    Args:
+        f: Binary file handle opened in append mode on LOG_FILE (opened and
+            written while holding _file_lock(), so it cannot be rotated meanwhile).
+        entries: Log entries to write, in order.
+        fsync: Force the data to disk before returning.
+    """
+    # Convert each dict to a JSON string and write them as one block of lines
+    data = "".join(json.dumps(entry) + "\n" for entry in entries).encode()
+
+    with _stats_lock:
+        stats = _current_stats()
+        # Make sure the aggregate refers to the file we are writing to
+        _catch_up(stats)
+        f.write(data)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+
+        inode = os.fstat(f.fileno()).st_ino
+        # In append mode every write lands at the end of the file, so our block
+        # starts exactly len(data) bytes before the position after the write
+        start = f.tell() - len(data)
+        if start == stats["offset"] and inode == stats["inode"]:
+            # Nobody else wrote in between — count our entries directly
+            stats["offset"] = start + len(data)
+            for entry in entries:
+                _apply_active_entry(stats, entry)
+            _publish_output_ratios(stats)
+        else:
+            # Another process appended lines we haven't counted yet
+            _catch_up(stats)
+
+        if stats["unsaved"] >= CHECKPOINT_EVERY:
+            _save_checkpoint(stats)
+
 
+def _rotation_due(timestamp: str) -> bool:
+    """True if the next entry (written at `timestamp`) belongs in a new segment."""
+    with _stats_lock:
+        stats = _current_stats()
+        _catch_up(stats)
+        return _is_rotation_due(stats, timestamp)
+
+
+def _is_rotation_due(stats: dict, timestamp: str) -> bool:
+    """See _rotation_due; must be called with _stats_lock held."""
+    if stats["segment_start"] is None:
+        return False                 # the current file is empty
+    if LOG_SEGMENT_MAX_BYTES and stats["offset"] >= LOG_SEGMENT_MAX_BYTES:
+        return True
+    if LOG_SEGMENT_SECONDS:
+        bucket_us = LOG_SEGMENT_SECONDS * 1_000_000
+        first_bucket = log_segments.to_micros(stats["segment_start"]) // bucket_us
+        return log_segments.to_micros(timestamp) // bucket_us != first_bucket
+    return False
+
+
+def _rotate(timestamp: str) -> bool:
+    """Move LOG_FILE into the segments directory if a new segment is due.
+
+    The caller must not hold LOG_FILE open (renaming open files fails on Windows).
+
+    Returns:
+        True if the file was rotated; compact it with _compact_segments().
+    """
+    with _file_lock(exclusive=True), _stats_lock:
+        stats = _current_stats()
+        _catch_up(stats)
+        if not _is_rotation_due(stats, timestamp):
+            return False
+        name = _segment_name(stats["segment_start"])
+        _segments_dir().mkdir(exist_ok=True)
+        try:
+            os.rename(LOG_FILE, _segments_dir() / f"{name}.jsonl")
+        except OSError:
+            # E.g. another process still has the file open on Windows — retry later
+            logger.warning("Could not rotate %s", LOG_FILE, exc_info=True)
+            return False
+        stats["segments"][name] = stats["lines"]
+        stats.update(offset=0, lines=0, segment_start=None, inode=None)
+        return True
+
+
+def _compact_segments() -> None:
+    """Compact every closed .jsonl segment into a columnar .npz file."""
+    directory = _segments_dir()
+    for path in sorted(directory.glob("*.jsonl")):
+        try:
+            record = log_segments.compact(path, path.with_suffix(".npz"))
+        except FileNotFoundError:
+            continue                 # another process got there first
+        manifest = log_segments.load_manifest(directory)
+        manifest[path.stem] = record
+        log_segments.save_manifest(directory, manifest)
+        path.unlink(missing_ok=True)
+    with _stats_lock:
+        # Lines another process appended to the old file just before the
+        # rotation are only visible now
+        stats = _current_stats()
+        _sync_segments(stats)
+        _publish_output_ratios(stats)
+
+
+class LogWriter:
+    """Background thread that writes log entries in batches (group commit).
+
+    Keeps one file handle open and writes everything that arrived within
+    flush_interval_ms (or batch_size entries, whichever comes first) with a
+    single write, so the request handler only has to put a dict on a queue.
+    """
+
+    def __init__(
+        self,
+        flush_interval_ms: float = LOG_FLUSH_INTERVAL_MS,
+        batch_size: int = LOG_BATCH_SIZE,
+        fsync: str = LOG_FSYNC,
+    ):
+        """Configure the writer.
+
+        Args:
+            flush_interval_ms: Max time an entry waits before being written.
+            batch_size: Max entries written per batch.
+            fsync: "off" to leave flushing to the OS, "batch" to fsync after
+                every batch.
+        """
+        if fsync not in ("off", "batch"):
+            raise ValueError(f"Unknown fsync mode: {fsync!r}")
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.fsync = fsync == "batch"
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._file = None
+        self._file_path: Path | None = None
+
+    def start(self) -> None:
+        """Start the background thread."""
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, entry: dict) -> None:
+        """Queue an entry for writing (never blocks)."""
+        self._queue.put(entry)
+
+    def stop(self) -> None:
+        """Write everything still queued, then stop the thread and close the file."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            # Wait for the first entry, then collect more until the batch is
+            # full or the flush interval has passed
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            if batch[-1] is _STOP:
+                stopping = True
+                batch.pop()
+                # Drain whatever was queued concurrently with stop()
+                while not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+            if batch:
+                self._write(batch)
+
+        self._close()
+
+    def _write(self, batch: list[dict]) -> None:
+        try:
+            rotated = False
+            if _rotation_due(batch[0]["timestamp"]):
+                self._close()
+                rotated = _rotate(batch[0]["timestamp"])
+            with _file_lock():
+                # Reopen if LOG_FILE was pointed somewhere else or rotated by another process
+                if self._file is None or self._file_path != LOG_FILE or _file_replaced(self._file):
+                    self._close()
+                    self._file = _open_log_file()
+                    self._file_path = LOG_FILE
+                _write_entries(self._file, batch, fsync=self.fsync)
+            if rotated:
+                _compact_segments()
+        except Exception:
+            # Never let one bad batch kill the writer thread
+            logger.exception("Failed to write %d log entries", len(batch))
+            self._close()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _file_replaced(f) -> bool:
+    """True if LOG_FILE no longer is the file `f` has open (rotated or deleted)."""
+    try:
+        return LOG_FILE.stat().st_ino != os.fstat(f.fileno()).st_ino
+    except FileNotFoundError:
+        return True
+
+
+# Marker put on the queue to tell the writer thread to finish
+_STOP = object()
+
+# The running background writer (None = log_request writes synchronously)
+_writer: LogWriter | None = None
+
+
+def start_log_writer(**kwargs) -> None:
+    """Start the background writer; log_request then only enqueues entries.
+
+    Args:
+        **kwargs: Passed to LogWriter (flush_interval_ms, batch_size, fsync).
+    """
+    global _writer
+    if _writer is None:
+        _writer = LogWriter(**kwargs)
+        _writer.start()
+
+
+def stop_log_writer() -> None:
+    """Flush all queued entries and stop the background writer."""
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+def log_request(data: dict) -> None:
+    """Append a request log entry as a JSON line and update the aggregate.
+
+    If the background writer is running the entry is only queued and written
+    by the writer thread; otherwise it is written right away.
+
+    Args:
+        data: Dictionary with the data to log (e.g. model, cost, tokens).
+    """
     # Build the log entry: current timestamp + all data fields merged together
     entry = {"timestamp": datetime.now(timezone.utc).isoformat(), **data}
 
-    # Open the file in append mode ("a") so we add to the end, never overwrite
-    with LOG_FILE.open("a") as f:
-        # Convert dict to JSON string and write as one line
-        f.write(json.dumps(entry) + "\n")
+    if _writer is not None:
+        _writer.submit(entry)
+        return
 
+    rotated = _rotate(entry["timestamp"])
+    with _file_lock(), _open_log_file() as f:
+        _write_entries(f, [entry])
+    if rotated:
+        _compact_segments()
 
-def read_logs() -> list[dict]:
-    """Read all log entries from the JSONL file.
 
-    Returns:
-        List of log entries as dictionaries. Empty list if no logs exist yet.
+def iter_log_records(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    model: str | None = None,
+    min_cost: float | None = None,
+    cursor: str | None = None,
+) -> Iterator[tuple[str, dict]]:
+    """Yield matching log entries oldest first, each with a cursor to resume after it.
+
+    Entries are read one at a time from the closed segments and then the
+    current file, so even a large log never has to fit in memory. Segments
+    whose manifest says they cannot contain a match (time range, model) are
+    not opened at all.
+
+    A cursor has the form "<segment>:<row>:<byte offset>": the segment is
+    named after its first entry (the current file too), so a cursor stays
+    valid when the current file is rotated and compacted. For .jsonl files
+    the byte offset lets a resumed read seek straight to the position.
+
+    Args:
+        start: Only entries at or after this time (naive = UTC).
+        end: Only entries before this time (naive = UTC).
+        model: Only entries for this model ID.
+        min_cost: Only entries whose actual_cost is at least this much (USD).
+        cursor: Continue after the entry this cursor was returned with.
+
+    Yields:
+        (cursor, entry) tuples. Nothing if no logs exist yet.
+
+    Raises:
+        ValueError: If the cursor is malformed.
     """
-    # If the log file doesn't exist yet, there's nothing to read
-    if not LOG_FILE.exists():
-        return []
+    after_name, after_row, after_offset = _parse_cursor(cursor) if cursor else ("", 0, 0)
+    start_us = log_segments.to_micros(start) if start is not None else None
+    end_us = log_segments.to_micros(end) if end is not None else None
+
+    def position(name: str) -> tuple[int, int]:
+        return (after_row, after_offset) if name == after_name else (0, 0)
 
-    # Read the file line by line and parse each line as JSON
-    logs = []
-    with LOG_FILE.open("r") as f:
-        for line in f:
-            line = line.strip()          # remove whitespace and newline characters
-            if line:                     # skip empty lines
-                logs.append(json.loads(line))  # JSON string → Python dict
-    return logs
+    # Look at the segments again after reading them: the current file may
+    # have been rotated meanwhile
+    done = set()
+    while True:
+        paths = {name: path for name, path in _segment_paths().items() if name >= after_name and name not in done}
+        if not paths:
+            break
+        manifest = log_segments.load_manifest(_segments_dir())
+        for name, path in paths.items():
+            done.add(name)
+            record = manifest.get(name)
+            if record is not None and not _may_match(record, start_us, end_us, model):
+                continue
+            row, offset = position(name)
+            if path.suffix == ".npz":
+                offset = 0           # byte offsets only apply to the .jsonl form
+            try:
+                for row, offset, entry in log_segments.iter_segment(
+                    path, start_us, end_us, model, min_cost, row, offset
+                ):
+                    yield f"{name}:{row}:{offset}", entry
+            except FileNotFoundError:
+                # Compacted by another process before we opened it — read the .npz
+                done.discard(name)
+
+    try:
+        f = LOG_FILE.open("rb")
+    except FileNotFoundError:
+        return
+    with f:
+        first = _first_timestamp(f)
+        if first is None:
+            return
+        name = _segment_name(first)
+        if name < after_name or name in done:
+            return
+        row, offset = position(name)
+        for row, offset, entry in log_segments.iter_jsonl(f, start_us, end_us, model, min_cost, row, offset):
+            yield f"{name}:{row}:{offset}", entry
+
+
+def _parse_cursor(cursor: str) -> tuple[str, int, int]:
+    """Split a cursor from iter_log_records into (segment name, row, byte offset)."""
+    try:
+        name, row, offset = cursor.rsplit(":", 2)
+        row, offset = int(row), int(offset)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from None
+    if not name.startswith(f"{LOG_FILE.stem}-") or row < 0 or offset < 0:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return name, row, offset
+
+
+def _may_match(record: dict, start_us: int | None, end_us: int | None, model: str | None) -> bool:
+    """Check a segment's manifest record against the filters of a read."""
+    if record["rows"] == 0:
+        return False
+    if start_us is not None and log_segments.to_micros(record["max_timestamp"]) < start_us:
+        return False
+    if end_us is not None and log_segments.to_micros(record["min_timestamp"]) >= end_us:
+        return False
+    # Records written before the model list was added cannot rule a model out
+    if model is not None and "models" in record and model not in record["models"]:
+        return False
+    return True
+
+
+def read_logs(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    model: str | None = None,
+    min_cost: float | None = None,
+) -> Iterator[dict]:
+    """Yield log entries oldest first, from the closed segments and the current file.
+
+    Same as iter_log_records, without the cursors.
+
+    Args:
+        start: Only entries at or after this time (naive = UTC).
+        end: Only entries before this time (naive = UTC).
+        model: Only entries for this model ID.
+        min_cost: Only entries whose actual_cost is at least this much (USD).
+
+    Yields:
+        Log entries as dictionaries. Nothing if no logs exist yet.
+    """
+    for _, entry in iter_log_records(start, end, model, min_cost):
+        yield entry
 
 
 def get_stats() -> dict:
-    """Calculate statistics from all logged requests.
+    """Return statistics from the running aggregate.
+
+    Runs in constant time regardless of log size: only lines appended since
+    the last call (e.g. by another worker process) are read.
 
     Returns:
         Dictionary with:
         - total_requests: how many requests were made
         - total_cost: sum of all request costs
         - average_cost: average cost per request
+        - total_input_tokens / total_output_tokens: token sums
+        - cache_hits / cache_hit_rate / cache_savings: response cache effect
         - model_usage: dict counting how often each model was used
     """
-    # Read all log entries
-    logs = read_logs()
+    with _stats_lock:
+        stats = _current_stats()
+        _catch_up(stats)
+        total_requests = stats["total_requests"]
+        total_cost = stats["total_cost"]
+        return {
+            "total_requests": total_requests,
+            "total_cost": round(total_cost, 6),
+            "average_cost": round(total_cost / total_requests, 6) if total_requests else 0.0,
+            "total_input_tokens": stats["total_input_tokens"],
+            "total_output_tokens": stats["total_output_tokens"],
+            "cache_hits": stats["cache_hits"],
+            "cache_hit_rate": round(stats["cache_hits"] / total_requests, 4) if total_requests else 0.0,
+            "cache_savings": round(stats["cache_savings"], 6),
+            "model_usage": dict(stats["model_usage"]),
+        }
 
-    # If no logs exist yet, return zeroed-out stats
-    if not logs:
-        return {"total_requests": 0, "total_cost": 0.0, "average_cost": 0.0, "model_usage": {}}
 
-    # Sum up the "actual_cost" field from each log entry
-    # .get() returns 0 if the key is missing (defensive programming)
-    total_cost = sum(log.get("actual_cost", 0) for log in logs)
+def get_output_ratios(task_type: str) -> dict[str, float]:
+    """Return the calibrated output/input token ratio per model for a task type.
+
+    Called for every routing decision, so it reads the ratios the log
+    writer published after its last batch, without taking _stats_lock
+    (which is held while the writer writes and fsyncs). Only the first
+    call loads the aggregate. Models with too few logged calls for the task
+    type are missing (see output_calibrator). The result must not be modified.
+    """
+    published = _output_ratios
+    if published is None or published[0] != str(LOG_FILE):
+        with _stats_lock:
+            _catch_up(_current_stats())
+        published = _output_ratios
+    return published[1].get(task_type, {})
 
-    # Count how often each model was used
-    model_usage = {}
-    for log in logs:
-        model = log.get("model")
-        if model:
-            # .get(model, 0) returns 0 if the model isn't in the dict yet
-            model_usage[model] = model_usage.get(model, 0) + 1
 
-    return {
-        "total_requests": len(logs),
-        "total_cost": round(total_cost, 6),
-        "average_cost": round(total_cost / len(logs), 6),
-        "model_usage": model_usage,
-    }
+def get_estimate_accuracy() -> list[dict]:
+    """Return the estimate error distributions per model and task type.
+
+    Catches up with the log first, so calls logged by other worker
+    processes are included (see estimate_accuracy.summary for the fields).
+    """
+    with _stats_lock:
+        stats = _current_stats()
+        _catch_up(stats)
+        return estimate_accuracy.summary(stats["estimate_accuracy"])
+
+
+def get_series(start_ms: int, end_ms: int, bucket: str = "hour") -> list[dict]:
+    """Return per-model usage in time buckets, read from the rollups.
+
+    Only buckets that had requests are returned. Buckets older than the
+    retention for their size (ROLLUP_RETENTION) are no longer available.
+
+    Args:
+        start_ms: Range start in milliseconds since the epoch (inclusive).
+        end_ms: Range end in milliseconds since the epoch (exclusive).
+        bucket: Bucket size, "minute" or "hour".
+
+    Returns:
+        List of buckets, oldest first, each with:
+        - start: bucket start in milliseconds since the epoch
+        - models: per model ID, requests, input_tokens, output_tokens,
+          cost and avg_latency_ms (None if no call reported a latency)
+
+    Raises:
+        ValueError: If bucket is not a known bucket size.
+    """
+    if bucket not in ROLLUP_BUCKETS:
+        raise ValueError(f"Unknown bucket size: {bucket!r}")
+    # Include the bucket that start_ms falls into
+    first = start_ms - start_ms % ROLLUP_BUCKETS[bucket]
+
+    with _stats_lock:
+        stats = _current_stats()
+        _catch_up(stats)
+        buckets = stats["rollups"][bucket]
+        selected = sorted(int(key) for key in buckets if first <= int(key) < end_ms)
+        return [
+            {
+                "start": key,
+                "models": {
+                    model: {
+                        "requests": requests,
+                        "input_tokens": input_tokens,
+                        "output_tokens": output_tokens,
+                        "cost": round(cost, 8),
+                        "avg_latency_ms": round(latency_sum / latency_count, 1) if latency_count else None,
+                    }
+                    for model, (requests, input_tokens, output_tokens, cost, latency_sum, latency_count)
+                    in buckets[str(key)].items()
+                },
+            }
+            for key in selected
+        ]
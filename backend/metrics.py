@@ -0,0 +1,401 @@
+"""Prometheus metrics — counters and histograms for GET /metrics.
+
+Each worker process keeps its metrics in plain dicts, without locks: the
+event loop runs one request step at a time, and recording a value is a
+dict lookup plus an addition (about 0.4 µs). The ~15 values an uncached
+/route records add up to about 9 µs, more than the few µs aimed for but
+small next to the milliseconds of the request (python -m benchmarks.bench_metrics).
+
+Workers write a snapshot to METRICS_DIR every METRICS_FLUSH_INTERVAL seconds
+(and a last one on shutdown); /metrics adds the live metrics of the
+answering worker to the snapshots of the others, so every scrape sees the
+whole server. Snapshots are named by process ID and start time, so a new
+process with an old ID does not overwrite (and lower) a stopped one's
+totals. Gauges (requests in flight) of workers that stopped writing are
+left out after three intervals. Once such a worker's process is gone, the
+next snapshot writer adds its counters and histograms to STOPPED_FILE and
+deletes its snapshot, so summed counters never go down and the directory
+does not grow with every restart. Without fcntl (Windows) snapshots are not
+merged and stay.
+
+Metrics:
+- router_http_requests_total / router_http_request_duration_seconds: per
+  endpoint, method and status
+- router_requests_in_flight: HTTP requests being handled
+- router_stage_duration_seconds: time per /route stage (compress,
+  select_model, estimate, cache_lookup, llm_call, log_request)
+- router_upstream_requests_total / router_upstream_duration_seconds: LLM
+  API calls per model and status ("error" for connection failures)
+- router_cost_error_ratio: actual / estimated cost per model
+- router_estimated_cost_usd_total / router_actual_cost_usd_total
+- router_tokens_total: input and output tokens per model
+- router_cache_hits_total: answers from the exact or semantic cache
+- router_coalesced_requests_total: requests that shared another's LLM call
+"""
+
+import json
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from backend.logging_service import LOGS_DIR
+
+try:
+    import fcntl
+except ImportError:                  # Windows
+    fcntl = None
+
+METRICS_DIR = Path(os.getenv("METRICS_DIR", LOGS_DIR / "metrics"))
+# Seconds between snapshots of this worker's metrics (0 = single worker, no snapshots)
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# Summed counters of stopped workers, in METRICS_DIR
+STOPPED_FILE = "stopped.json"
+
+# Histogram buckets: seconds for in-process stages, seconds for LLM calls, ratios for cost errors
+# (stages include the LLM call, so their histogram uses both)
+STAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATIO_BUCKETS = (0.25, 0.5, 0.8, 0.9, 1.0, 1.1, 1.25, 2.0, 4.0)
+
+
+class Counter:
+    """A value per label combination that only goes up."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+
+class Gauge(Counter):
+    """A value per label combination that goes up and down."""
+
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) - amount
+
+
+class Histogram:
+    """Distribution of observed values per label combination.
+
+    values[labels] holds the count per bucket (not cumulative; the last one
+    is +Inf) followed by the sum of all observations.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...], labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def child(self, *labels: str):
+        """Return an observe function bound to one label combination (saves the lookup on hot paths)."""
+        counts = self.values.setdefault(labels, [0] * (len(self.buckets) + 2))
+        buckets = self.buckets
+
+        def observe(value: float) -> None:
+            counts[bisect_left(buckets, value)] += 1
+            counts[-1] += value
+        return observe
+
+
+HTTP_REQUESTS = Counter("router_http_requests_total", "HTTP requests handled.", ("path", "method", "status"))
+HTTP_DURATION = Histogram(
+    "router_http_request_duration_seconds", "HTTP request duration (streams until the last event).",
+    LATENCY_BUCKETS, ("path",),
+)
+IN_FLIGHT = Gauge("router_requests_in_flight", "HTTP requests being handled.")
+STAGE_DURATION = Histogram(
+    "router_stage_duration_seconds", "Time spent per stage of a routing request.", STAGE_BUCKETS + LATENCY_BUCKETS,
+    ("stage",),
+)
+UPSTREAM_REQUESTS = Counter("router_upstream_requests_total", "LLM API calls (attempts).", ("model", "status"))
+UPSTREAM_DURATION = Histogram(
+    "router_upstream_duration_seconds", "Duration of successful LLM API calls.", LATENCY_BUCKETS, ("model",)
+)
+COST_ERROR = Histogram("router_cost_error_ratio", "Actual cost divided by estimated cost.", RATIO_BUCKETS, ("model",))
+ESTIMATED_COST = Counter("router_estimated_cost_usd_total", "Estimated cost of the LLM calls made.", ("model",))
+ACTUAL_COST = Counter("router_actual_cost_usd_total", "Actual cost of the LLM calls made.", ("model",))
+TOKENS = Counter("router_tokens_total", "Tokens of the LLM calls made.", ("model", "direction"))
+CACHE_HITS = Counter("router_cache_hits_total", "Requests answered from a cache.", ("cache",))
+COALESCED = Counter("router_coalesced_requests_total", "Requests that shared the LLM call of an identical one.")
+
+REGISTRY = (
+    HTTP_REQUESTS, HTTP_DURATION, IN_FLIGHT, STAGE_DURATION, UPSTREAM_REQUESTS, UPSTREAM_DURATION,
+    COST_ERROR, ESTIMATED_COST, ACTUAL_COST, TOKENS, CACHE_HITS, COALESCED,
+)
+
+
+STAGES = ("compress", "select_model", "estimate", "cache_lookup", "llm_call", "log_request")
+_stage_observers = {stage: STAGE_DURATION.child(stage) for stage in STAGES}
+
+
+def observe_stage(stage: str, start: float) -> None:
+    """Record a stage (one of STAGES) that began at time.perf_counter() value start."""
+    _stage_observers[stage](time.perf_counter() - start)
+
+
+def observe_call(model_id: str, input_tokens: int, output_tokens: int, estimated_cost: float, actual_cost: float) -> None:
+    """Record tokens and estimated vs. actual cost of an LLM call that was made."""
+    TOKENS.inc(model_id, "input", amount=input_tokens)
+    TOKENS.inc(model_id, "output", amount=output_tokens)
+    ESTIMATED_COST.inc(model_id, amount=estimated_cost)
+    ACTUAL_COST.inc(model_id, amount=actual_cost)
+    if estimated_cost > 0:
+        COST_ERROR.observe(actual_cost / estimated_cost, model_id)
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting HTTP requests, their duration and the ones in flight.
+
+    Requests are labelled with the path of their route (e.g. /route), not
+    the raw URL, so unknown URLs cannot create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._paths: dict | None = None      # endpoint function → route path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_FLIGHT.dec()
+            if self._paths is None:
+                self._paths = {route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")}
+            path = self._paths.get(scope.get("endpoint"), "other")
+            HTTP_REQUESTS.inc(path, scope["method"], str(status))
+            HTTP_DURATION.observe(time.perf_counter() - start, path)
+
+
+def snapshot() -> dict:
+    """Return a copy of this worker's metrics as JSON-serialisable data.
+
+    Must be called on the event loop, which records the metrics; the copy
+    can then be written from another thread.
+    """
+    return {
+        metric.name: [[list(labels), list(value) if isinstance(value, list) else value]
+                      for labels, value in metric.values.items()]
+        for metric in REGISTRY
+    }
+
+
+# (process ID, snapshot file name) of this worker, see _snapshot_name
+_worker: tuple[int, str] | None = None
+
+
+def _snapshot_name() -> str:
+    """Return this worker's snapshot file name, <pid>-<start time>.json.
+
+    The start time keeps a later process that gets the same ID from
+    overwriting (and so lowering) the totals of a stopped one.
+    """
+    global _worker
+    pid = os.getpid()
+    if _worker is None or _worker[0] != pid:
+        _worker = (pid, f"{pid}-{time.time_ns()}.json")
+    return _worker[1]
+
+
+def write_snapshot(data: dict) -> None:
+    """Write this worker's snapshot (see snapshot) to METRICS_DIR for the other workers.
+
+    Also merges the snapshots of stopped workers into STOPPED_FILE. Blocks
+    on file I/O; the API calls it in a thread.
+    """
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    _write_json(METRICS_DIR / _snapshot_name(), data)
+    _merge_stopped_workers()
+
+
+def _write_json(path: Path, data: dict) -> None:
+    """Replace a file atomically, so readers never see half of it."""
+    temp = path.with_suffix(f".{os.getpid()}.tmp")
+    temp.write_text(json.dumps(data))
+    temp.replace(path)
+
+
+def _read_stopped() -> dict:
+    """Return STOPPED_FILE: the summed "metrics" of stopped workers and the snapshots "merged" last."""
+    try:
+        return json.loads((METRICS_DIR / STOPPED_FILE).read_text())
+    except FileNotFoundError:
+        return {"metrics": {}, "merged": []}
+
+
+def _is_running(pid: int) -> bool:
+    """True if a process with this ID exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True              # exists, but belongs to someone else
+    return True
+
+
+def _merge_stopped_workers() -> None:
+    """Add the counters and histograms of stopped workers to STOPPED_FILE and delete their snapshots.
+
+    A worker has stopped when its snapshot is older than three intervals and
+    its process is gone. The names of the merged snapshots are kept in
+    STOPPED_FILE until the next merge: a snapshot still there after a crash
+    is not added twice, and neither is one a concurrent /metrics read before
+    it was deleted (see _other_workers).
+    """
+    if fcntl is None:
+        return
+    fd = os.open(METRICS_DIR, os.O_RDONLY)
+    try:
+        # One merge at a time across workers (closing the descriptor releases the lock)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        oldest = time.time() - 3 * METRICS_FLUSH_INTERVAL
+        stopped = []
+        for path in METRICS_DIR.glob("*-*.json"):
+            pid = path.name.split("-", 1)[0]
+            try:
+                if pid.isdigit() and path.stat().st_mtime < oldest and not _is_running(int(pid)):
+                    stopped.append(path)
+            except FileNotFoundError:
+                continue
+        if not stopped:
+            return
+        totals = _read_stopped()
+        merged = set(totals["merged"])
+        types = {metric.name: metric.type for metric in REGISTRY}
+        for path in stopped:
+            if path.name in merged:
+                continue
+            try:
+                data = json.loads(path.read_text())
+            except ValueError:
+                continue                 # unreadable, dropped below
+            for name, values in data.items():
+                if types.get(name) not in ("counter", "histogram"):
+                    continue             # gauges of a stopped worker no longer apply
+                series = {tuple(labels): value for labels, value in totals["metrics"].get(name, [])}
+                for labels, value in values:
+                    series[tuple(labels)] = _add(series.get(tuple(labels)), value)
+                totals["metrics"][name] = [[list(labels), value] for labels, value in series.items()]
+        totals["merged"] = [path.name for path in stopped]
+        _write_json(METRICS_DIR / STOPPED_FILE, totals)
+        for path in stopped:
+            path.unlink(missing_ok=True)
+    finally:
+        os.close(fd)
+
+
+def _other_workers() -> list[tuple[dict, bool]]:
+    """Read the snapshots of the other workers, each with whether it is recent.
+
+    The summed counters of stopped workers (STOPPED_FILE) come last, as one
+    snapshot that is not recent. A snapshot is recent if it was written
+    within the last three intervals, i.e. its worker is still running.
+    """
+    if METRICS_FLUSH_INTERVAL <= 0 or not METRICS_DIR.is_dir():
+        return []
+    own = _snapshot_name()
+    oldest = time.time() - 3 * METRICS_FLUSH_INTERVAL
+    snapshots = {}
+    for path in METRICS_DIR.glob("*.json"):
+        try:
+            if path.name not in (own, STOPPED_FILE):
+                recent = path.stat().st_mtime >= oldest
+                snapshots[path.name] = (json.loads(path.read_text()), recent)
+        except (OSError, ValueError):
+            continue      # a worker is just replacing or merging it
+    # Read after the snapshots: one merged meanwhile is in STOPPED_FILE and
+    # listed as merged, one deleted before we read it is in STOPPED_FILE
+    try:
+        stopped = _read_stopped()
+    except (OSError, ValueError):
+        stopped = {"metrics": {}, "merged": []}
+    for name in stopped["merged"]:
+        snapshots.pop(name, None)
+    return list(snapshots.values()) + [(stopped["metrics"], False)]
+
+
+def _add(total, value):
+    if isinstance(value, list):
+        return [a + b for a, b in zip(total, value)] if total is not None else list(value)
+    return (total or 0.0) + value
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """Return all workers' metrics in the Prometheus text exposition format (0.0.4)."""
+    others = _other_workers()
+    lines = []
+    for metric in REGISTRY:
+        merged: dict[tuple, float | list] = {}
+        for labels, value in metric.values.items():
+            merged[labels] = _add(None, value)
+        for worker, recent in others:
+            if metric.type == "gauge" and not recent:
+                continue              # e.g. requests in flight of a worker that is gone
+            for labels, value in worker.get(metric.name, []):
+                merged[tuple(labels)] = _add(merged.get(tuple(labels)), value)
+
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        if metric.type != "histogram":
+            if not merged and not metric.labels:
+                merged[()] = 0.0
+            for labels, value in sorted(merged.items()):
+                lines.append(f"{metric.name}{_format_labels(metric.labels, labels)} {_format_value(value)}")
+            continue
+        for labels, counts in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{bound}"'
+                lines.append(f"{metric.name}_bucket{_format_labels(metric.labels, labels, le)} {_format_value(cumulative)}")
+            lines.append(f"{metric.name}_sum{_format_labels(metric.labels, labels)} {_format_value(counts[-1])}")
+            lines.append(f"{metric.name}_count{_format_labels(metric.labels, labels)} {_format_value(cumulative)}")
+    return "\n".join(lines) + "\n"
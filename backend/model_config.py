@@ -1,43 +1,214 @@
-"""Available model definitions and pricing configuration."""
-
-MODELS: dict = {
-    "llama-3.3-70b-versatile": {
-        "name": "LLaMA 3.3 70B Versatile",
-        "input_price_per_token": 0.00000059,
-        "output_price_per_token": 0.00000079,
-        "quality_score": 88,
-        "strengths": ["general", "code", "summarize"],
-        "max_tokens": 32768,
-    },
-    "llama-3.1-8b-instant": {
-        "name": "LLaMA 3.1 8B Instant",
-        "input_price_per_token": 0.00000005,
-        "output_price_per_token": 0.00000008,
-        "quality_score": 55,
-        "strengths": ["general"],
-        "max_tokens": 131072,
-    },
-    "openai/gpt-oss-120b": {
-        "name": "GPT-OSS 120B",
-        "input_price_per_token": 0.00000015,
-        "output_price_per_token": 0.00000060,
-        "quality_score": 85,
-        "strengths": ["general", "code", "email"],
-        "max_tokens": 65536,
-    },
-    "openai/gpt-oss-20b": {
-        "name": "GPT-OSS 20B",
-        "input_price_per_token": 0.000000075,
-        "output_price_per_token": 0.00000030,
-        "quality_score": 68,
-        "strengths": ["general", "email"],
-        "max_tokens": 65536,
-    },
-}
+"""Available model definitions and pricing configuration.
+
+The catalogue is read from MODEL_CATALOG_PATH (models.json in the project
+root by default; .toml, and .yaml if PyYAML is installed, work too):
+
+    {
+      "providers": {"<provider>": {"base_url": ..., "api_key_env": ..., ...}},
+      "models": {"<model id>": {"name": ..., "provider": ..., "input_price_per_token": ..., ...}},
+      "quality_thresholds": {"low": 0, "medium": 60, "high": 75}
+    }
+
+"provider" names the API that serves the model (see backend.providers;
+"groq" if omitted); "provider_model" is the model name sent to it, if it
+differs from the model ID. "rpm" and "tpm" are the provider's requests/tokens per minute limits for the
+model (see backend.rate_limiter); leave them out for unlimited models.
+"tokenizer" names the model's tokenizer family (see backend.tokenizer).
+
+reload_catalogue() re-reads the file when it changed (app.py polls it every
+MODEL_CATALOG_POLL_INTERVAL seconds) and swaps the new catalogue in as a
+whole, so every worker picks up price changes without a restart. Always
+access the catalogue as model_config.MODELS / model_config.QUALITY_THRESHOLDS
+(or via get_catalogue()); a `from backend.model_config import MODELS` keeps
+the catalogue of import time. Data derived from the catalogue (routing
+index, rate limits) is rebuilt once per catalogue version (etag).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import tomllib
+from dataclasses import dataclass
+from pathlib import Path
+
+from backend.providers import PROVIDER_TYPES
+
+try:
+    import yaml
+except ImportError:                  # optional, only needed for a YAML catalogue
+    yaml = None
+
+MODEL_CATALOG_PATH = Path(
+    os.getenv("MODEL_CATALOG_PATH", Path(__file__).resolve().parent.parent / "models.json")
+)
+# Seconds between checks of the catalogue file for changes (0 = never reload)
+MODEL_CATALOG_POLL_INTERVAL = float(os.getenv("MODEL_CATALOG_POLL_INTERVAL", "2"))
 
+# Used when the catalogue file has no "providers"
+DEFAULT_PROVIDERS: dict = {
+    "groq": {"type": "groq", "base_url": "https://api.groq.com/openai/v1", "api_key_env": "GROQ_API_KEY"},
+}
+# Provider of models that do not name one
+DEFAULT_PROVIDER = "groq"
 
-QUALITY_THRESHOLDS: dict = {
+# Used when the catalogue file has no "quality_thresholds"
+DEFAULT_QUALITY_THRESHOLDS: dict = {
     "low": 0,
     "medium": 60,
     "high": 75,
 }
+
+# Fields every model in the catalogue must have
+REQUIRED_FIELDS = (
+    "name",
+    "input_price_per_token",
+    "output_price_per_token",
+    "quality_score",
+    "strengths",
+    "max_tokens",
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Catalogue:
+    """One loaded version of the model catalogue (never modified after loading).
+
+    Attributes:
+        models: Model ID → model definition.
+        quality_thresholds: Minimum quality score per quality level.
+        providers: Provider name → provider definition.
+        etag: Hash of the whole catalogue, changes with its content.
+        signature: (mtime_ns, size) of the file it was read from.
+    """
+    models: dict
+    quality_thresholds: dict
+    providers: dict
+    etag: str
+    signature: tuple[int, int] | None = None
+
+
+def parse_catalogue(data: dict, signature: tuple[int, int] | None = None) -> Catalogue:
+    """Validate parsed catalogue data and build a Catalogue from it.
+
+    Raises:
+        ValueError: If models are missing or incomplete, or a provider is
+            unknown or invalid.
+    """
+    models = data.get("models")
+    if not isinstance(models, dict) or not models:
+        raise ValueError("Model catalogue has no models.")
+    providers = data.get("providers", DEFAULT_PROVIDERS)
+    for name, config in providers.items():
+        if "base_url" not in config:
+            raise ValueError(f"Provider {name!r} has no base_url.")
+        if config.get("type", "openai") not in PROVIDER_TYPES:
+            raise ValueError(f"Provider {name!r} has unknown type {config['type']!r}.")
+    for model_id, config in models.items():
+        missing = [field for field in REQUIRED_FIELDS if field not in config]
+        if missing:
+            raise ValueError(f"Model {model_id!r} is missing {', '.join(missing)}.")
+        if config.get("provider", DEFAULT_PROVIDER) not in providers:
+            raise ValueError(f"Model {model_id!r} has unknown provider {config.get('provider', DEFAULT_PROVIDER)!r}.")
+    quality_thresholds = data.get("quality_thresholds", DEFAULT_QUALITY_THRESHOLDS)
+    canonical = json.dumps([models, quality_thresholds, providers], sort_keys=True, separators=(",", ":"))
+    etag = hashlib.sha256(canonical.encode()).hexdigest()[:16]
+    return Catalogue(models, quality_thresholds, providers, etag, signature)
+
+
+def load_catalogue(path: Path = MODEL_CATALOG_PATH) -> Catalogue:
+    """Read and validate a catalogue file (format by suffix: .json, .toml, .yaml/.yml).
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If it cannot be parsed or is invalid.
+    """
+    stat = path.stat()
+    raw = path.read_bytes()
+    if path.suffix == ".toml":
+        data = tomllib.loads(raw.decode())
+    elif path.suffix in (".yaml", ".yml"):
+        if yaml is None:
+            raise ValueError(f"{path} is YAML, but PyYAML is not installed.")
+        try:
+            data = yaml.safe_load(raw)
+        except yaml.YAMLError as e:
+            raise ValueError(str(e)) from e
+    else:
+        data = json.loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} does not contain a catalogue object.")
+    return parse_catalogue(data, (stat.st_mtime_ns, stat.st_size))
+
+
+_lock = threading.Lock()
+_catalogue: Catalogue = load_catalogue()
+# Models dropped by a reload, so calls still running can be billed
+_retired: dict[str, dict] = {}
+# Signature of the last file version that failed to load (warned about once)
+_failed_signature: tuple[int, int] | None = None
+
+
+def __getattr__(name: str):
+    # MODELS and QUALITY_THRESHOLDS always refer to the current catalogue
+    if name == "MODELS":
+        return _catalogue.models
+    if name == "QUALITY_THRESHOLDS":
+        return _catalogue.quality_thresholds
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_catalogue() -> Catalogue:
+    """Return the current catalogue."""
+    return _catalogue
+
+
+def get_model(model_id: str) -> dict:
+    """Return a model's definition, also for models a reload has removed.
+
+    Raises:
+        KeyError: If the model was never in a catalogue.
+    """
+    config = _catalogue.models.get(model_id)
+    return _retired[model_id] if config is None else config
+
+
+def set_catalogue(catalogue: Catalogue) -> None:
+    """Install a catalogue (replaces the current one in a single step)."""
+    global _catalogue
+    with _lock:
+        for model_id, config in _catalogue.models.items():
+            if model_id not in catalogue.models:
+                _retired[model_id] = config
+        _catalogue = catalogue
+
+
+def reload_catalogue(path: Path = MODEL_CATALOG_PATH) -> bool:
+    """Load the catalogue file again if it changed since the last load.
+
+    A file that cannot be read or is invalid (e.g. saved half-way) is
+    logged and skipped; the current catalogue stays active.
+
+    Returns:
+        True if a new catalogue was installed.
+    """
+    global _failed_signature
+    try:
+        stat = path.stat()
+    except OSError:
+        return False
+    signature = (stat.st_mtime_ns, stat.st_size)
+    if signature in (_catalogue.signature, _failed_signature):
+        return False
+    try:
+        catalogue = load_catalogue(path)
+    except (OSError, ValueError) as e:
+        logger.warning("Keeping the current model catalogue, %s is invalid: %s", path, e)
+        _failed_signature = signature
+        return False
+    set_catalogue(catalogue)
+    logger.info("Loaded model catalogue %s (%d models) from %s", catalogue.etag, len(catalogue.models), path)
+    return True
@@ -0,0 +1,152 @@
+"""Learned output token estimates, calibrated from the request log.
+
+For every (model, task type) we keep a streaming estimate of the
+OUTPUT_QUANTILE quantile (p90 by default) of output_tokens / input_tokens,
+using the P² algorithm (Jain & Chlamtac, 1985): five markers whose heights
+are nudged towards the quantile with every new observation. An update is
+O(1) in time and memory, and the state is a small JSON-serialisable dict,
+so it lives in logging_service's running aggregate and is checkpointed and
+rebuilt together with the other statistics.
+
+estimate_output_tokens uses the calibrated ratio once a (model, task type)
+has OUTPUT_CALIBRATION_MIN_SAMPLES observations and falls back to the static
+OUTPUT_MULTIPLIERS before that.
+"""
+
+import os
+
+# Quantile of the output/input ratio used for estimates (0.9 = p90)
+OUTPUT_QUANTILE = float(os.getenv("OUTPUT_QUANTILE", "0.9"))
+# Observations a (model, task type) needs before its calibrated ratio is used
+OUTPUT_CALIBRATION_MIN_SAMPLES = int(os.getenv("OUTPUT_CALIBRATION_MIN_SAMPLES", "20"))
+
+# A truncated answer (output_tokens reached max_tokens) would have been
+# longer; it is counted with this multiple of its ratio, otherwise the
+# estimate could never grow past the max_tokens it sets itself
+TRUNCATED_RATIO_FACTOR = 2.0
+
+
+def new_state(q: float = OUTPUT_QUANTILE) -> dict:
+    """Return the state of an empty quantile estimator.
+
+    Keys: "n" observations so far, "heights" of the five markers (the first
+    five observations until there are five), their actual "positions" and
+    their "desired" positions, and the quantile "q" (0–1) it estimates.
+    Other modules (estimate_accuracy) use it for their own quantiles.
+    """
+    return {
+        "q": q,
+        "n": 0,
+        "heights": [],
+        "positions": [1, 2, 3, 4, 5],
+        "desired": [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5],
+    }
+
+
+def add(state: dict, x: float) -> None:
+    """Feed one observation into a quantile estimator (P² update)."""
+    heights = state["heights"]
+    state["n"] += 1
+    if state["n"] <= 5:
+        heights.append(x)
+        heights.sort()
+        return
+
+    positions, desired = state["positions"], state["desired"]
+    # Find the cell x falls into, extending the outer markers if needed
+    if x < heights[0]:
+        heights[0] = x
+        k = 0
+    elif x >= heights[4]:
+        heights[4] = x
+        k = 3
+    else:
+        k = 0
+        while x >= heights[k + 1]:
+            k += 1
+    for i in range(k + 1, 5):
+        positions[i] += 1
+    q = state.get("q", OUTPUT_QUANTILE)
+    for i, step in enumerate((0, q / 2, q, (1 + q) / 2, 1)):
+        desired[i] += step
+
+    # Move the middle markers towards their desired positions
+    for i in (1, 2, 3):
+        d = desired[i] - positions[i]
+        if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+            d = 1 if d > 0 else -1
+            height = _parabolic(heights, positions, i, d)
+            if not heights[i - 1] < height < heights[i + 1]:
+                height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+            heights[i] = height
+            positions[i] += d
+
+
+def _parabolic(heights: list[float], positions: list[int], i: int, d: int) -> float:
+    """Piecewise-parabolic prediction of marker i's height after moving it by d."""
+    return heights[i] + d / (positions[i + 1] - positions[i - 1]) * (
+        (positions[i] - positions[i - 1] + d) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+        + (positions[i + 1] - positions[i] - d) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+    )
+
+
+def value(state: dict) -> float | None:
+    """Return the current quantile estimate (None without observations)."""
+    heights = state["heights"]
+    if not heights:
+        return None
+    if state["n"] < 5:
+        # Too few for P²: the quantile of what we have
+        return heights[min(len(heights) - 1, int(state.get("q", OUTPUT_QUANTILE) * len(heights)))]
+    return heights[2]
+
+
+def observe(calibration: dict, entry: dict) -> None:
+    """Update the calibration with one log entry.
+
+    Only calls that reached the model count: cache hits, coalesced requests
+    (copies of another call), cancelled hedge calls and streams whose client
+    disconnected say nothing about how long answers are, and entries without
+    a task type or input tokens cannot be attributed. Answers cut off at max_tokens count with
+    TRUNCATED_RATIO_FACTOR times their ratio.
+
+    Args:
+        calibration: model → task type → estimator state (updated in place).
+        entry: Log entry as written by the API.
+    """
+    model = entry.get("model")
+    task_type = entry.get("task_type")
+    input_tokens = entry.get("input_tokens")
+    output_tokens = entry.get("output_tokens")
+    if not model or not task_type or not input_tokens or output_tokens is None:
+        return
+    if entry.get("cache_hit") or entry.get("coalesced") or entry.get("cancelled") or entry.get("hedge") == "cancelled":
+        return
+    ratio = output_tokens / input_tokens
+    max_tokens = entry.get("max_tokens")
+    if max_tokens and output_tokens >= max_tokens:
+        ratio *= TRUNCATED_RATIO_FACTOR
+    states = calibration.setdefault(model, {})
+    if task_type not in states:
+        states[task_type] = new_state()
+    add(states[task_type], ratio)
+
+
+def ratios(calibration: dict, task_type: str) -> dict[str, float]:
+    """Return model → calibrated output/input ratio for a task type.
+
+    Only (model, task type) pairs with at least OUTPUT_CALIBRATION_MIN_SAMPLES
+    observations are included.
+    """
+    result = {}
+    for model, states in calibration.items():
+        state = states.get(task_type)
+        if state is not None and state["n"] >= OUTPUT_CALIBRATION_MIN_SAMPLES:
+            result[model] = value(state)
+    return result
+
+
+def all_ratios(calibration: dict) -> dict[str, dict[str, float]]:
+    """Return task type → model → calibrated ratio for every task type (see ratios)."""
+    task_types = {task_type for states in calibration.values() for task_type in states}
+    return {task_type: ratios(calibration, task_type) for task_type in task_types}
@@ -0,0 +1,180 @@
+"""Prompt compression — shrinks long prompts before routing to save input tokens.
+
+Runs before model selection for requests with "compress": true, so routing
+and the budget check already see the shorter prompt. In order, until the
+prompt fits the target token count (estimate_tokens):
+
+1. normalise whitespace: trailing spaces, runs of spaces and tabs, runs of
+   blank lines
+2. drop repeated lines and boilerplate (e-mail signatures, disclaimers,
+   unsubscribe and copyright lines)
+3. extractive ranking: the first sentence, or the first line up to a colon
+   (usually the instruction), is kept; of the remaining sentences, the ones
+   whose words are most frequent in the whole prompt are kept (each only
+   once), in their original order
+
+Code prompts only get step 1 without touching indentation, since removing
+lines or sentences would break the code.
+
+The stage's latency is measured: if its CPU cost (COMPRESSION_CPU_COST_PER_SECOND)
+is not below the price of the removed tokens at the cheapest model, the
+original prompt is used.
+"""
+
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from backend import model_config
+from backend.cost_estimator import estimate_tokens
+
+# Default target size of a compressed prompt, as a share of its original tokens
+COMPRESSION_TARGET_RATIO = float(os.getenv("COMPRESSION_TARGET_RATIO", "0.6"))
+# Cost of one CPU second in USD, compared with the price of the removed tokens
+COMPRESSION_CPU_COST_PER_SECOND = float(os.getenv("COMPRESSION_CPU_COST_PER_SECOND", "0.0001"))
+
+BOILERPLATE = re.compile(
+    r"^(sent from my \w+|get outlook for \w+|unsubscribe\b|click here to unsubscribe|"
+    r"view (this|it) in your browser|all rights reserved|copyright\b|©|"
+    r"this (e-?mail|message)( and any attachments)? (is|are|may be|may contain) (confidential|privileged)|"
+    r"please consider the environment before printing)",
+    re.IGNORECASE,
+)
+_SPACES = re.compile(r"[ \t]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# End of the instruction that rank_sentences always keeps: a sentence end or a colon
+_HEAD_END = re.compile(r"[.!?:](?=\s|$)")
+_WORD = re.compile(r"\w{4,}")     # words shorter than 4 characters are mostly stop words
+
+
+@dataclass(frozen=True)
+class Compression:
+    """Result of compressing a prompt.
+
+    Attributes:
+        prompt: The prompt to send (the original one if not applied).
+        applied: Whether the compressed prompt is used.
+        original_tokens: Estimated tokens of the original prompt.
+        compressed_tokens: Estimated tokens of the prompt to send.
+        latency_ms: Time the stage took.
+    """
+    prompt: str
+    applied: bool
+    original_tokens: int
+    compressed_tokens: int
+    latency_ms: float
+
+
+def normalize_whitespace(text: str, keep_indentation: bool = False) -> str:
+    """Strip trailing whitespace, collapse runs of spaces/tabs and blank lines."""
+    lines = text.strip().splitlines()
+    if keep_indentation:
+        lines = [line.rstrip() for line in lines]
+    else:
+        lines = [_SPACES.sub(" ", line).strip() for line in lines]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines))
+
+
+def drop_repeated_lines(text: str) -> str:
+    """Remove boilerplate lines and lines that already appeared (ignoring case)."""
+    seen = set()
+    lines = []
+    for line in text.splitlines():
+        key = line.lower()
+        if line and (key in seen or BOILERPLATE.match(line)):
+            continue
+        seen.add(key)
+        lines.append(line)
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def rank_sentences(text: str, target_tokens: int) -> str:
+    """Keep the first sentence and the highest-scoring other sentences that fit target_tokens.
+
+    The kept head ends at the first sentence end or colon of the first line,
+    so a prompt written as one long line can still be shortened. A sentence
+    scores the average prompt-wide frequency of its words, so
+    sentences about the prompt's main topics win over asides; repeated
+    sentences are kept only once. Paragraph breaks between kept sentences
+    are preserved.
+    """
+    first_line, newline, rest = text.partition("\n")
+    match = _HEAD_END.search(first_line)
+    cut = match.end() if match else len(first_line)
+    head, head_tail = first_line[:cut], first_line[cut:].strip()
+    # The rest of the first line is the start of the first paragraph
+    body = head_tail + newline + rest
+    total_tokens = estimate_tokens(text)
+    # Token share of a piece of text, proportional to its length
+    tokens_per_char = total_tokens / len(text)
+    budget = target_tokens - len(head) * tokens_per_char
+
+    sentences = []       # (paragraph, sentence)
+    for paragraph, block in enumerate(body.split("\n\n")):
+        for line in block.splitlines():
+            sentences += [(paragraph, s) for s in _SENTENCE_END.split(line) if s]
+    frequency = Counter(word for _, s in sentences for word in _WORD.findall(s.lower()))
+
+    def score(index: int) -> float:
+        words = _WORD.findall(sentences[index][1].lower())
+        return sum(frequency[word] for word in words) / len(words) if words else 0.0
+
+    keep = set()
+    kept_texts = set()
+    for index in sorted(range(len(sentences)), key=score, reverse=True):
+        normalized = sentences[index][1].lower()
+        cost = (len(normalized) + 1) * tokens_per_char
+        if normalized not in kept_texts and cost <= budget:
+            keep.add(index)
+            kept_texts.add(normalized)
+            budget -= cost
+
+    paragraphs: dict[int, list[str]] = {}
+    for index in sorted(keep):
+        paragraph, sentence = sentences[index]
+        paragraphs.setdefault(paragraph, []).append(sentence)
+    if head_tail and 0 in paragraphs:
+        # Sentences from the head's own line continue it
+        head = " ".join([head] + paragraphs.pop(0))
+    return "\n\n".join([head] + [" ".join(kept) for kept in paragraphs.values()]).strip()
+
+
+def compress_prompt(prompt: str, task_type: str, target_tokens: int | None = None) -> Compression:
+    """Compress a prompt towards target_tokens (estimated tokens).
+
+    Args:
+        prompt: The user prompt.
+        task_type: The request's task type; "code" prompts only get whitespace cleanup.
+        target_tokens: Target size; COMPRESSION_TARGET_RATIO of the original if omitted.
+
+    Returns:
+        The compression result; not applied if it saves no tokens or costs
+        more CPU time than the removed tokens are worth.
+    """
+    start = time.perf_counter()
+    original_tokens = estimate_tokens(prompt)
+    if target_tokens is None:
+        target_tokens = max(1, int(original_tokens * COMPRESSION_TARGET_RATIO))
+
+    compressed = normalize_whitespace(prompt, keep_indentation=task_type == "code")
+    if task_type != "code":
+        if estimate_tokens(compressed) > target_tokens:
+            compressed = drop_repeated_lines(compressed)
+        if estimate_tokens(compressed) > target_tokens:
+            compressed = rank_sentences(compressed, target_tokens)
+    compressed_tokens = estimate_tokens(compressed) if compressed else original_tokens
+    latency_s = time.perf_counter() - start
+
+    cheapest = min(config["input_price_per_token"] for config in model_config.MODELS.values())
+    saved = (original_tokens - compressed_tokens) * cheapest
+    applied = compressed_tokens < original_tokens and saved > latency_s * COMPRESSION_CPU_COST_PER_SECOND
+    return Compression(
+        prompt=compressed if applied else prompt,
+        applied=applied,
+        original_tokens=original_tokens,
+        compressed_tokens=compressed_tokens if applied else original_tokens,
+        latency_ms=round(latency_s * 1000, 3),
+    )
@@ -0,0 +1,123 @@
+"""LLM providers — the OpenAI-compatible chat completion APIs the router can call.
+
+Every model in the catalogue names its "provider"; the "providers" section
+of the catalogue (see model_config) defines each one:
+
+    "providers": {
+      "groq":  {"type": "groq", "base_url": "https://api.groq.com/openai/v1", "api_key_env": "GROQ_API_KEY"},
+      "local": {"base_url": "http://localhost:8080/v1", "read_timeout": 300}
+    }
+
+- type: "openai" (default; any OpenAI-compatible server, e.g. llama.cpp's
+  llama-server or vLLM) or "groq"
+- base_url: API root, requests go to <base_url>/chat/completions. The
+  environment variable <NAME>_BASE_URL (e.g. GROQ_BASE_URL) overrides it,
+  e.g. to point a provider at a local stub server.
+- api_key_env: Environment variable holding the API key (omit if the server
+  needs no authentication)
+- max_connections, max_keepalive_connections, keepalive_expiry, http2,
+  connect_timeout, read_timeout: connection pool and timeouts of the
+  provider's client, defaulting to the LLM_* environment variables
+
+llm_client keeps one pooled httpx client per provider.
+"""
+
+import os
+import re
+
+# Connection pool settings, used for every provider that does not set its own
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() in ("1", "true", "yes")
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+
+
+class Provider:
+    """An OpenAI-compatible chat completions API.
+
+    Attributes:
+        name: Provider name as used in the catalogue.
+        base_url: API root (without /chat/completions).
+        api_key_env: Environment variable with the API key, None for no authentication.
+        client_settings: Keyword arguments for llm_client.create_client.
+    """
+
+    def __init__(self, name: str, config: dict):
+        """Create a provider from its catalogue entry (see the module docstring)."""
+        self.name = name
+        env_name = re.sub(r"\W", "_", name).upper() + "_BASE_URL"
+        self.base_url = os.getenv(env_name, config["base_url"]).rstrip("/")
+        self.api_key_env = config.get("api_key_env")
+        self.client_settings = {
+            "max_connections": config.get("max_connections", LLM_MAX_CONNECTIONS),
+            "max_keepalive_connections": config.get("max_keepalive_connections", LLM_MAX_KEEPALIVE_CONNECTIONS),
+            "keepalive_expiry": config.get("keepalive_expiry", LLM_KEEPALIVE_EXPIRY),
+            "http2": config.get("http2", LLM_HTTP2),
+            "connect_timeout": config.get("connect_timeout", LLM_CONNECT_TIMEOUT),
+            "read_timeout": config.get("read_timeout", LLM_READ_TIMEOUT),
+        }
+        self._headers: dict | None = None
+
+    @property
+    def chat_url(self) -> str:
+        """URL of the chat completions endpoint."""
+        return f"{self.base_url}/chat/completions"
+
+    def headers(self) -> dict:
+        """Return the request headers, building them on the first call.
+
+        Raises:
+            RuntimeError: If the provider needs an API key and its variable is not set.
+        """
+        if self._headers is None:
+            headers = {"Content-Type": "application/json"}
+            if self.api_key_env:
+                api_key = os.getenv(self.api_key_env)
+                if not api_key:
+                    raise RuntimeError(f"{self.api_key_env} environment variable is not set.")
+                headers["Authorization"] = f"Bearer {api_key}"   # "Bearer" = standard prefix for API tokens
+            self._headers = headers
+        return self._headers
+
+    def payload(self, model: str, prompt: str, max_tokens: int, stream: bool = False) -> dict:
+        """Build the chat completion request body."""
+        payload = {
+            "model": model,                                      # which AI model to use
+            "messages": [{"role": "user", "content": prompt}],   # chat history (just 1 message)
+            "max_tokens": max_tokens,                            # limit response length
+        }
+        if stream:
+            payload["stream"] = True                             # ask for Server-Sent Events
+            payload["stream_options"] = {"include_usage": True}  # usage in the final chunk
+        return payload
+
+    def stream_usage(self, chunk: dict) -> dict | None:
+        """Return the token usage reported in a streamed chunk, if any."""
+        return chunk.get("usage")
+
+
+class GroqProvider(Provider):
+    """Groq's API: OpenAI-compatible, but may report streamed usage in "x_groq"."""
+
+    def stream_usage(self, chunk: dict) -> dict | None:
+        return chunk.get("usage") or chunk.get("x_groq", {}).get("usage")
+
+
+PROVIDER_TYPES: dict[str, type[Provider]] = {
+    "openai": Provider,
+    "groq": GroqProvider,
+}
+
+
+def build_provider(name: str, config: dict) -> Provider:
+    """Create the provider for a catalogue entry.
+
+    Raises:
+        ValueError: If the provider type is unknown.
+    """
+    provider_type = config.get("type", "openai")
+    if provider_type not in PROVIDER_TYPES:
+        raise ValueError(f"Provider {name!r} has unknown type {provider_type!r}.")
+    return PROVIDER_TYPES[provider_type](name, config)
@@ -0,0 +1,297 @@
+"""Per-model rate limiting against the provider's request and token limits.
+
+Every model with "rpm" (requests per minute) and/or "tpm" (tokens per minute)
+in MODELS gets two token buckets. Before a call the router reserves one
+request and the estimated tokens (input + output estimate); afterwards the
+reservation is corrected with the actual usage. If a bucket is empty the model
+counts as saturated and the router moves on to the next candidate instead of
+queueing the request; only batch items, which are not waited on
+interactively, wait for capacity with acquire(). When a catalogue reload changes a model's limits, its
+buckets are re-created with the new ones.
+
+The buckets also adapt to what the provider reports: the x-ratelimit-*-tokens
+response headers cap our remaining token budget at the server's view and set
+the token capacity to the server's limit, and a 429 (or a remaining count of
+zero) blocks the model until the reported reset time. Groq's request headers
+describe a per-day window, so they only block the model when it is used up.
+Malformed headers are ignored.
+"""
+
+import asyncio
+import math
+import re
+import threading
+import time
+
+from backend import model_config
+
+
+class TokenBucket:
+    """Classic token bucket: holds up to `capacity`, refills at `capacity` per minute.
+
+    Besides our own level the bucket keeps the last remaining count the server
+    reported (refilling at the same rate). The usable amount is the smaller
+    of the two, so corrections from settle() never push us past the server's view.
+    """
+
+    def __init__(self, capacity: float):
+        """Create a full bucket.
+
+        Args:
+            capacity: Maximum level, also the amount refilled per minute.
+        """
+        self.capacity = capacity
+        self.level = capacity
+        self.server_level: float | None = None
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        """Add what has accumulated since the last update."""
+        added = (now - self.updated) * self.capacity / 60
+        self.level = min(self.capacity, self.level + added)
+        if self.server_level is not None:
+            self.server_level = min(self.capacity, self.server_level + added)
+        self.updated = now
+
+    def available(self) -> float:
+        """Amount that can be taken right now."""
+        if self.server_level is None:
+            return self.level
+        return min(self.level, self.server_level)
+
+    def can_take(self, amount: float) -> bool:
+        """True if `amount` can be taken now.
+
+        Requests bigger than the whole capacity are allowed once the bucket is
+        full (the level then goes negative), otherwise they could never run.
+        """
+        return self.available() >= min(amount, self.capacity)
+
+    def take(self, amount: float) -> None:
+        """Remove `amount` from the bucket."""
+        self.level -= amount
+        if self.server_level is not None:
+            self.server_level -= amount
+
+    def give_back(self, amount: float) -> None:
+        """Return `amount` to our own level (the server's view is left alone)."""
+        self.level = min(self.capacity, self.level + amount)
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds of refilling until `amount` can be taken (0 if it can be now)."""
+        missing = min(amount, self.capacity) - self.available()
+        return max(0.0, missing * 60 / self.capacity)
+
+
+class ModelLimiter:
+    """Request and token buckets for one model."""
+
+    def __init__(self, rpm: float | None, tpm: float | None):
+        """Create the buckets; None means no limit of that kind."""
+        self.limits = (rpm, tpm)
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+
+    def refill(self, now: float) -> None:
+        """Refill both buckets."""
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.refill(now)
+
+    def try_acquire(self, tokens: int, now: float) -> bool:
+        """Reserve one request and `tokens` tokens if both are available."""
+        if now < self.blocked_until:
+            return False
+        self.refill(now)
+        if self.requests is not None and not self.requests.can_take(1):
+            return False
+        if self.tokens is not None and not self.tokens.can_take(tokens):
+            return False
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        return True
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until try_acquire(tokens) can succeed, assuming nobody else takes capacity."""
+        self.refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+
+# Parses Groq's reset durations like "2m59.56s", "7.66s", "1h2m" or "250ms"
+_DURATION = re.compile(r"(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?$")
+
+
+def parse_duration(value: str) -> float | None:
+    """Convert a rate limit reset duration to seconds (None if unparseable)."""
+    value = value.strip()
+    try:
+        return float(value)         # plain seconds, e.g. Retry-After: 2
+    except ValueError:
+        pass
+    match = _DURATION.match(value)
+    if not value or match is None:
+        return None
+    hours, minutes, seconds, millis = (float(part) if part else 0.0 for part in match.groups())
+    return hours * 3600 + minutes * 60 + seconds + millis / 1000
+
+
+def _parse_number(value: str | None) -> float | None:
+    """Parse a numeric rate limit header (None if missing or malformed)."""
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+_lock = threading.Lock()
+_limiters: dict[str, ModelLimiter | None] = {}
+# Catalogue version (etag) the limiters were created from
+_catalogue_etag: str | None = None
+
+
+def _limits(catalogue: model_config.Catalogue, model_id: str) -> tuple[float | None, float | None]:
+    """Return a model's configured (rpm, tpm), None for no limit."""
+    config = catalogue.models.get(model_id, {})
+    return config.get("rpm") or None, config.get("tpm") or None
+
+
+def _limiter(model_id: str) -> ModelLimiter | None:
+    """Return the limiter for a model, creating it from the catalogue on first use.
+
+    Must be called with _lock held.
+    """
+    global _catalogue_etag
+    catalogue = model_config.get_catalogue()
+    if catalogue.etag != _catalogue_etag:
+        # New catalogue version: re-create the limiters whose limits changed
+        for other_id, limiter in list(_limiters.items()):
+            limits = _limits(catalogue, other_id)
+            if limits != (limiter.limits if limiter is not None else (None, None)):
+                new_limiter = ModelLimiter(*limits)
+                if limiter is not None:
+                    new_limiter.blocked_until = limiter.blocked_until
+                _limiters[other_id] = new_limiter if any(limits) or new_limiter.blocked_until else None
+        _catalogue_etag = catalogue.etag
+    if model_id not in _limiters:
+        rpm, tpm = _limits(catalogue, model_id)
+        _limiters[model_id] = ModelLimiter(rpm, tpm) if rpm or tpm else None
+    return _limiters[model_id]
+
+
+def try_acquire(model_id: str, tokens: int) -> bool:
+    """Reserve capacity for one call to a model.
+
+    Args:
+        model_id: The model identifier.
+        tokens: Estimated total tokens of the call (input + output).
+
+    Returns:
+        True if the call may go ahead, False if the model is saturated.
+    """
+    with _lock:
+        limiter = _limiter(model_id)
+        return limiter is None or limiter.try_acquire(tokens, time.monotonic())
+
+
+async def acquire(model_id: str, tokens: int, timeout: float) -> bool:
+    """Wait until a model has capacity for one call, then reserve it.
+
+    Args:
+        model_id: The model identifier.
+        tokens: Estimated total tokens of the call (input + output).
+        timeout: Longest time to wait in seconds.
+
+    Returns:
+        True once the capacity is reserved, False if it would not be
+        available within `timeout` (nothing is reserved then).
+    """
+    deadline = time.monotonic() + timeout
+    while not try_acquire(model_id, tokens):
+        with _lock:
+            limiter = _limiter(model_id)
+            now = time.monotonic()
+            wait = limiter.wait_time(tokens, now) if limiter is not None else 0.0
+        if now + wait > deadline:
+            return False
+        # Others may take the capacity first; then the loop simply waits again
+        await asyncio.sleep(max(wait, 0.01))
+    return True
+
+
+def settle(model_id: str, reserved_tokens: int, actual_tokens: int) -> None:
+    """Correct a reservation with the tokens the call actually used."""
+    with _lock:
+        limiter = _limiter(model_id)
+        if limiter is not None and limiter.tokens is not None:
+            limiter.tokens.give_back(reserved_tokens - actual_tokens)
+
+
+def release(model_id: str, reserved_tokens: int) -> None:
+    """Give back a whole reservation for a call that was never sent."""
+    with _lock:
+        limiter = _limiter(model_id)
+        if limiter is None:
+            return
+        if limiter.requests is not None:
+            limiter.requests.give_back(1)
+        if limiter.tokens is not None:
+            limiter.tokens.give_back(reserved_tokens)
+
+
+def block(model_id: str, seconds: float) -> None:
+    """Treat a model as saturated for the next `seconds` seconds."""
+    with _lock:
+        limiter = _limiter(model_id)
+        if limiter is None:
+            limiter = _limiters[model_id] = ModelLimiter(None, None)
+        limiter.blocked_until = max(limiter.blocked_until, time.monotonic() + seconds)
+
+
+def update_from_headers(model_id: str, status_code: int, headers) -> None:
+    """Adapt a model's limiter to the rate limit state reported by the provider.
+
+    Args:
+        model_id: The model the response belongs to.
+        status_code: HTTP status of the response (429 blocks the model).
+        headers: Response headers (case-insensitive mapping).
+    """
+    if status_code == 429:
+        retry_after = parse_duration(headers.get("retry-after", "")) or 1.0
+        block(model_id, retry_after)
+
+    with _lock:
+        limiter = _limiter(model_id)
+        if limiter is None:
+            return
+        now = time.monotonic()
+        limiter.refill(now)
+
+        # The server's token limit (per minute) is authoritative for the bucket size
+        limit_tokens = _parse_number(headers.get("x-ratelimit-limit-tokens"))
+        if limit_tokens is not None and limit_tokens > 0 and limiter.tokens is not None:
+            limiter.tokens.capacity = limit_tokens
+
+        # Tokens are a per-minute window, like our bucket: cap our level at the server's
+        remaining_tokens = _parse_number(headers.get("x-ratelimit-remaining-tokens"))
+        if remaining_tokens is not None and limiter.tokens is not None:
+            limiter.tokens.server_level = remaining_tokens
+
+        # Requests are counted per day (RPD) by Groq, so they cannot correct the
+        # per-minute request bucket; an exhausted window of either kind blocks the model
+        for kind in ("requests", "tokens"):
+            remaining = _parse_number(headers.get(f"x-ratelimit-remaining-{kind}"))
+            if remaining is not None and remaining <= 0:
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}", ""))
+                if reset:
+                    limiter.blocked_until = max(limiter.blocked_until, now + reset)
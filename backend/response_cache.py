@@ -0,0 +1,255 @@
+"""Response cache — reuses LLM answers for identical requests.
+
+Requests are identified by a hash of (model ID, prompt, max_tokens). Two
+backends are available, chosen with RESPONSE_CACHE_BACKEND:
+
+- "memory" (default): in-process LRU with a time-to-live and a size limit in bytes
+- "sqlite": on-disk cache shared by all worker processes, same TTL and size limit
+- "off": no caching
+
+Any object with get(key) and set(key, value) methods can be installed with
+set_cache(), e.g. a cache backed by another store. Backends that do I/O set
+blocking = True; the API then calls them in a worker thread, off the event
+loop. The SQLite backend treats database errors (e.g. a database locked by
+another worker for longer than its busy timeout) as a miss or a skipped
+store, so a cache problem never fails a request.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Protocol
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_PATH = Path(
+    os.getenv("RESPONSE_CACHE_PATH", Path(__file__).resolve().parent.parent / "logs" / "response_cache.sqlite3")
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache(Protocol):
+    """Interface every cache backend implements (optionally with a blocking attribute, see above)."""
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached response for key, or None if missing or expired."""
+
+    def set(self, key: str, value: dict) -> None:
+        """Store a response under key."""
+
+
+def cache_key(model_id: str, prompt: str, max_tokens: int) -> str:
+    """Return the cache key for a request.
+
+    Args:
+        model_id: The model identifier.
+        prompt: The user prompt.
+        max_tokens: The max_tokens sent to the model.
+
+    Returns:
+        Hex SHA-256 digest of the three values.
+    """
+    return hashlib.sha256(json.dumps([model_id, prompt, max_tokens]).encode()).hexdigest()
+
+
+def _size_of(value: dict) -> int:
+    """Approximate memory/disk size of a cached response in bytes."""
+    return len(json.dumps(value).encode())
+
+
+class MemoryCache:
+    """In-process LRU cache with a TTL and a total size limit in bytes."""
+
+    blocking = False
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        """Configure the cache.
+
+        Args:
+            ttl: Seconds an entry stays valid.
+            max_bytes: Least recently used entries are evicted above this size.
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        # key → (expires_at, size, value); order = least recently used first
+        self._entries: OrderedDict[str, tuple[float, int, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.size -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict) -> None:
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+
+class SQLiteCache:
+    """On-disk cache in a SQLite database, shared by all worker processes.
+
+    The total size of the entries is kept in the totals table by triggers,
+    so eviction does not sum the whole table on every store. A hit only
+    rewrites the entry's last use (a write, which locks the database for all
+    workers) if it is more than USED_AT_RESOLUTION seconds old.
+    """
+
+    blocking = True
+    USED_AT_RESOLUTION = 60.0
+
+    def __init__(
+        self,
+        path: Path = RESPONSE_CACHE_PATH,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        timeout: float = 1.0,
+    ):
+        """Open (and create if needed) the cache database.
+
+        Args:
+            path: Database file.
+            ttl: Seconds an entry stays valid.
+            max_bytes: Least recently used entries are evicted above this size.
+            timeout: Seconds to wait for a database locked by another worker
+                before giving up (a miss, or the answer is not stored).
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=timeout)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,
+                expires_at REAL NOT NULL, used_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at);
+            CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at);
+            CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL);
+            INSERT OR IGNORE INTO totals VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM responses));
+            CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses
+                BEGIN UPDATE totals SET size = size + NEW.size; END;
+            CREATE TRIGGER IF NOT EXISTS responses_update AFTER UPDATE OF size ON responses
+                BEGIN UPDATE totals SET size = size - OLD.size + NEW.size; END;
+            CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses
+                BEGIN UPDATE totals SET size = size - OLD.size; END;
+            COMMIT;
+        """)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT value, used_at FROM responses WHERE key = ? AND expires_at >= ?", (key, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] > self.USED_AT_RESOLUTION:
+                    self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.warning("Response cache lookup failed, treating it as a miss: %s", e)
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict) -> None:
+        data = json.dumps(value)
+        size = len(data.encode())
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    # An upsert, not INSERT OR REPLACE: the rows REPLACE deletes do not fire the delete trigger
+                    self._db.execute(
+                        "INSERT INTO responses (key, value, size, expires_at, used_at) VALUES (?, ?, ?, ?, ?)"
+                        " ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,"
+                        " expires_at = excluded.expires_at, used_at = excluded.used_at",
+                        (key, data, size, now + self.ttl, now),
+                    )
+                    self._evict(now)
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            logger.warning("Response cache store failed, answer not cached: %s", e)
+
+    def nbytes(self) -> int:
+        """Total size of the cached entries in bytes."""
+        with self._lock:
+            return self._db.execute("SELECT size FROM totals").fetchone()[0]
+
+    def _evict(self, now: float) -> None:
+        """Drop expired entries, then least recently used ones until under max_bytes.
+
+        Both use an index, so they only read the rows they delete.
+        """
+        self._db.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+        total = self._db.execute("SELECT size FROM totals").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        stale = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY used_at"):
+            stale.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        self._db.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+
+def _create_cache() -> ResponseCache | None:
+    """Build the cache selected by RESPONSE_CACHE_BACKEND."""
+    if RESPONSE_CACHE_BACKEND == "memory":
+        return MemoryCache()
+    if RESPONSE_CACHE_BACKEND == "sqlite":
+        return SQLiteCache()
+    if RESPONSE_CACHE_BACKEND == "off":
+        return None
+    raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {RESPONSE_CACHE_BACKEND!r}")
+
+
+_cache: ResponseCache | None = _create_cache()
+
+
+def get_cache() -> ResponseCache | None:
+    """Return the active cache (None if caching is off)."""
+    return _cache
+
+
+def set_cache(cache: ResponseCache | None) -> None:
+    """Install a different cache backend (None disables caching)."""
+    global _cache
+    _cache = cache
@@ -1,11 +1,208 @@
-"""Model selection algorithm based on task type, budget, and quality."""
+"""Model selection algorithm based on task type, budget, and quality.
 
-from backend.budget_guard import check_budget
-from backend.model_config import MODELS, QUALITY_THRESHOLDS
+All per-model data the algorithm needs (prices, max tokens, quality scores,
+strengths, tokenizer families) is precomputed into a RoutingIndex of numpy arrays once per
+catalogue version, on the first request after it was loaded. Selecting a model is then one
+vectorized cost computation over the whole catalogue plus a short scan of the
+candidates in pre-sorted score order.
+"""
+
+import threading
+from collections.abc import Collection
+from dataclasses import dataclass
+
+import numpy as np
+
+from backend import model_config, tokenizer
+from backend.cost_estimator import MIN_OUTPUT_TOKENS, OUTPUT_MULTIPLIERS, PromptAnalysis, analyze_prompt
+from backend.logging_service import get_output_ratios
+
+# Score bonus for models that list the task type among their strengths
+STRENGTH_BONUS = 15
+
+# Task types with a strength bit; unknown task types get no bonus
+TASK_TYPES = ("general", "code", "email", "summarize")
+
+
+@dataclass(frozen=True)
+class RoutingIndex:
+    """Precomputed, array-based view of a model catalogue.
+
+    Attributes:
+        model_ids: Model IDs in catalogue order (array position = model index).
+        names: Display names in catalogue order.
+        positions: Model ID → array position.
+        input_price: Input price per token for each model.
+        output_price: Output price per token for each model.
+        max_tokens: Max output tokens for each model.
+        quality_score: Base quality score for each model.
+        strength_mask: Bitmask of TASK_TYPES each model is strong at.
+        quality_masks: Per quality level, which models meet its threshold.
+        scores: Per task type (None = no bonus), the score of each model.
+        order: Per task type (None = no bonus), model indices sorted by
+            score, best first (catalogue order on ties).
+        tokenizers: Per tokenizer family, the indices of its models.
+    """
+    model_ids: tuple[str, ...]
+    names: tuple[str, ...]
+    positions: dict[str, int]
+    input_price: np.ndarray
+    output_price: np.ndarray
+    max_tokens: np.ndarray
+    quality_score: np.ndarray
+    strength_mask: np.ndarray
+    quality_masks: dict[str, np.ndarray]
+    scores: dict[str | None, np.ndarray]
+    order: dict[str | None, np.ndarray]
+    tokenizers: dict[str, np.ndarray]
+
+
+def build_routing_index(
+    models: dict, quality_thresholds: dict = model_config.DEFAULT_QUALITY_THRESHOLDS
+) -> RoutingIndex:
+    """Precompute the routing arrays for a model catalogue.
+
+    Args:
+        models: Catalogue in the MODELS format.
+        quality_thresholds: Minimum quality score per quality level.
+
+    Returns:
+        RoutingIndex for the catalogue.
+    """
+    configs = list(models.values())
+    quality_score = np.array([c["quality_score"] for c in configs], dtype=np.float64)
+    strength_mask = np.array(
+        [sum(1 << bit for bit, task in enumerate(TASK_TYPES) if task in c["strengths"]) for c in configs],
+        dtype=np.int64,
+    )
+
+    scores = {None: quality_score}
+    for bit, task in enumerate(TASK_TYPES):
+        has_strength = (strength_mask >> bit) & 1
+        scores[task] = quality_score + STRENGTH_BONUS * has_strength
+    # Stable sort keeps catalogue order for equal scores
+    order = {task: np.argsort(-task_scores, kind="stable") for task, task_scores in scores.items()}
+    families = [c.get("tokenizer") for c in configs]
+
+    return RoutingIndex(
+        model_ids=tuple(models),
+        names=tuple(c["name"] for c in configs),
+        positions={model_id: i for i, model_id in enumerate(models)},
+        input_price=np.array([c["input_price_per_token"] for c in configs], dtype=np.float64),
+        output_price=np.array([c["output_price_per_token"] for c in configs], dtype=np.float64),
+        max_tokens=np.array([c["max_tokens"] for c in configs], dtype=np.int64),
+        quality_score=quality_score,
+        strength_mask=strength_mask,
+        quality_masks={level: quality_score >= threshold for level, threshold in quality_thresholds.items()},
+        scores=scores,
+        order=order,
+        tokenizers={
+            family: np.array([i for i, f in enumerate(families) if f == family], dtype=np.int64)
+            for family in dict.fromkeys(families) if family is not None
+        },
+    )
+
+
+_index_lock = threading.Lock()
+# (catalogue etag, index built from it)
+_index: tuple[str, RoutingIndex] | None = None
+
+
+def get_routing_index() -> RoutingIndex:
+    """Return the routing index of the current catalogue, building it once per catalogue version."""
+    catalogue = model_config.get_catalogue()
+    cached = _index
+    if cached is None or cached[0] != catalogue.etag:
+        cached = _rebuild(catalogue)
+    return cached[1]
+
+
+def _rebuild(catalogue: model_config.Catalogue) -> tuple[str, RoutingIndex]:
+    global _index
+    with _index_lock:
+        if _index is None or _index[0] != catalogue.etag:
+            _index = (catalogue.etag, build_routing_index(catalogue.models, catalogue.quality_thresholds))
+        return _index
+
+
+def input_token_counts(index: RoutingIndex, prompt: str, analysis: PromptAnalysis) -> int | np.ndarray:
+    """Return the input tokens of a prompt for every model in the index.
+
+    Models whose tokenizer is available get its exact count, all others the
+    heuristic estimate from the analysis.
+
+    Returns:
+        The heuristic estimate if no tokenizer is available (the same for
+        every model), otherwise an array with one count per model.
+    """
+    counts = None
+    for family, positions in index.tokenizers.items():
+        count = tokenizer.count_tokens(family, prompt)
+        if count is None:
+            continue
+        if counts is None:
+            counts = np.full(len(index.model_ids), analysis.tokens, dtype=np.int64)
+        counts[positions] = max(1, count)
+    return analysis.tokens if counts is None else counts
+
+
+def output_multipliers(index: RoutingIndex, task_type: str) -> np.ndarray:
+    """Return the output/input token ratio of every model for a task type.
+
+    Vectorized version of cost_estimator.output_multiplier: calibrated
+    ratios where available, the static multiplier for all other models.
+    """
+    multipliers = np.full(len(index.model_ids), OUTPUT_MULTIPLIERS.get(task_type, 1.5))
+    for model_id, ratio in get_output_ratios(task_type).items():
+        position = index.positions.get(model_id)
+        if position is not None:
+            multipliers[position] = ratio
+    return multipliers
+
+
+def estimate_costs(index: RoutingIndex, input_tokens: int | np.ndarray, task_type: str) -> np.ndarray:
+    """Estimate the cost of a request for every model in the index at once.
+
+    Vectorized version of estimate_output_tokens + estimate_cost.
+
+    Args:
+        index: Routing index of the catalogue.
+        input_tokens: Input tokens of the prompt, one count for all models or
+            one per model (see input_token_counts).
+        task_type: Task category (drives the output token estimate).
+
+    Returns:
+        Array of unrounded estimated costs in USD, one per model
+        (estimate_cost rounds the same values to 8 decimal places).
+    """
+    multipliers = output_multipliers(index, task_type)
+    min_output = MIN_OUTPUT_TOKENS.get(task_type, 150)
+    output_tokens = np.minimum(
+        np.maximum(min_output, (np.asarray(input_tokens) * multipliers).astype(np.int64)), index.max_tokens
+    )
+    return input_tokens * index.input_price + output_tokens * index.output_price
+
+
+def affordable_mask(costs: np.ndarray, budget: float) -> np.ndarray:
+    """Return which costs fit the budget after rounding like estimate_cost.
+
+    np.round can differ from Python's round() in the last digit, so costs
+    within one rounding step of the budget are re-checked with round().
+    """
+    affordable = costs <= budget
+    for i in np.flatnonzero(np.abs(costs - budget) < 1e-8):
+        affordable[i] = round(float(costs[i]), 8) <= budget
+    return affordable
 
 
 def select_model(
-    prompt: str, task_type: str, budget: float, quality: str
+    prompt: str,
+    task_type: str,
+    budget: float,
+    quality: str,
+    analysis: PromptAnalysis | None = None,
+    index: RoutingIndex | None = None,
+    exclude: Collection[str] = (),
 ) -> tuple[str, str]:
     """Select the best model based on task type, budget, and quality.
 
@@ -19,6 +216,10 @@ def select_model(
         task_type: Task category (e.g. "general", "code", "email", "summarize").
         budget: Maximum budget in USD.
         quality: Desired quality level ("low", "medium", "high").
+        analysis: Precomputed analysis of the prompt; computed if omitted.
+        index: Routing index to select from; defaults to the current catalogue's.
+        exclude: Model IDs to skip (e.g. saturated ones), so the next-best
+            candidate is chosen instead.
 
     Returns:
         Tuple of (model_id, reason).
@@ -26,38 +227,110 @@ def select_model(
     Raises:
         ValueError: If no model fits within the given budget.
     """
-    min_quality_score = QUALITY_THRESHOLDS[quality]
-    candidates = []
+    if analysis is None:
+        analysis = analyze_prompt(prompt)
+    if index is None:
+        index = get_routing_index()
 
-    for model_id, config in MODELS.items():
-        if config["quality_score"] < min_quality_score:
-            continue
-        is_affordable, estimated_cost = check_budget(model_id, prompt, budget, task_type)
-        if not is_affordable:
+    costs = estimate_costs(index, input_token_counts(index, prompt, analysis), task_type)
+    return _pick_model(index, costs, task_type, budget, quality, exclude)
+
+
+def select_models(
+    requests: list[tuple[str, str, float, str]],
+    analyses: list[PromptAnalysis] | None = None,
+    index: RoutingIndex | None = None,
+) -> list[tuple[str, str] | ValueError]:
+    """Select models for a whole batch of requests at once.
+
+    Counts the input tokens of all prompts per tokenizer family in one batch
+    and estimates the cost of every (request, model) pair in one vectorized
+    step, then applies the select_model rules to each request.
+
+    Args:
+        requests: (prompt, task_type, budget, quality) per request.
+        analyses: Precomputed prompt analyses in the same order; computed if omitted.
+        index: Routing index to select from; defaults to the current catalogue's.
+
+    Returns:
+        Per request, in order: (model_id, reason), or the ValueError
+        select_model would have raised if no model fits the budget.
+    """
+    if analyses is None:
+        analyses = [analyze_prompt(prompt) for prompt, _, _, _ in requests]
+    if index is None:
+        index = get_routing_index()
+    if not requests:
+        return []
+
+    task_types = [task_type for _, task_type, _, _ in requests]
+    # Output ratios: one row per request, one column per model
+    by_task = {task: output_multipliers(index, task) for task in set(task_types)}
+    multipliers = np.array([by_task[task] for task in task_types])
+    min_outputs = np.array([MIN_OUTPUT_TOKENS.get(task, 150) for task in task_types], dtype=np.int64)
+
+    # Input tokens: one row per request, one column per model (or a single
+    # column while no tokenizer is available)
+    input_tokens = np.array([analysis.tokens for analysis in analyses], dtype=np.int64)[:, None]
+    prompts = [prompt for prompt, _, _, _ in requests]
+    for family, positions in index.tokenizers.items():
+        counts = tokenizer.count_tokens_batch(family, prompts)
+        if counts is None:
             continue
-        score = config["quality_score"]
-        if task_type in config["strengths"]:
-            score += 15
+        if input_tokens.shape[1] == 1:
+            input_tokens = np.repeat(input_tokens, len(index.model_ids), axis=1)
+        input_tokens[:, positions] = np.maximum(1, np.array(counts, dtype=np.int64))[:, None]
+
+    # Same formula as estimate_costs
+    output_tokens = np.maximum(min_outputs[:, None], (input_tokens * multipliers).astype(np.int64))
+    output_tokens = np.minimum(output_tokens, index.max_tokens[None, :])
+    costs = input_tokens * index.input_price + output_tokens * index.output_price
+
+    results = []
+    for row, (_, task_type, budget, quality) in zip(costs, requests):
+        try:
+            results.append(_pick_model(index, row, task_type, budget, quality))
+        except ValueError as e:
+            results.append(e)
+    return results
+
 
-        candidates.append((model_id, score, estimated_cost))
+def _pick_model(
+    index: RoutingIndex,
+    costs: np.ndarray,
+    task_type: str,
+    budget: float,
+    quality: str,
+    exclude: Collection[str] = (),
+) -> tuple[str, str]:
+    """Apply the selection rules to precomputed per-model costs (see select_model)."""
+    affordable = affordable_mask(costs, budget)
+    for model_id in exclude:
+        position = index.positions.get(model_id)
+        if position is not None:
+            affordable[position] = False
+    task_key = task_type if task_type in TASK_TYPES else None
+    scores = index.scores[task_key]
+    order = index.order[task_key]
+
+    # Affordable models that meet the quality threshold, best score first
+    ranked = order[(index.quality_masks[quality] & affordable)[order]]
 
-    if not candidates:
+    if ranked.size == 0:
         # Fallback: find the cheapest affordable model ignoring quality
-        affordable_models = []
-        for model_id, config in MODELS.items():
-            is_affordable, estimated_cost = check_budget(model_id, prompt, budget, task_type)
-            if is_affordable:
-                affordable_models.append((model_id, estimated_cost))
-        if not affordable_models:
+        affordable_idx = np.flatnonzero(affordable)
+        if affordable_idx.size == 0:
             raise ValueError("No model fits within the given budget.")
-        affordable_models.sort(key=lambda c: c[1])
-        return (affordable_models[0][0], "Fallback: only model within budget")
-
-    # Best score first; cheapest first on tie
-    candidates.sort(key=lambda c: (-c[1], c[2]))
-    best_model_id = candidates[0][0]
-    model_name = MODELS[best_model_id]["name"]
-    score = candidates[0][1]
-    estimated_cost = candidates[0][2]
+        best = affordable_idx[np.argmin(costs[affordable_idx])]
+        return (index.model_ids[best], "Fallback: only model within budget")
+
+    # Best score first; cheapest first on tie (ties form a prefix of ranked)
+    score = scores[ranked[0]]
+    ties = ranked[: np.count_nonzero(scores[ranked] == score)]
+    best = ties[np.argmin(costs[ties])]
+
+    best_model_id = index.model_ids[best]
+    model_name = index.names[best]
+    estimated_cost = round(float(costs[best]), 8)
     reason = f"Best match: {model_name} (score {score:.0f}, est. cost ${estimated_cost:.8f})"
-    return (best_model_id, reason)
\ No newline at end of file
+    return (best_model_id, reason)
@@ -11,11 +11,41 @@ class RouteRequest(BaseModel):
         task_type: Task category — "general", "code", "email", or "summarize".
         budget: Maximum budget in USD (must be > 0).
         quality: Desired quality level (default "medium").
+        max_latency_ms: Optional latency target; models whose recent p95
+            latency is above it are skipped.
+        hedge: If True and the chosen model is slower than its recent p95,
+            the prompt is also sent to the next-best model that fits the
+            remaining budget and the first answer wins.
+        compress: If True, the prompt is compressed before routing (see
+            backend.prompt_compressor).
+        compress_target_tokens: Target size of the compressed prompt in
+            estimated tokens (default: COMPRESSION_TARGET_RATIO of the original).
     """
     prompt: str = Field(..., min_length=1, max_length=10000)
     task_type: str = Field(..., pattern="^(general|code|email|summarize)$")
     budget: float = Field(..., gt=0)
     quality: str = Field(default="medium")
+    max_latency_ms: float | None = Field(default=None, gt=0)
+    hedge: bool = False
+    compress: bool = False
+    compress_target_tokens: int | None = Field(default=None, gt=0)
+
+
+class CompressionInfo(BaseModel):
+    """Effect of the prompt compression stage.
+
+    Attributes:
+        applied: Whether the compressed prompt was sent.
+        original_tokens: Estimated tokens of the original prompt.
+        compressed_tokens: Estimated tokens of the prompt that was sent.
+        saved_cost: Price of the removed tokens at the chosen model in USD.
+        latency_ms: Time the compression stage took.
+    """
+    applied: bool
+    original_tokens: int
+    compressed_tokens: int
+    saved_cost: float
+    latency_ms: float
 
 
 class RouteResponse(BaseModel):
@@ -28,6 +58,12 @@ class RouteResponse(BaseModel):
         actual_cost: Actual cost after the API call in USD.
         tokens_used: Total number of tokens consumed.
         routing_reason: Explanation for the model choice.
+        cached: True if the answer came from the response cache (no cost).
+        coalesced: True if the answer came from the LLM call of an identical
+            request in flight at the same time (no cost).
+        hedged: True if a backup model was called as well; actual_cost then
+            includes the cost of both calls.
+        compression: Effect of prompt compression, if the request asked for it.
     """
     model: str
     response: str
@@ -35,6 +71,50 @@ class RouteResponse(BaseModel):
     actual_cost: float
     tokens_used: int
     routing_reason: str
+    cached: bool = False
+    coalesced: bool = False
+    hedged: bool = False
+    compression: CompressionInfo | None = None
+
+
+class BatchRouteRequest(BaseModel):
+    """Batch of routing requests.
+
+    Attributes:
+        requests: The individual requests (1–1000), each with its own budget.
+        budget: Optional total budget in USD for the whole batch. A batch
+            whose estimated costs add up to more is rejected as a whole.
+    """
+    requests: list[RouteRequest] = Field(..., min_length=1, max_length=1000)
+    budget: float | None = Field(default=None, gt=0)
+
+
+class BatchItemResult(BaseModel):
+    """Outcome of one item in a batch.
+
+    Attributes:
+        index: Position of the item in the batch request.
+        status_code: HTTP status the item would have had on /route.
+        result: The routing response if the item succeeded.
+        error: Error message if the item failed.
+    """
+    index: int
+    status_code: int
+    result: RouteResponse | None = None
+    error: str | None = None
+
+
+class BatchRouteResponse(BaseModel):
+    """Response for a batch of routing requests.
+
+    Attributes:
+        results: One result per request, in request order.
+        total_estimated_cost: Sum of estimated costs of the routable items in USD.
+        total_actual_cost: Sum of actual costs of the successful items in USD.
+    """
+    results: list[BatchItemResult]
+    total_estimated_cost: float
+    total_actual_cost: float
 
 
 class HealthResponse(BaseModel):
@@ -46,6 +126,161 @@ class HealthResponse(BaseModel):
     status: str
 
 
+class ModelInfo(BaseModel):
+    """One model of the catalogue.
+
+    Attributes:
+        name: Display name.
+        provider: Provider that serves the model.
+        input_price_per_token: Price per input token in USD.
+        output_price_per_token: Price per output token in USD.
+        quality_score: Base quality score used for routing.
+        strengths: Task types the model is strong at.
+        max_tokens: Maximum output tokens.
+        tokenizer: Tokenizer family, None if unknown.
+        rpm: Requests per minute limit, None if unlimited.
+        tpm: Tokens per minute limit, None if unlimited.
+    """
+    name: str
+    provider: str = "groq"
+    input_price_per_token: float
+    output_price_per_token: float
+    quality_score: float
+    strengths: list[str]
+    max_tokens: int
+    tokenizer: str | None = None
+    rpm: int | None = None
+    tpm: int | None = None
+
+
+class ModelsResponse(BaseModel):
+    """The model catalogue.
+
+    Attributes:
+        models: Model ID → model.
+        quality_thresholds: Minimum quality score per quality level.
+    """
+    models: dict[str, ModelInfo]
+    quality_thresholds: dict[str, float]
+
+
+class ModelLatencyStats(BaseModel):
+    """Recent latency of one model.
+
+    Attributes:
+        samples: Number of calls in the rolling window.
+        p50_ms: Median latency in ms.
+        p95_ms: 95th percentile latency in ms.
+        ewma_ms: Moving average of the latency in ms.
+        tokens_per_second: Moving average of the output speed.
+    """
+    samples: int
+    p50_ms: float | None
+    p95_ms: float | None
+    ewma_ms: float | None
+    tokens_per_second: float | None
+
+
+class CircuitBreakerStats(BaseModel):
+    """Circuit breaker state of one model.
+
+    Attributes:
+        state: "closed", "open" or "half_open" (a trial call is allowed).
+        recent_failures: Failed calls within the breaker's window.
+        opens: How often the breaker has opened since the server started.
+        retry_in_s: Seconds until an open breaker lets a trial call through.
+    """
+    state: str
+    recent_failures: int
+    opens: int
+    retry_in_s: float
+
+
+class ErrorDistribution(BaseModel):
+    """Relative errors of one estimated quantity ((estimate - actual) / actual).
+
+    Attributes:
+        samples: Number of calls observed.
+        p50_error: Median absolute relative error (0.25 = 25%).
+        p90_error: 90th percentile absolute relative error.
+        mean_error: Mean signed error; positive means the estimates run high.
+        exceeded: Share of calls whose actual value was above the estimate.
+        drift: True if p90_error (input tokens) or exceeded (output tokens,
+            cost) is above its threshold.
+    """
+    samples: int
+    p50_error: float
+    p90_error: float
+    mean_error: float
+    exceeded: float
+    drift: bool
+
+
+class EstimateAccuracy(BaseModel):
+    """Estimate errors of one model for one task type.
+
+    Attributes:
+        model: Model ID.
+        task_type: Task type.
+        drift: True if any of the quantities drifts.
+        input_tokens: Errors of the input token estimate.
+        output_tokens: Errors of the output token estimate (deliberately high).
+        cost: Errors of the cost estimate.
+    """
+    model: str
+    task_type: str
+    drift: bool
+    input_tokens: ErrorDistribution | None = None
+    output_tokens: ErrorDistribution | None = None
+    cost: ErrorDistribution | None = None
+
+
+class AccuracyResponse(BaseModel):
+    """Accuracy of the pre-call estimates.
+
+    Attributes:
+        drift_threshold: p90 relative error above which input token estimates drift.
+        exceeded_threshold: Share of calls above their estimate from which
+            output token and cost estimates drift.
+        min_samples: Calls needed before a quantity can drift.
+        drifting: Number of (model, task type) pairs with a drifting quantity.
+        estimates: One entry per (model, task type) with logged calls.
+    """
+    drift_threshold: float
+    exceeded_threshold: float
+    min_samples: int
+    drifting: int
+    estimates: list[EstimateAccuracy]
+
+
+class BucketModelStats(BaseModel):
+    """Usage of one model within one time bucket.
+
+    Attributes:
+        requests: Number of requests.
+        input_tokens: Sum of input tokens.
+        output_tokens: Sum of output tokens.
+        cost: Sum of actual costs in USD.
+        avg_latency_ms: Mean latency of the calls that reported one.
+    """
+    requests: int
+    input_tokens: int
+    output_tokens: int
+    cost: float
+    avg_latency_ms: float | None
+
+
+class StatsBucket(BaseModel):
+    """One time bucket of a /stats series.
+
+    Attributes:
+        start: Bucket start in milliseconds since the epoch.
+        models: Usage per model ID.
+    """
+    start: int
+    models: dict[str, BucketModelStats]
+
+
 class StatsResponse(BaseModel):
     """Usage statistics response.
 
@@ -53,10 +288,57 @@ class StatsResponse(BaseModel):
         total_requests: Total number of requests served.
         total_cost: Cumulative cost in USD.
         average_cost: Mean cost per request in USD.
+        total_input_tokens: Sum of input tokens over all requests.
+        total_output_tokens: Sum of output tokens over all requests.
+        cache_hits: Requests answered from the response cache.
+        cache_hit_rate: Share of requests answered from the cache (0–1).
+        cache_savings: Cost in USD avoided by cache hits.
         model_usage: Request count per model ID.
+        latency: Recent latency per model ID.
+        circuit_breakers: Circuit breaker state per model ID (models that failed so far).
+        series: Per-model usage in time buckets; only present if a time
+            range was requested.
     """
 
     total_requests: int
     total_cost: float
     average_cost: float
-    model_usage: dict[str, int]
\ No newline at end of file
+    total_input_tokens: int = 0
+    total_output_tokens: int = 0
+    cache_hits: int = 0
+    cache_hit_rate: float = 0.0
+    cache_savings: float = 0.0
+    model_usage: dict[str, int]
+    latency: dict[str, ModelLatencyStats] = {}
+    circuit_breakers: dict[str, CircuitBreakerStats] = {}
+    series: list[StatsBucket] | None = None
+
+
+class SpendPeriod(BaseModel):
+    """A tenant's spend in one ledger period.
+
+    Attributes:
+        period: The period, e.g. "2026-02-12" (day) or "2026-02" (month), UTC.
+        spent: Settled cost in USD.
+        reserved: Estimated cost in USD of calls still in flight.
+        cap: Spend cap in USD for the period, None if unlimited.
+    """
+
+    period: str
+    spent: float
+    reserved: float
+    cap: float | None = None
+
+
+class SpendResponse(BaseModel):
+    """Spend ledger of the calling tenant.
+
+    Attributes:
+        tenant: Tenant the request was attributed to.
+        daily: Spend for the current day.
+        monthly: Spend for the current month.
+    """
+
+    tenant: str
+    daily: SpendPeriod
+    monthly: SpendPeriod
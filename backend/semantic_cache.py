@@ -0,0 +1,319 @@
+"""Semantic response cache — reuses LLM answers for near-duplicate prompts.
+
+The exact cache (response_cache) only helps if a prompt comes again byte for
+byte. This cache also answers prompts that differ in whitespace, case,
+dates or a few words: every prompt is turned into a vector by a hashing
+vectoriser (word unigrams and bigrams plus character trigrams, hashed into
+SEMANTIC_CACHE_DIM signed buckets, recognised dates folded into one token,
+L2-normalised), and a request is answered from the cache if a stored prompt
+for the same model and task type has a cosine similarity of at least
+SEMANTIC_CACHE_THRESHOLD and the same other numbers, in the same order.
+"What is 2+2?" and "What is 7+9?" are nearly the same text but not the same
+question, so no similarity threshold could tell them apart.
+
+Vectors live in numpy arrays, one partition per (model, task type). A
+partition is searched exhaustively (one matrix-vector product) until it
+holds SEMANTIC_CACHE_IVF_THRESHOLD entries; from then on it is an IVF index:
+k-means centroids split the vectors into about sqrt(n) lists, and a lookup
+only scans the SEMANTIC_CACHE_NPROBE lists with the closest centroids. The
+centroids are retrained whenever a partition has doubled since the last
+training.
+
+Entries expire after RESPONSE_CACHE_TTL seconds, and the least recently
+used ones (across all partitions) are evicted once vectors plus answers
+exceed SEMANTIC_CACHE_MAX_BYTES (the vector arrays grow in doubling steps,
+so up to twice the vectors' share may be allocated). python -m benchmarks.bench_semantic_cache
+measures index size, recall and lookup latency.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from backend.response_cache import RESPONSE_CACHE_TTL
+
+# "on" enables the semantic cache (off by default: a near-duplicate is not always the same question)
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "off")
+# Minimum cosine similarity (0–1) for a cached answer to be reused
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_BYTES = int(os.getenv("SEMANTIC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Vector dimensions of the hashing vectoriser
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "512"))
+# Partition size from which an IVF index is used instead of exhaustive search
+SEMANTIC_CACHE_IVF_THRESHOLD = int(os.getenv("SEMANTIC_CACHE_IVF_THRESHOLD", "2048"))
+# IVF lists scanned per lookup
+SEMANTIC_CACHE_NPROBE = int(os.getenv("SEMANTIC_CACHE_NPROBE", "8"))
+
+# Lloyd iterations when (re)training the IVF centroids
+_KMEANS_ITERATIONS = 8
+# At most this many vectors per centroid are used for training
+_KMEANS_SAMPLE_PER_LIST = 32
+
+_WORD = re.compile(r"\w+")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_MONTH = r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?" \
+         r"|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+_DAY = r"\d{1,2}(?:st|nd|rd|th)?"
+# Dates in the lower-cased text: 2024-03-15 (with an optional time), 15/03/2024, 15.3.24,
+# 2024/03/15, "15 march 2024", "15th of march", "march 15, 2024", "mar. 15"
+_DATE = re.compile(
+    r"\b\d{4}-\d{1,2}-\d{1,2}(?:[t ]\d{1,2}:\d{2}(?::\d{2})?)?\b"
+    r"|\b\d{1,2}[/.]\d{1,2}[/.](?:\d{4}|\d{2})\b"
+    r"|\b\d{4}/\d{1,2}/\d{1,2}\b"
+    rf"|\b{_DAY}(?: of)? {_MONTH}\b(?:,? \d{{4}}\b)?"
+    rf"|\b{_MONTH}\.? {_DAY}\b(?:,? \d{{4}}\b)?"
+)
+
+
+@lru_cache(maxsize=1024)
+def _fold_dates(text: str) -> str:
+    """Return the lower-cased text with every recognised date replaced by one token."""
+    return _DATE.sub(" _date_ ", text.lower())
+
+
+def prompt_numbers(text: str) -> tuple[str, ...]:
+    """Return the numbers of a text other than those in dates, in order."""
+    return tuple(_NUMBER.findall(_fold_dates(text)))
+
+
+@lru_cache(maxsize=1024)
+def embed(text: str, dim: int = SEMANTIC_CACHE_DIM) -> np.ndarray:
+    """Return the unit-length hashing vector of a text.
+
+    Features are the words, adjacent word pairs and character trigrams of
+    the lower-cased text with every recognised date replaced by one token.
+    Each feature is hashed (CRC32) to a bucket and a sign, so collisions
+    cancel out on average instead of adding up. The result is cached and
+    must not be modified.
+    """
+    words = _WORD.findall(_fold_dates(text))
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    vector = np.zeros(dim, dtype=np.float32)
+    if features:
+        hashes = np.fromiter((zlib.crc32(f.encode()) for f in features), dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+        vector += np.bincount(hashes % dim, weights=signs, minlength=dim).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+    vector.flags.writeable = False
+    return vector
+
+
+class Partition:
+    """Vectors and answers of one (model, task type), searchable by cosine similarity.
+
+    Slots of evicted entries are reused. lists[i] is the IVF list of slot i
+    (0 before the first training) or -1 for a free slot. An entry is
+    (expires_at, numbers of the prompt, value).
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.vectors = np.zeros((16, dim), dtype=np.float32)
+        self.lists = np.full(16, -1, dtype=np.int32)
+        self.entries: list[tuple[float, tuple[str, ...], dict] | None] = [None] * 16
+        self.free: list[int] = []
+        self.used = 0                     # slots ever used (high-water mark)
+        self.count = 0                    # live entries
+        self.centroids: np.ndarray | None = None
+        self.trained_count = 0
+
+    def add(self, vector: np.ndarray, value: dict, expires_at: float, numbers: tuple[str, ...] = ()) -> int:
+        """Store an entry and return its slot."""
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.used == len(self.lists):
+                self._grow()
+            slot = self.used
+            self.used += 1
+        self.vectors[slot] = vector
+        self.lists[slot] = 0 if self.centroids is None else int(np.argmax(self.centroids @ vector))
+        self.entries[slot] = (expires_at, numbers, value)
+        self.count += 1
+        if self.count >= SEMANTIC_CACHE_IVF_THRESHOLD and self.count >= 2 * self.trained_count:
+            self.train()
+        return slot
+
+    def remove(self, slot: int) -> None:
+        """Free a slot."""
+        self.lists[slot] = -1
+        self.entries[slot] = None
+        self.free.append(slot)
+        self.count -= 1
+
+    def search(self, vector: np.ndarray, nprobe: int = SEMANTIC_CACHE_NPROBE) -> tuple[int, float] | None:
+        """Return (slot, similarity) of the most similar entry, None if empty.
+
+        Exhaustive before the first training, otherwise only over the nprobe
+        IVF lists whose centroids are closest to the vector.
+        """
+        if self.count == 0:
+            return None
+        lists = self.lists[:self.used]
+        if self.centroids is None:
+            similarities = self.vectors[:self.used] @ vector
+            similarities[lists < 0] = -np.inf
+            slot = int(np.argmax(similarities))
+            return slot, float(similarities[slot])
+
+        scores = self.centroids @ vector
+        if nprobe < len(scores):
+            probe = np.argpartition(-scores, nprobe - 1)[:nprobe]
+            candidates = np.flatnonzero(np.isin(lists, probe))
+        else:
+            candidates = np.flatnonzero(lists >= 0)
+        if candidates.size == 0:
+            return None
+        similarities = self.vectors[candidates] @ vector
+        best = int(np.argmax(similarities))
+        return int(candidates[best]), float(similarities[best])
+
+    def train(self) -> None:
+        """(Re)compute the IVF centroids with spherical k-means and reassign every entry."""
+        live = np.flatnonzero(self.lists[:self.used] >= 0)
+        n_lists = max(1, int(np.sqrt(live.size)))
+        rng = np.random.default_rng(live.size)
+        sample = self.vectors[rng.choice(live, min(live.size, n_lists * _KMEANS_SAMPLE_PER_LIST), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(_KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for i in range(n_lists):
+                members = sample[assignment == i]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[i] = centroid / (np.linalg.norm(centroid) or 1.0)
+        self.centroids = centroids
+        self.lists[live] = np.argmax(self.vectors[live] @ centroids.T, axis=1)
+        self.trained_count = live.size
+
+    def nbytes(self) -> int:
+        """Memory of the vector arrays in bytes."""
+        size = self.vectors.nbytes + self.lists.nbytes
+        return size + (self.centroids.nbytes if self.centroids is not None else 0)
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self.lists)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self.used] = self.vectors[:self.used]
+        lists = np.full(capacity, -1, dtype=np.int32)
+        lists[:self.used] = self.lists[:self.used]
+        self.vectors, self.lists = vectors, lists
+        self.entries += [None] * (capacity - len(self.entries))
+
+
+class SemanticCache:
+    """Answers by prompt similarity, partitioned by model and task type."""
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_bytes: int = SEMANTIC_CACHE_MAX_BYTES,
+        dim: int = SEMANTIC_CACHE_DIM,
+    ):
+        """Configure the cache.
+
+        Args:
+            threshold: Minimum cosine similarity for a hit.
+            ttl: Seconds an entry stays valid.
+            max_bytes: Least recently used entries are evicted when vectors
+                plus answers exceed this size.
+            dim: Vector dimensions.
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.dim = dim
+        self.size = 0
+        self.partitions: dict[tuple[str, str], Partition] = {}
+        # (partition key, slot) → size; order = least recently used first
+        self._lru: OrderedDict[tuple[tuple[str, str], int], int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_id: str, task_type: str, prompt: str, max_tokens: int) -> tuple[dict, float] | None:
+        """Return the cached answer of the most similar prompt and its similarity.
+
+        Only answers at least `threshold` similar, to a prompt with the same
+        numbers (see prompt_numbers), not expired, and no longer than
+        max_tokens (the request's output limit) count. If the most similar
+        prompt has other numbers, that is a miss.
+
+        Returns:
+            (answer, similarity), or None on a miss.
+        """
+        vector = embed(prompt, self.dim)
+        key = (model_id, task_type)
+        with self._lock:
+            partition = self.partitions.get(key)
+            match = partition.search(vector) if partition is not None else None
+            if match is None or match[1] < self.threshold:
+                return None
+            slot, similarity = match
+            expires_at, numbers, value = partition.entries[slot]
+            if expires_at < time.monotonic():
+                self._remove(key, slot)
+                return None
+            if numbers != prompt_numbers(prompt) or value["output_tokens"] > max_tokens:
+                return None
+            self._lru.move_to_end((key, slot))
+            return value, similarity
+
+    def set(self, model_id: str, task_type: str, prompt: str, value: dict) -> None:
+        """Store the answer to a prompt."""
+        vector = embed(prompt, self.dim)
+        size = vector.nbytes + len(json.dumps(value).encode())
+        if size > self.max_bytes:
+            return
+        key = (model_id, task_type)
+        with self._lock:
+            partition = self.partitions.get(key)
+            if partition is None:
+                partition = self.partitions[key] = Partition(self.dim)
+            slot = partition.add(vector, value, time.monotonic() + self.ttl, prompt_numbers(prompt))
+            self._lru[(key, slot)] = size
+            self.size += size
+            while self.size > self.max_bytes:
+                (evicted_key, evicted_slot), _ = next(iter(self._lru.items()))
+                self._remove(evicted_key, evicted_slot)
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def _remove(self, key: tuple[str, str], slot: int) -> None:
+        self.size -= self._lru.pop((key, slot))
+        self.partitions[key].remove(slot)
+
+
+def _create_cache() -> SemanticCache | None:
+    """Build the cache selected by SEMANTIC_CACHE."""
+    if SEMANTIC_CACHE == "on":
+        return SemanticCache()
+    if SEMANTIC_CACHE == "off":
+        return None
+    raise ValueError(f"Unknown SEMANTIC_CACHE: {SEMANTIC_CACHE!r}")
+
+
+_cache: SemanticCache | None = _create_cache()
+
+
+def get_semantic_cache() -> SemanticCache | None:
+    """Return the active semantic cache (None if it is off)."""
+    return _cache
+
+
+def set_semantic_cache(cache: SemanticCache | None) -> None:
+    """Install a different semantic cache (None disables it)."""
+    global _cache
+    _cache = cache
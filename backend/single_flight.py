@@ -0,0 +1,76 @@
+"""Request coalescing — one LLM call for identical requests in flight at once.
+
+Requests with the same (model, prompt, max_tokens) that arrive while such a
+call is still running wait for that call instead of starting their own. The
+request that started it (the leader) is billed; the others (followers) get
+the same answer for free and are logged as coalesced.
+
+The call runs as its own task and every waiter awaits it through
+asyncio.shield, so a cancelled waiter (e.g. a client that disconnected, or
+the losing call of a hedged request) does not cancel it for the others. It
+is cancelled only once nobody waits for it any more. An exception of the
+call is raised in every waiter.
+"""
+
+import asyncio
+import os
+from collections.abc import Awaitable, Callable, Hashable
+
+# "on" lets identical concurrent requests share one LLM call, "off" gives every request its own
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "on")
+
+
+class Flight:
+    """One running call and the number of requests waiting for it."""
+
+    def __init__(self, key: Hashable, task: asyncio.Task):
+        self.key = key
+        self.task = task
+        self.waiters = 0
+
+    async def wait(self):
+        """Wait for the call's result (raises its exception).
+
+        If the last waiter is cancelled, the call is cancelled too.
+        """
+        self.waiters += 1
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.waiters -= 1
+            if self.waiters == 0 and not self.task.done():
+                self.task.cancel()
+                _forget(self)
+
+
+_flights: dict[Hashable, Flight] = {}
+
+
+def get(key: Hashable) -> Flight | None:
+    """Return the running call for a key, None if there is none."""
+    return _flights.get(key)
+
+
+def start(key: Hashable, call: Callable[[], Awaitable]) -> Flight:
+    """Start a call for a key; identical requests can join it with get() until it finishes."""
+    flight = Flight(key, asyncio.ensure_future(call()))
+    flight.task.add_done_callback(lambda task: _finished(flight))
+    if REQUEST_COALESCING == "on":
+        _flights[key] = flight
+    return flight
+
+
+def in_flight() -> int:
+    """Return the number of calls currently shared by coalescing."""
+    return len(_flights)
+
+
+def _finished(flight: Flight) -> None:
+    _forget(flight)
+    if not flight.task.cancelled():
+        flight.task.exception()   # retrieved here in case no waiter is left to see it
+
+
+def _forget(flight: Flight) -> None:
+    if _flights.get(flight.key) is flight:
+        del _flights[flight.key]
@@ -0,0 +1,324 @@
+"""Per-tenant spend ledger with daily and monthly caps, shared by all worker processes.
+
+Every request is charged to a tenant (identified by its API key or tenant
+header, see app.py). Before an LLM call of a tenant with a cap the estimated
+cost is reserved; the call is only made if spent + reserved + estimate stays
+within the tenant's daily and monthly caps. After the call the reservation
+is settled with the actual cost. Tenants without any cap skip the ledger
+(has_cap), so their requests never touch the database.
+
+The ledger lives in a SQLite database in WAL mode without fsync on commit
+(synchronous=NORMAL), so every uvicorn worker sees the same totals and a
+reserve/settle is one short write transaction (tens of microseconds).
+BEGIN IMMEDIATE takes the write lock before the caps are checked, so two
+workers can never both squeeze into the last bit of a cap. Under contention
+a transaction may wait for the lock, so the API runs reserve and settle in
+a worker thread, never on the event loop.
+
+Caps come from SPEND_DAILY_CAP / SPEND_MONTHLY_CAP (0 = no cap) and can be
+overridden per tenant with set_caps(); the per-tenant caps are kept in
+memory and re-read with refresh_caps(). Periods are calendar days and months
+in UTC. Reservations that are never settled (e.g. the worker crashed) are
+dropped after SPEND_RESERVATION_TTL seconds.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+SPEND_LEDGER = os.getenv("SPEND_LEDGER", "on")
+SPEND_LEDGER_PATH = Path(
+    os.getenv("SPEND_LEDGER_PATH", Path(__file__).resolve().parent.parent / "logs" / "spend_ledger.sqlite3")
+)
+# Default caps in USD for every tenant (0 = unlimited)
+SPEND_DAILY_CAP = float(os.getenv("SPEND_DAILY_CAP", "0"))
+SPEND_MONTHLY_CAP = float(os.getenv("SPEND_MONTHLY_CAP", "0"))
+# Seconds after which an unsettled reservation is given back
+SPEND_RESERVATION_TTL = float(os.getenv("SPEND_RESERVATION_TTL", "600"))
+# Seconds between re-reads of the per-tenant caps (set by other workers)
+SPEND_CAPS_REFRESH_INTERVAL = float(os.getenv("SPEND_CAPS_REFRESH_INTERVAL", "10"))
+
+# How often (seconds) a process looks for expired reservations
+_SWEEP_INTERVAL = 60
+
+
+class SpendCapExceeded(Exception):
+    """Raised by reserve() when a request would push a tenant over a cap.
+
+    Attributes:
+        tenant: The tenant.
+        period: "daily" or "monthly".
+        cap: The cap in USD.
+        committed: Spent plus reserved in the period so far, in USD.
+    """
+
+    def __init__(self, tenant: str, period: str, cap: float, committed: float):
+        super().__init__(
+            f"Tenant {tenant!r} would exceed its {period} spend cap of ${cap} "
+            f"(${round(committed, 8)} already spent or reserved)."
+        )
+        self.tenant = tenant
+        self.period = period
+        self.cap = cap
+        self.committed = committed
+
+
+@dataclass(frozen=True)
+class Reservation:
+    """Handle for reserved spend, passed back to settle().
+
+    Attributes:
+        id: Row ID in the reservations table.
+        tenant: The tenant charged.
+        day: Day period the spend is booked to, e.g. "2026-02-12".
+        month: Month period the spend is booked to, e.g. "2026-02".
+        amount: Reserved amount in USD.
+        expires_at: When the reservation expires (time.time()); together
+            with the ID it identifies the row, since SQLite reuses the IDs
+            of deleted rows.
+    """
+    id: int
+    tenant: str
+    day: str
+    month: str
+    amount: float
+    expires_at: float
+
+
+def _periods(now: float) -> tuple[str, str]:
+    """Return the (day, month) period keys for a point in time, e.g. ("2026-02-12", "2026-02")."""
+    date = datetime.fromtimestamp(now, timezone.utc)
+    return f"{date:%Y-%m-%d}", f"{date:%Y-%m}"
+
+
+class SpendLedger:
+    """Spend and reservations per tenant and period in a SQLite database."""
+
+    def __init__(
+        self,
+        path: Path = SPEND_LEDGER_PATH,
+        daily_cap: float = SPEND_DAILY_CAP,
+        monthly_cap: float = SPEND_MONTHLY_CAP,
+        reservation_ttl: float = SPEND_RESERVATION_TTL,
+    ):
+        """Open (and create if needed) the ledger database.
+
+        Args:
+            path: Database file.
+            daily_cap: Default daily cap in USD for tenants without their own (0 = none).
+            monthly_cap: Default monthly cap in USD (0 = none).
+            reservation_ttl: Seconds after which an unsettled reservation expires.
+        """
+        self.daily_cap = daily_cap
+        self.monthly_cap = monthly_cap
+        self.reservation_ttl = reservation_ttl
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS spend ("
+            " tenant TEXT NOT NULL, period TEXT NOT NULL,"
+            " spent REAL NOT NULL DEFAULT 0, reserved REAL NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (tenant, period))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reservations ("
+            " id INTEGER PRIMARY KEY, tenant TEXT NOT NULL, day TEXT NOT NULL, month TEXT NOT NULL,"
+            " amount REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS reservations_expires_at ON reservations (expires_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS caps ("
+            " tenant TEXT PRIMARY KEY, daily REAL, monthly REAL)"
+        )
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        # tenant → (daily, monthly) from the caps table, None = default
+        self._tenant_caps: dict[str, tuple[float | None, float | None]] = {}
+        self.refresh_caps()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._db.close()
+
+    def has_cap(self, tenant: str) -> bool:
+        """True if a daily or monthly cap applies to the tenant (answered from memory).
+
+        Requests of tenants without a cap need neither reserve() nor settle().
+        """
+        daily, monthly = self._tenant_caps.get(tenant, (None, None))
+        daily = self.daily_cap if daily is None else daily
+        monthly = self.monthly_cap if monthly is None else monthly
+        return bool(daily or monthly)
+
+    def refresh_caps(self) -> None:
+        """Re-read the per-tenant caps, e.g. ones another worker set."""
+        with self._lock:
+            self._tenant_caps = {
+                tenant: (daily, monthly)
+                for tenant, daily, monthly in self._db.execute("SELECT tenant, daily, monthly FROM caps")
+            }
+
+    def reserve(self, tenant: str, amount: float) -> Reservation:
+        """Reserve the estimated cost of a call for a tenant.
+
+        Args:
+            tenant: The tenant to charge.
+            amount: Estimated cost in USD.
+
+        Returns:
+            Reservation to settle once the actual cost is known.
+
+        Raises:
+            SpendCapExceeded: If the reservation would exceed a cap; nothing is reserved.
+        """
+        now = time.time()
+        day, month = _periods(now)
+        with self._lock, self._transaction():
+            if now >= self._next_sweep:
+                self._expire(now)
+                self._next_sweep = now + _SWEEP_INTERVAL
+            daily_cap, monthly_cap = self._caps(tenant)
+            for period, key, cap in (("daily", day, daily_cap), ("monthly", month, monthly_cap)):
+                if not cap:
+                    continue
+                row = self._db.execute(
+                    "SELECT spent + reserved FROM spend WHERE tenant = ? AND period = ?", (tenant, key)
+                ).fetchone()
+                committed = row[0] if row else 0.0
+                if committed + amount > cap:
+                    raise SpendCapExceeded(tenant, period, cap, committed)
+            for key in (day, month):
+                self._add(tenant, key, reserved=amount)
+            expires_at = now + self.reservation_ttl
+            cursor = self._db.execute(
+                "INSERT INTO reservations (tenant, day, month, amount, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (tenant, day, month, amount, expires_at),
+            )
+        return Reservation(cursor.lastrowid, tenant, day, month, amount, expires_at)
+
+    def settle(self, reservation: Reservation, actual_cost: float) -> None:
+        """Replace a reservation with the actual cost of the call.
+
+        Charged to the day and month the reservation was made in. If the
+        reservation already expired, only the actual cost is added.
+        """
+        with self._lock, self._transaction():
+            row = self._db.execute(
+                "DELETE FROM reservations WHERE id = ? AND expires_at = ?", (reservation.id, reservation.expires_at)
+            )
+            released = reservation.amount if row.rowcount else 0.0
+            for key in (reservation.day, reservation.month):
+                self._add(reservation.tenant, key, spent=actual_cost, reserved=-released)
+
+    def usage(self, tenant: str) -> dict:
+        """Return a tenant's spend, reservations and caps for the current day and month."""
+        day, month = _periods(time.time())
+        with self._lock:
+            rows = {
+                period: (spent, reserved)
+                for period, spent, reserved in self._db.execute(
+                    "SELECT period, spent, reserved FROM spend WHERE tenant = ? AND period IN (?, ?)",
+                    (tenant, day, month),
+                )
+            }
+            daily_cap, monthly_cap = self._caps(tenant)
+        usage = {}
+        for name, key, cap in (("daily", day, daily_cap), ("monthly", month, monthly_cap)):
+            spent, reserved = rows.get(key, (0.0, 0.0))
+            usage[name] = {"period": key, "spent": round(spent, 8), "reserved": round(reserved, 8), "cap": cap or None}
+        return usage
+
+    def set_caps(self, tenant: str, daily: float | None = None, monthly: float | None = None) -> None:
+        """Give a tenant its own caps in USD (None = use the default, 0 = unlimited)."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO caps (tenant, daily, monthly) VALUES (?, ?, ?)", (tenant, daily, monthly)
+            )
+            self._tenant_caps = {**self._tenant_caps, tenant: (daily, monthly)}
+
+    def _caps(self, tenant: str) -> tuple[float, float]:
+        """Return a tenant's (daily, monthly) caps, falling back to the defaults."""
+        row = self._db.execute("SELECT daily, monthly FROM caps WHERE tenant = ?", (tenant,)).fetchone()
+        daily, monthly = row if row else (None, None)
+        return (
+            self.daily_cap if daily is None else daily,
+            self.monthly_cap if monthly is None else monthly,
+        )
+
+    def _add(self, tenant: str, period: str, spent: float = 0.0, reserved: float = 0.0) -> None:
+        self._db.execute(
+            "INSERT INTO spend (tenant, period, spent, reserved) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (tenant, period) DO UPDATE SET"
+            " spent = spent + excluded.spent, reserved = MAX(0, reserved + excluded.reserved)",
+            (tenant, period, spent, reserved),
+        )
+
+    def _expire(self, now: float) -> None:
+        """Give back reservations whose call never settled."""
+        expired = self._db.execute(
+            "DELETE FROM reservations WHERE expires_at < ? RETURNING tenant, day, month, amount", (now,)
+        ).fetchall()
+        for tenant, day, month, amount in expired:
+            for key in (day, month):
+                self._add(tenant, key, reserved=-amount)
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front (BEGIN IMMEDIATE)."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+
+def _create_ledger() -> SpendLedger | None:
+    """Build the ledger selected by SPEND_LEDGER."""
+    if SPEND_LEDGER == "on":
+        return SpendLedger()
+    if SPEND_LEDGER == "off":
+        return None
+    raise ValueError(f"Unknown SPEND_LEDGER: {SPEND_LEDGER!r}")
+
+
+# Opened by start_ledger() when the API starts, not on import
+_ledger: SpendLedger | None = None
+_started = False
+
+
+def start_ledger() -> None:
+    """Open the ledger selected by SPEND_LEDGER, unless set_ledger() installed one."""
+    global _ledger, _started
+    if _ledger is None and not _started:
+        _ledger = _create_ledger()
+        _started = True
+
+
+def stop_ledger() -> None:
+    """Close the ledger opened by start_ledger()."""
+    global _ledger, _started
+    if _started:
+        if _ledger is not None:
+            _ledger.close()
+        _ledger, _started = None, False
+
+
+def get_ledger() -> SpendLedger | None:
+    """Return the active ledger (None if spend tracking is off or not started)."""
+    return _ledger
+
+
+def set_ledger(ledger: SpendLedger | None) -> None:
+    """Install a different ledger (None disables spend tracking and caps)."""
+    global _ledger
+    _ledger = ledger
@@ -0,0 +1,87 @@
+"""Benchmark: one-off httpx client per call vs. the shared pooled client.
+
+Starts a minimal OpenAI-compatible mock server on localhost and sends the same
+number of call_llm requests through both client setups, then prints p50/p99
+latency. No Groq API key or network access is needed.
+
+Run with: python -m benchmarks.bench_llm_client
+"""
+
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from backend import llm_client
+from backend.providers import Provider
+
+REQUESTS = 500
+CONCURRENCY = 20
+
+MOCK_BODY = json.dumps({
+    "choices": [{"message": {"content": "Hello from the mock server."}}],
+    "usage": {"prompt_tokens": 12, "completion_tokens": 6},
+}).encode()
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer every HTTP/1.1 request on a keep-alive connection with MOCK_BODY."""
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(MOCK_BODY)}\r\n\r\n".encode()
+                + MOCK_BODY
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run(provider: Provider, client: httpx.AsyncClient | None) -> list[float]:
+    """Send REQUESTS calls with CONCURRENCY in flight; return latencies in ms."""
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def one() -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await llm_client.call_llm("mock-model", "Hello?", max_tokens=16, client=client, provider=provider)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    return latencies
+
+
+def report(label: str, latencies: list[float]) -> None:
+    """Print p50/p99 for one run."""
+    q = statistics.quantiles(latencies, n=100)
+    print(f"{label:<22} p50 {q[49]:7.2f} ms   p99 {q[98]:7.2f} ms")
+
+
+async def main() -> None:
+    server = await asyncio.start_server(handle_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    provider = Provider("mock", {"base_url": f"http://127.0.0.1:{port}/openai/v1"})
+
+    async with server:
+        # No client passed and none started → call_llm opens a new client per call
+        report("client per call", await run(provider, None))
+
+        pooled = llm_client.create_client(**provider.client_settings)
+        report("shared pooled client", await run(provider, pooled))
+        await pooled.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Benchmark: overhead of the /metrics instrumentation.
+
+Measures the cost of single counter increments and histogram observations,
+of everything a /route request records (middleware, stages, upstream call,
+cost and tokens), and of rendering /metrics for a realistic number of series.
+
+Run with: python -m benchmarks.bench_metrics
+"""
+
+import time
+
+from backend import metrics
+
+ITERATIONS = 200_000
+MODELS = [f"model-{i}" for i in range(10)]
+
+
+def per_call(label: str, fn, iterations: int = ITERATIONS) -> None:
+    """Run fn iterations times and print the time per call."""
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / iterations * 1e6:7.3f} µs")
+
+
+def main() -> None:
+    counter = metrics.Counter("bench_total", "Benchmark counter.", ("model", "status"))
+    histogram = metrics.Histogram("bench_seconds", "Benchmark histogram.", metrics.STAGE_BUCKETS, ("stage",))
+
+    per_call("loop overhead (no-op)", lambda i: None)
+    per_call("Counter.inc", lambda i: counter.inc(MODELS[i % 10], "200"))
+    per_call("Histogram.observe", lambda i: histogram.observe(0.0001, "select_model"))
+
+    def request(i: int) -> None:
+        # What one uncached /route request records
+        model = MODELS[i % 10]
+        metrics.IN_FLIGHT.inc()
+        start = time.perf_counter()
+        for stage in ("select_model", "estimate", "cache_lookup", "llm_call", "log_request"):
+            metrics.observe_stage(stage, start)
+        metrics.UPSTREAM_REQUESTS.inc(model, "200")
+        metrics.UPSTREAM_DURATION.observe(0.4, model)
+        metrics.observe_call(model, 120, 300, 0.0001, 0.00009)
+        metrics.IN_FLIGHT.dec()
+        metrics.HTTP_REQUESTS.inc("/route", "POST", "200")
+        metrics.HTTP_DURATION.observe(time.perf_counter() - start, "/route")
+
+    per_call("one /route request", request)
+
+    start = time.perf_counter()
+    text = metrics.render()
+    print(f"{'render /metrics':<28} {(time.perf_counter() - start) * 1000:7.3f} ms ({len(text.splitlines())} lines)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Micro-benchmark: per-request model selection cost vs. catalogue size.
+
+Builds synthetic catalogues of increasing size and times select_model with the
+precomputed routing index against the previous per-model loop (quality filter,
+per-model cost estimate, list membership for strengths, full sort).
+
+Run with: python -m benchmarks.bench_select_model
+"""
+
+import random
+import timeit
+
+from backend.cost_estimator import analyze_prompt
+from backend.routing import build_routing_index, select_model
+
+CATALOGUE_SIZES = [4, 50, 200, 1000]
+TASK_TYPES = ["general", "code", "email", "summarize"]
+PROMPT = "Explain the difference between processes and threads in Python. " * 20
+REPEAT = 2000
+
+OUTPUT_MULTIPLIERS = {"summarize": 0.3, "email": 0.8, "code": 2.5, "general": 1.5}
+MIN_OUTPUT_TOKENS = {"summarize": 100, "email": 200, "code": 300, "general": 150}
+QUALITY_THRESHOLDS = {"low": 0, "medium": 60, "high": 75}
+
+
+def make_catalogue(size: int) -> dict:
+    """Return a random catalogue with `size` models in the MODELS format."""
+    rng = random.Random(size)
+    models = {}
+    for i in range(size):
+        models[f"provider/model-{i}"] = {
+            "name": f"Model {i}",
+            "input_price_per_token": rng.uniform(0.02, 1.0) * 1e-6,
+            "output_price_per_token": rng.uniform(0.05, 2.0) * 1e-6,
+            "quality_score": rng.randint(40, 95),
+            "strengths": rng.sample(TASK_TYPES, rng.randint(1, 3)),
+            "max_tokens": rng.choice([8192, 32768, 65536, 131072]),
+        }
+    return models
+
+
+def legacy_select(models: dict, input_tokens: int, task_type: str, budget: float, quality: str) -> str:
+    """The per-request loop select_model used before the routing index."""
+    min_quality_score = QUALITY_THRESHOLDS[quality]
+    candidates = []
+    for model_id, config in models.items():
+        if config["quality_score"] < min_quality_score:
+            continue
+        output_tokens = min(
+            max(MIN_OUTPUT_TOKENS[task_type], int(input_tokens * OUTPUT_MULTIPLIERS[task_type])),
+            config["max_tokens"],
+        )
+        cost = round(
+            input_tokens * config["input_price_per_token"] + output_tokens * config["output_price_per_token"], 8
+        )
+        if cost > budget:
+            continue
+        score = config["quality_score"]
+        if task_type in config["strengths"]:
+            score += 15
+        candidates.append((model_id, score, cost))
+    candidates.sort(key=lambda c: (-c[1], c[2]))
+    return candidates[0][0]
+
+
+def main() -> None:
+    analysis = analyze_prompt(PROMPT)
+    budget, quality, task_type = 0.001, "medium", "code"
+
+    print(f"{'Models':>7} {'legacy loop':>14} {'routing index':>15} {'speedup':>9}")
+    for size in CATALOGUE_SIZES:
+        models = make_catalogue(size)
+        index = build_routing_index(models)
+
+        legacy = timeit.timeit(
+            lambda: legacy_select(models, analysis.tokens, task_type, budget, quality), number=REPEAT
+        )
+        indexed = timeit.timeit(
+            lambda: select_model(PROMPT, task_type, budget, quality, analysis=analysis, index=index),
+            number=REPEAT,
+        )
+        print(
+            f"{size:>7} {legacy / REPEAT * 1e6:>11.1f} µs {indexed / REPEAT * 1e6:>12.1f} µs"
+            f" {legacy / indexed:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Benchmark: semantic cache index size, recall and lookup latency.
+
+Fills one partition of a SemanticCache with synthetic prompts and queries it
+with near-duplicates of stored prompts (other dates, case, whitespace, one
+word replaced) and with unrelated prompts. Per partition size it reports:
+
+- index size: vector arrays and total cache size (vectors plus answers)
+- ANN recall: share of lookups where the IVF search finds the same nearest
+  entry as an exhaustive search
+- hit rate on near-duplicates and false hits on unrelated prompts at
+  SEMANTIC_CACHE_THRESHOLD
+- lookup latency p50/p99 (embedding plus search)
+
+Finally it checks that eviction keeps the cache within max_bytes.
+
+Run with: python -m benchmarks.bench_semantic_cache
+"""
+
+import random
+import re
+import statistics
+import time
+
+import numpy as np
+
+from backend.semantic_cache import SEMANTIC_CACHE_THRESHOLD, SemanticCache, embed
+
+SIZES = (1_000, 10_000, 50_000)
+QUERIES = 500
+
+SYLLABLES = "ka lo mi ne ru ta se vo pi da gu fe ri zo ba mu".split()
+TEMPLATES = (
+    "Summarize the meeting with {a} on {date} about the {b} and {c} budget.",
+    "Write a short e-mail to {a} asking for the {b} report of week {n}, due {date}.",
+    "Explain how {b} differs from {c} in {d} systems with {n} nodes.",
+    "Translate into German: the {b} of {a} costs {n} dollars per {c}.",
+    "Give {n} ideas to improve the {b} {c} for {a} and the {d} team.",
+)
+
+
+def make_prompts(count: int, rng: random.Random) -> list[str]:
+    """Return count random prompts from templates and made-up words."""
+    words = list({"".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(5000)})
+
+    def prompt() -> str:
+        text = rng.choice(TEMPLATES).format(
+            a=rng.choice(words).capitalize(), b=rng.choice(words), c=rng.choice(words),
+            d=rng.choice(words), n=rng.randint(1, 999), date=random_date(rng),
+        )
+        # Longer prompts: add a few sentences of context
+        context = " ".join(rng.choice(words) for _ in range(rng.randint(10, 40)))
+        return f"{text} Context: {context}."
+    return [prompt() for _ in range(count)]
+
+
+def random_date(rng: random.Random) -> str:
+    return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+
+def near_duplicate(prompt: str, rng: random.Random) -> str:
+    """Change dates, case and whitespace of a prompt and replace one context word."""
+    words = prompt.split(" ")
+    i = rng.randrange(len(words) // 2, len(words))
+    words[i] = "".join(rng.choice(SYLLABLES) for _ in range(3))
+    text = "  ".join(words) if rng.random() < 0.5 else " ".join(words).upper()
+    return re.sub(r"\d{4}-\d{2}-\d{2}", lambda _: random_date(rng), text)
+
+
+def answer(i: int) -> dict:
+    return {"content": f"Answer number {i}. " * 10, "input_tokens": 60, "output_tokens": 40, "latency_ms": 300.0}
+
+
+def bench_size(size: int, rng: random.Random) -> None:
+    """Fill a cache with size prompts and print size, recall, hit rates and latency."""
+    cache = SemanticCache(max_bytes=10**12)
+    prompts = make_prompts(size, rng)
+    start = time.perf_counter()
+    for i, prompt in enumerate(prompts):
+        cache.set("model", "general", prompt, answer(i))
+    fill_s = time.perf_counter() - start
+    partition = cache.partitions[("model", "general")]
+    embed.cache_clear()
+
+    stored = rng.sample(range(size), QUERIES)
+    near = [near_duplicate(prompts[i], rng) for i in stored]
+    unrelated = make_prompts(QUERIES, random.Random(size))
+
+    recall_hits = 0
+    for query in near + unrelated:
+        vector = embed(query)
+        similarities = partition.vectors[:partition.used] @ vector
+        similarities[partition.lists[:partition.used] < 0] = -np.inf
+        exact = int(np.argmax(similarities))
+        recall_hits += partition.search(vector)[0] == exact
+    embed.cache_clear()
+
+    latencies = []
+    near_hits = 0
+    for i, query in zip(stored, near):
+        start = time.perf_counter()
+        hit = cache.get("model", "general", query, 100)
+        latencies.append((time.perf_counter() - start) * 1000)
+        near_hits += hit is not None and hit[0]["content"] == answer(i)["content"]
+    false_hits = sum(cache.get("model", "general", query, 100) is not None for query in unrelated)
+
+    q = statistics.quantiles(latencies, n=100)
+    index = "IVF" if partition.centroids is not None else "exhaustive"
+    print(f"{size:>7,} entries ({index}, filled in {fill_s:.1f} s)")
+    print(f"  index size        {partition.nbytes() / 2**20:8.1f} MiB vectors, {cache.size / 2**20:.1f} MiB total")
+    print(f"  ANN recall@1      {recall_hits / (2 * QUERIES):8.1%}")
+    print(f"  near-dup hits     {near_hits / QUERIES:8.1%}   (threshold {SEMANTIC_CACHE_THRESHOLD})")
+    print(f"  false hits        {false_hits / QUERIES:8.1%}")
+    print(f"  lookup latency    p50 {q[49]:6.3f} ms   p99 {q[98]:6.3f} ms")
+
+
+def bench_eviction(rng: random.Random) -> None:
+    """Insert far more than fits and check the cache stays within max_bytes."""
+    max_bytes = 2 * 2**20
+    cache = SemanticCache(max_bytes=max_bytes)
+    for i, prompt in enumerate(make_prompts(5_000, rng)):
+        cache.set("model", rng.choice(("general", "code")), prompt, answer(i))
+    print(f"eviction: {len(cache):,} of 5,000 entries kept, {cache.size / 2**20:.2f} MiB of {max_bytes / 2**20:.0f} MiB")
+
+
+def main() -> None:
+    rng = random.Random(0)
+    for size in SIZES:
+        bench_size(size, rng)
+    bench_eviction(rng)
+
+
+if __name__ == "__main__":
+    main()
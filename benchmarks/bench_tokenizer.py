@@ -0,0 +1,130 @@
+"""Benchmark: character heuristic vs. BPE tokenizer for input token counts.
+
+Builds a synthetic corpus of prompts (prose, code, e-mails, technical text,
+German text, JSON) and compares, per tokenizer family:
+
+- accuracy: error of estimate_tokens' heuristic against the exact BPE count
+- throughput: heuristic, tokenizer on a cold cache, tokenizer on a warm
+  cache, and one batch call as /route/batch makes it
+
+Needs the vocabulary files in TOKENIZER_DIR (see backend.tokenizer); families
+without one are skipped. Uses tiktoken if installed, the pure-Python encoder
+otherwise.
+
+Run with: python -m benchmarks.bench_tokenizer
+"""
+
+import random
+import statistics
+import time
+
+from backend import tokenizer
+from backend.cost_estimator import _analyze
+
+PROMPTS_PER_KIND = 200
+
+WORDS = (
+    "the a model budget request answer cost price token quality fast cheap route user question "
+    "explain write summarize improve short long simple example because which would should could"
+).split()
+TECHNICAL_WORDS = (
+    "infrastructure asynchronous configuration implementation serialization authentication "
+    "observability concurrency latency throughput distributed orchestration"
+).split()
+GERMAN_WORDS = (
+    "Überblick Kostenschätzung Anfrage Modellauswahl Qualitätsstufe Antwort günstig schnell "
+    "Zusammenfassung Rechnung für über möchte Grüße Straße"
+).split()
+
+
+def make_corpus(seed: int = 0) -> dict[str, list[str]]:
+    """Return PROMPTS_PER_KIND random prompts for each kind of text."""
+    rng = random.Random(seed)
+
+    def sentence(words: list[str], n: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(n)).capitalize() + "."
+
+    def code() -> str:
+        name = rng.choice(WORDS)
+        lines = [f"def {name}_{i}(items: list[int]) -> dict:" for i in range(rng.randint(1, 4))]
+        lines += [f"    result = {{k: v * {rng.randint(2, 99)} for k, v in enumerate(items) if v > {i}}}"
+                  for i in range(rng.randint(2, 8))]
+        return "Fix the bug in this function:\n" + "\n".join(lines) + "\n    return result\n"
+
+    def email() -> str:
+        body = " ".join(sentence(WORDS, rng.randint(6, 14)) for _ in range(rng.randint(2, 6)))
+        return f"Write a reply to this e-mail:\n\nHi {rng.choice(['Anna', 'Ben', 'Chris'])},\n\n{body}\n\nBest regards"
+
+    def as_json() -> str:
+        items = ", ".join(f'"{rng.choice(WORDS)}_{i}": {rng.randint(0, 10**6)}' for i in range(rng.randint(3, 20)))
+        return "Summarize this JSON: {" + items + "}"
+
+    kinds = {
+        "prose": lambda: " ".join(sentence(WORDS, rng.randint(5, 20)) for _ in range(rng.randint(1, 10))),
+        "code": code,
+        "email": email,
+        "technical": lambda: " ".join(sentence(TECHNICAL_WORDS + WORDS, rng.randint(5, 15)) for _ in range(3)),
+        "german": lambda: " ".join(sentence(GERMAN_WORDS + WORDS, rng.randint(5, 15)) for _ in range(3)),
+        "json": as_json,
+    }
+    return {kind: [make() for _ in range(PROMPTS_PER_KIND)] for kind, make in kinds.items()}
+
+
+def per_second(seconds: float, count: int) -> str:
+    return f"{count / seconds:>12,.0f}/s"
+
+
+def main() -> None:
+    corpus = make_corpus()
+    prompts = [prompt for kind in corpus.values() for prompt in kind]
+
+    for family in tokenizer.TOKENIZER_FAMILIES:
+        engine = tokenizer.get_tokenizer(family)
+        if engine is None:
+            print(f"{family}: no vocabulary at {tokenizer.TOKENIZER_DIR / (family + '.tiktoken')}, skipped\n")
+            continue
+        print(f"{family} ({type(engine).__name__})")
+
+        # Accuracy of the heuristic against the exact counts, per kind of text
+        print(f"{'kind':>10} {'mean |error|':>13} {'mean error':>11} {'max |error|':>12}")
+        for kind, texts in corpus.items():
+            exact = engine.count_batch(texts)
+            errors = [(_analyze(text).tokens - count) / count * 100 for text, count in zip(texts, exact)]
+            print(
+                f"{kind:>10} {statistics.fmean(map(abs, errors)):>12.1f}% {statistics.fmean(errors):>+10.1f}%"
+                f" {max(map(abs, errors)):>11.1f}%"
+            )
+
+        # Throughput in prompts per second
+        start = time.perf_counter()
+        for prompt in prompts:
+            _analyze(prompt)
+        heuristic = time.perf_counter() - start
+
+        tokenizer.clear_cache()
+        tokenizer.get_tokenizer(family)
+        start = time.perf_counter()
+        for prompt in prompts:
+            tokenizer.count_tokens(family, prompt)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for prompt in prompts:
+            tokenizer.count_tokens(family, prompt)
+        warm = time.perf_counter() - start
+
+        tokenizer.clear_cache()
+        tokenizer.get_tokenizer(family)         # load the vocabulary outside the timing
+        start = time.perf_counter()
+        tokenizer.count_tokens_batch(family, prompts)
+        batch = time.perf_counter() - start
+
+        print(f"{'heuristic':>22} {per_second(heuristic, len(prompts))}")
+        print(f"{'tokenizer, cold cache':>22} {per_second(cold, len(prompts))}")
+        print(f"{'tokenizer, warm cache':>22} {per_second(warm, len(prompts))}")
+        print(f"{'tokenizer, batch':>22} {per_second(batch, len(prompts))}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
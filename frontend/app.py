@@ -4,6 +4,8 @@ This Streamlit app connects to the FastAPI backend and displays
 AI responses, routing decisions, and cost breakdowns.
 """
 
+import json
+
 import streamlit as st
 import requests
 
@@ -12,17 +14,34 @@ import requests
 
 BACKEND_URL = "http://localhost:8000"
 
-# Human-readable display names for model IDs
-MODEL_NAMES = {
-    "llama-3.3-70b-versatile": "LLaMA 3.3 70B Versatile",
-    "llama-3.1-8b-instant": "LLaMA 3.1 8B Instant",
-    "openai/gpt-oss-120b": "GPT-OSS 120B",
-    "openai/gpt-oss-20b": "GPT-OSS 20B",
-}
-
 
 ### Backend Communication
 
+def load_model_names():
+    """Fetch the model catalogue from the backend /models endpoint.
+
+    The catalogue is cached in the session state together with its ETag, so
+    the backend only sends it again after it changed. If the backend cannot
+    be reached, the cached catalogue is used.
+
+    Returns:
+        dict: Human-readable display names by model ID (empty if never loaded)
+    """
+    cached = st.session_state.get("model_catalogue")
+    headers = {"If-None-Match": cached["etag"]} if cached and cached["etag"] else {}
+    try:
+        response = requests.get(f"{BACKEND_URL}/models", headers=headers, timeout=5)
+        if response.status_code != 304:
+            response.raise_for_status()
+            cached = {"etag": response.headers.get("ETag"), "models": response.json()["models"]}
+            st.session_state.model_catalogue = cached
+    except requests.RequestException:
+        pass
+    if not cached:
+        return {}
+    return {model_id: model["name"] for model_id, model in cached["models"].items()}
+
+
 def call_backend(prompt, task_type, budget, quality):
     """Call the backend /route endpoint and return the JSON response.
 
@@ -65,6 +84,94 @@ def call_backend(prompt, task_type, budget, quality):
         raise Exception(f"Connection error: {str(e)}")
 
 
+class StreamUnavailable(Exception):
+    """Raised when /route/stream fails before any part of the answer arrived."""
+
+
+def stream_backend(prompt, task_type, budget, quality, result):
+    """Call the backend /route/stream endpoint and yield answer chunks as they arrive.
+
+    The routing details and final costs are not part of the text stream, so
+    they are written into the ``result`` dict: the "route" event fills in
+    model and routing_reason, the "done" event the costs and tokens.
+
+    Args:
+        prompt: The user's input text
+        task_type: Task category (general, code, email, summarize)
+        budget: Maximum budget in USD
+        quality: Quality level (low, medium, high)
+        result: Dict that receives the routing and cost details
+
+    Yields:
+        str: Chunks of the model's answer
+
+    Raises:
+        StreamUnavailable: If streaming failed before the first chunk (server
+            or connection error, or the endpoint does not exist)
+        Exception: On other backend errors or connection issues
+    """
+    received = False
+    try:
+        with requests.post(
+            f"{BACKEND_URL}/route/stream",
+            json={
+                "prompt": prompt,
+                "task_type": task_type,
+                "budget": budget,
+                "quality": quality
+            },
+            stream=True,
+            timeout=60
+        ) as response:
+            response.raise_for_status()
+
+            # Server-Sent Events: "event: <name>" line, "data: <json>" line, blank line
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "token":
+                        received = True
+                        yield data["content"]
+                    elif event == "error":
+                        if not received:
+                            raise StreamUnavailable(data.get("detail", "Streaming failed"))
+                        raise Exception(data.get("detail", "Streaming failed"))
+                    else:
+                        result.update(data)
+    except requests.HTTPError as e:
+        if e.response.status_code == 400:
+            error_detail = e.response.json().get('detail', 'Invalid request')
+            raise Exception(f"⚠️ {error_detail}")
+        elif e.response.status_code >= 500 or e.response.status_code in (404, 405):
+            raise StreamUnavailable(f"Backend error: {e}")
+        else:
+            raise Exception(f"Backend error: {e}")
+    except requests.Timeout:
+        raise Exception("Request timed out. Please try again.")
+    except requests.ConnectionError:
+        if not received:
+            raise StreamUnavailable("Cannot connect to backend.")
+        raise Exception("Connection to the backend was lost.")
+
+
+def route_backend(prompt, task_type, budget, quality, result):
+    """Stream the answer from /route/stream, falling back to /route if streaming fails.
+
+    The fallback only runs if no part of the answer was shown yet, so the
+    user never sees (or pays for) an answer twice. Arguments, ``result`` and
+    the yielded chunks are the same as for stream_backend.
+    """
+    try:
+        yield from stream_backend(prompt, task_type, budget, quality, result)
+    except StreamUnavailable:
+        data = call_backend(prompt, task_type, budget, quality)
+        result.update(data)
+        yield data["response"]
+
+
 ### Session State
 
 def init_session_state():
@@ -79,7 +186,7 @@ def init_session_state():
 
 def render_routing_details(model_id, routing_reason):
     """Render the expandable model selection details section."""
-    model_name = MODEL_NAMES.get(model_id, model_id)
+    model_name = load_model_names().get(model_id, model_id)
     st.markdown(f"**Selected Model:** {model_name}")
     st.info(routing_reason)
 
@@ -175,15 +282,14 @@ def handle_user_input(task_type, budget, quality):
             st.markdown(prompt)
         st.session_state.messages.append({"role": "user", "content": prompt})
 
-        # Call backend and display assistant response
+        # Call backend and display the assistant response while it is generated
         with st.chat_message("assistant"):
-            with st.spinner("Finding best model and generating response..."):
+            with st.spinner("Finding best model..."):
                 try:
-                    data = call_backend(prompt, task_type, budget, quality)
-
-                    # Display response text
-                    response_text = data.get("response", "No response received")
-                    st.markdown(response_text)
+                    data = {}
+                    response_text = st.write_stream(
+                        route_backend(prompt, task_type, budget, quality, data)
+                    ) or "No response received"
 
                     # Extract details
                     model_id = data.get("model", "unknown")
@@ -1,32 +1,122 @@
-"""Streamlit Dashboard — Nutzungsstatistiken und Logs.
+"""Streamlit Dashboard — Nutzungsstatistiken und Kostenverlauf.
 
 Dieses Modul zeigt eine Uebersicht ueber die bisherige Nutzung des
-Budget Routers: Kosten, Modell-Verteilung und einzelne Requests.
+Budget Routers: Kennzahlen, Modell-Verteilung und den Verlauf von Kosten,
+Requests und Latenz pro Modell ueber die Zeit.
+
+Der Verlauf kommt aus GET /stats?from=&to=&bucket= — das Backend liest ihn
+aus vorab aggregierten Minuten- bzw. Stunden-Buckets, nicht aus dem Log.
 
 Lernziele:
 - Streamlit Layouts (st.columns, st.metric)
 - Daten vom Backend abrufen (GET /stats)
-- Einfache Diagramme mit st.bar_chart oder st.plotly_chart
-- Tabellen mit st.dataframe
-
-TODOs:
-- Statistiken vom Backend laden (requests.get("http://localhost:8000/stats"))
-- Kennzahlen anzeigen: Total Requests, Total Cost, Average Cost (st.metric)
-- Balkendiagramm der Modell-Nutzung (model_usage)
-- Log-Tabelle mit allen bisherigen Requests (GET /stats oder eigener Endpoint)
+- Zeitreihen mit pandas aufbereiten und mit st.bar_chart / st.line_chart zeichnen
+
+Starten mit: streamlit run frontend/dashboard.py
 """
 
+import time
+
+import pandas as pd
+import requests
 import streamlit as st
 
+BACKEND_URL = "http://localhost:8000"
 
-def render_dashboard():
-    """Rendere das Usage-Dashboard.
-
-    TODO:
-    1. st.title("Usage Dashboard")
-    2. Stats vom Backend laden: requests.get("http://localhost:8000/stats").json()
-    3. st.columns(3) fuer Kennzahlen (Total Requests, Total Cost, Avg Cost)
-    4. st.bar_chart() fuer model_usage
-    5. Optional: Log-Tabelle mit st.dataframe()
+# Zeitraeume fuer den Verlauf: Anzeigename → (Laenge in Millisekunden, Bucket-Groesse)
+TIME_RANGES = {
+    "Letzte Stunde": (60 * 60 * 1000, "minute"),
+    "Letzte 24 Stunden": (24 * 60 * 60 * 1000, "hour"),
+    "Letzte 7 Tage": (7 * 24 * 60 * 60 * 1000, "hour"),
+    "Letzte 30 Tage": (30 * 24 * 60 * 60 * 1000, "hour"),
+}
+
+
+def load_stats(range_ms, bucket):
+    """Statistiken inkl. Zeitreihe vom Backend laden.
+
+    Args:
+        range_ms: Laenge des Zeitraums bis jetzt in Millisekunden
+        bucket: Bucket-Groesse ("minute" oder "hour")
+
+    Returns:
+        dict: Antwort von GET /stats mit dem Feld "series"
+    """
+    now_ms = int(time.time() * 1000)
+    response = requests.get(
+        f"{BACKEND_URL}/stats",
+        params={"from": now_ms - range_ms, "to": now_ms, "bucket": bucket},
+        timeout=10,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def series_to_frame(series, field):
+    """Zeitreihe in eine Tabelle umwandeln: eine Zeile pro Bucket, eine Spalte pro Modell.
+
+    Args:
+        series: Liste der Buckets aus der /stats-Antwort
+        field: Welcher Wert pro Modell ("cost", "requests", "avg_latency_ms", ...)
+
+    Returns:
+        pd.DataFrame mit Zeitstempel-Index (UTC)
     """
-    pass
+    rows = {
+        pd.to_datetime(item["start"], unit="ms", utc=True): {
+            model: values[field] for model, values in item["models"].items()
+        }
+        for item in series
+    }
+    return pd.DataFrame.from_dict(rows, orient="index").sort_index()
+
+
+def render_dashboard():
+    """Rendere das Usage-Dashboard."""
+    st.title("Usage Dashboard")
+
+    label = st.selectbox("Zeitraum", list(TIME_RANGES), index=1)
+    range_ms, bucket = TIME_RANGES[label]
+
+    try:
+        stats = load_stats(range_ms, bucket)
+    except requests.RequestException as e:
+        st.error(f"Backend nicht erreichbar: {e}")
+        st.markdown("Laeuft das Backend? `uvicorn backend.app:app --reload`")
+        return
+
+    # Kennzahlen (seit Beginn der Aufzeichnung)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Total Requests", f"{stats['total_requests']:,}")
+    with col2:
+        st.metric("Total Cost", f"${stats['total_cost']:.6f}")
+    with col3:
+        st.metric("Average Cost", f"${stats['average_cost']:.6f}")
+
+    st.subheader("Modell-Nutzung")
+    if stats["model_usage"]:
+        st.bar_chart(pd.Series(stats["model_usage"], name="Requests"))
+    else:
+        st.info("Noch keine Requests geloggt.")
+
+    # Verlauf im gewaehlten Zeitraum
+    series = stats.get("series") or []
+    if not series:
+        st.info(f"Keine Requests im Zeitraum '{label}'.")
+        return
+
+    st.subheader(f"Kosten pro Modell (USD pro {'Minute' if bucket == 'minute' else 'Stunde'})")
+    st.bar_chart(series_to_frame(series, "cost").fillna(0))
+
+    st.subheader("Requests pro Modell")
+    st.line_chart(series_to_frame(series, "requests").fillna(0))
+
+    st.subheader("Durchschnittliche Latenz (ms)")
+    # Luecken bleiben leer: ohne Requests gibt es keine Latenz
+    st.line_chart(series_to_frame(series, "avg_latency_ms"))
+
+
+if __name__ == "__main__":
+    st.set_page_config(page_title="Usage Dashboard", page_icon="📊", layout="wide")
+    render_dashboard()
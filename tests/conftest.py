@@ -0,0 +1,30 @@
+"""Shared fixtures: a throwaway request log and spend ledger per test."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# The router refuses to call a provider without its key; the tests never reach the real API
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+from backend import logging_service, spend_ledger  # noqa: E402
+
+
+@pytest.fixture
+def log_file(tmp_path, monkeypatch):
+    """Point the request log (and its checkpoint and segments) at a temporary directory."""
+    monkeypatch.setattr(logging_service, "LOGS_DIR", tmp_path)
+    monkeypatch.setattr(logging_service, "LOG_FILE", tmp_path / "requests.jsonl")
+    return tmp_path / "requests.jsonl"
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    """Install a fresh spend ledger (daily cap $1) in a temporary database for one test."""
+    previous = spend_ledger.get_ledger()
+    ledger = spend_ledger.SpendLedger(tmp_path / "spend_ledger.sqlite3", daily_cap=1.0)
+    spend_ledger.set_ledger(ledger)
+    yield ledger
+    spend_ledger.set_ledger(previous)
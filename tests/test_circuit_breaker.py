@@ -0,0 +1,201 @@
+"""Circuit breaker states and llm_client's retry delays, on a fake clock with seeded jitter."""
+
+import asyncio
+import random
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from backend import circuit_breaker, llm_client, rate_limiter
+from backend.circuit_breaker import BREAKER_OPEN_SECONDS, BREAKER_WINDOW_SECONDS, CircuitOpenError
+
+MODEL = "llama-3.1-8b-instant"
+OK = {"choices": [{"message": {"content": "Hi"}}], "usage": {"prompt_tokens": 5, "completion_tokens": 1}}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake monotonic clock for the breakers, advanced with clock.advance(seconds)."""
+    now = [1000.0]
+    fake = SimpleNamespace(monotonic=lambda: now[0])
+    fake.advance = lambda seconds: now.__setitem__(0, now[0] + seconds)
+    monkeypatch.setattr(circuit_breaker, "time", fake)
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(circuit_breaker, "BREAKER_FAILURE_THRESHOLD", 3)
+    return fake
+
+
+@pytest.fixture
+def sleeps(monkeypatch, clock):
+    """Seeded jitter and a retry sleep that only advances the clock; returns the delays slept in ms."""
+    delays = []
+
+    async def sleep(seconds: float) -> None:
+        delays.append(seconds * 1000)
+        clock.advance(seconds)
+
+    monkeypatch.setattr(llm_client, "random", random.Random(0))
+    monkeypatch.setattr(llm_client, "asyncio", SimpleNamespace(sleep=sleep))
+    monkeypatch.setattr(llm_client, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(llm_client, "LLM_RETRY_BASE_MS", 100.0)
+    monkeypatch.setattr(llm_client, "LLM_RETRY_MAX_MS", 2000.0)
+    monkeypatch.setattr(rate_limiter, "_limiters", {})     # a 429 blocks the model there
+    return delays
+
+
+def state() -> str:
+    return circuit_breaker.snapshot()[MODEL]["state"]
+
+
+def status_error(status_code: int, headers: dict | None = None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://t/chat")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"{status_code}", request=request, response=response)
+
+
+def call(responses: list[httpx.Response]) -> tuple[dict | Exception, int]:
+    """call_llm against upstream answers taken from `responses`; returns the result and the requests sent."""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return responses.pop(0)
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await llm_client.call_llm(MODEL, "Say hi", client=client)
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            return e
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run()), len(requests)
+
+
+def test_breaker_opens_after_threshold_failures_within_the_window(clock):
+    circuit_breaker.record_failure(MODEL)
+    clock.advance(BREAKER_WINDOW_SECONDS + 1)       # the first failure leaves the window
+    circuit_breaker.record_failure(MODEL)
+    circuit_breaker.record_failure(MODEL)
+    assert state() == "closed" and circuit_breaker.allow(MODEL)
+
+    circuit_breaker.record_failure(MODEL)
+
+    assert state() == "open" and not circuit_breaker.allow(MODEL)
+    assert circuit_breaker.unavailable_models() == {MODEL}
+    assert circuit_breaker.snapshot()[MODEL]["retry_in_s"] == BREAKER_OPEN_SECONDS
+
+
+def test_half_open_lets_one_trial_through_and_reopens_when_it_fails(clock):
+    for _ in range(3):
+        circuit_breaker.record_failure(MODEL)
+    clock.advance(BREAKER_OPEN_SECONDS - 1)
+    assert not circuit_breaker.allow(MODEL)
+
+    clock.advance(1)
+    assert circuit_breaker.allow(MODEL)             # the trial call
+    assert state() == "half_open" and not circuit_breaker.allow(MODEL)
+
+    circuit_breaker.record_failure(MODEL)
+
+    assert state() == "open" and circuit_breaker.snapshot()[MODEL]["opens"] == 2
+    assert not circuit_breaker.allow(MODEL)
+
+
+def test_successful_trial_closes_the_breaker(clock):
+    for _ in range(3):
+        circuit_breaker.record_failure(MODEL)
+    clock.advance(BREAKER_OPEN_SECONDS)
+    assert circuit_breaker.allow(MODEL)
+
+    circuit_breaker.record_success(MODEL)
+
+    assert state() == "closed" and circuit_breaker.allow(MODEL) and circuit_breaker.allow(MODEL)
+    assert circuit_breaker.unavailable_models() == set()
+    # The count starts over: it takes the full threshold to open again
+    circuit_breaker.record_failure(MODEL)
+    circuit_breaker.record_failure(MODEL)
+    assert state() == "closed"
+
+
+def test_trial_that_never_reports_back_expires(clock):
+    for _ in range(3):
+        circuit_breaker.record_failure(MODEL)
+    clock.advance(BREAKER_OPEN_SECONDS)
+    assert circuit_breaker.allow(MODEL)             # e.g. a hedge call that gets cancelled
+
+    clock.advance(BREAKER_OPEN_SECONDS)
+
+    assert circuit_breaker.allow(MODEL) and state() == "half_open"
+
+
+def test_retry_delay_is_seeded_decorrelated_jitter(sleeps):
+    expected = random.Random(0)
+    first = llm_client._retry_delay_ms(MODEL, status_error(503), 0, 100.0)
+    second = llm_client._retry_delay_ms(MODEL, status_error(503), 1, first)
+
+    assert first == expected.uniform(100, 300)
+    assert second == min(2000.0, expected.uniform(100, first * 3))
+    assert llm_client._retry_delay_ms(MODEL, status_error(503), 2, second) is None    # out of retries
+
+
+def test_retry_after_overrides_the_backoff(sleeps):
+    expected = random.Random(0)
+    assert expected.uniform(100, 300) < 1000
+    assert llm_client._retry_delay_ms(MODEL, status_error(429, {"Retry-After": "1"}), 0, 100.0) == 1000
+
+    # A shorter Retry-After does not shorten the backoff
+    delay = llm_client._retry_delay_ms(MODEL, status_error(503, {"Retry-After": "0.01"}), 0, 100.0)
+    assert delay == expected.uniform(100, 300) > 10
+    # Asked to wait longer than LLM_RETRY_MAX_MS: give up, so the router can fall back
+    assert llm_client._retry_delay_ms(MODEL, status_error(429, {"Retry-After": "3"}), 0, 100.0) is None
+
+
+def test_only_server_and_connection_errors_count_against_the_breaker(sleeps):
+    assert llm_client._retry_delay_ms(MODEL, status_error(400), 0, 100.0) is None
+    assert llm_client._retry_delay_ms(MODEL, status_error(429), 0, 100.0) is not None
+    assert MODEL not in circuit_breaker.snapshot()
+
+    llm_client._retry_delay_ms(MODEL, status_error(502), 0, 100.0)
+    llm_client._retry_delay_ms(MODEL, httpx.ConnectError("refused"), 0, 100.0)
+    assert circuit_breaker.snapshot()[MODEL]["recent_failures"] == 2
+
+
+def test_call_retries_with_retry_after_and_then_succeeds(sleeps):
+    result, requests = call([
+        httpx.Response(429, headers={"Retry-After": "0.5"}),
+        httpx.Response(503),
+        httpx.Response(200, json=OK),
+    ])
+
+    assert result["content"] == "Hi" and requests == 3
+    expected = random.Random(0)
+    assert expected.uniform(100, 300) < sleeps[0] == 500
+    # The next delay grows from the one actually slept
+    assert sleeps[1] == expected.uniform(100, 1500)
+    assert state() == "closed"
+
+
+def test_failing_calls_open_the_breaker_and_later_calls_are_refused(sleeps, clock):
+    result, requests = call([httpx.Response(503)] * 3)
+    assert isinstance(result, httpx.HTTPStatusError) and requests == 3
+    assert state() == "open" and len(sleeps) == 2
+
+    result, requests = call([])
+    assert isinstance(result, CircuitOpenError) and requests == 0
+
+    # Half-open: one trial call, which closes the breaker when it succeeds
+    clock.advance(BREAKER_OPEN_SECONDS)
+    result, requests = call([httpx.Response(200, json=OK)])
+    assert result["content"] == "Hi" and requests == 1
+    assert state() == "closed"
+
+
+def test_breaker_opening_between_attempts_stops_the_retries(sleeps, monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "BREAKER_FAILURE_THRESHOLD", 1)
+
+    result, requests = call([httpx.Response(503)] * 3)
+
+    assert isinstance(result, httpx.HTTPStatusError) and requests == 1
@@ -0,0 +1,118 @@
+"""Estimate accuracy: when estimates drift, and drift warnings for new entries only."""
+
+import json
+import logging
+import random
+
+import pytest
+
+from backend import estimate_accuracy, logging_service
+from backend.logging_service import get_estimate_accuracy, log_request, save_stats_checkpoint
+
+MODEL = "llama-3.1-8b-instant"
+
+
+@pytest.fixture(autouse=True)
+def few_samples(monkeypatch):
+    monkeypatch.setattr(estimate_accuracy, "ACCURACY_MIN_SAMPLES", 3)
+
+
+def write(count: int, estimate: int, output_tokens: int = 100, input_tokens_est: int = 10) -> None:
+    """Log `count` calls that produced `output_tokens` against an estimate of `estimate`."""
+    for _ in range(count):
+        log_request(entry(estimate, output_tokens, input_tokens_est))
+
+
+def entry(output_tokens_est: int, output_tokens: int, input_tokens_est: int = 10) -> dict:
+    """A log entry of a call with 10 input tokens; the cost is one unit per token."""
+    return {
+        "model": MODEL, "task_type": "general",
+        "input_tokens": 10, "input_tokens_est": input_tokens_est,
+        "output_tokens": output_tokens, "output_tokens_est": output_tokens_est,
+        "actual_cost": 10 + output_tokens, "estimated_cost": input_tokens_est + output_tokens_est,
+    }
+
+
+def drift_records(caplog) -> list[str]:
+    return [record.getMessage() for record in caplog.records if record.name == estimate_accuracy.__name__]
+
+
+def restart() -> None:
+    """Forget the in-memory aggregate, as a new process would start without it."""
+    logging_service._stats = None
+
+
+def test_well_calibrated_model_does_not_drift(monkeypatch):
+    monkeypatch.setattr(estimate_accuracy, "ACCURACY_MIN_SAMPLES", 20)
+    rng = random.Random(0)
+    accuracy = {}
+    # Answers of 10-400 tokens against their p90 (361), as the calibrated estimate
+    # reserves, with the 150-token minimum: far off in size, but rarely too low
+    for _ in range(500):
+        estimate_accuracy.observe(accuracy, entry(max(150, 361), rng.randint(10, 400)))
+
+    result, = estimate_accuracy.summary(accuracy)
+    assert result["output_tokens"]["p90_error"] > 1.0 and result["output_tokens"]["exceeded"] < 0.15
+    assert not result["drift"]
+
+
+def test_estimates_that_run_low_drift(monkeypatch):
+    monkeypatch.setattr(estimate_accuracy, "ACCURACY_MIN_SAMPLES", 20)
+    rng = random.Random(0)
+    accuracy = {}
+    # The output estimate is the median instead of the p90; the input is counted 3x too high
+    for _ in range(500):
+        estimate_accuracy.observe(accuracy, entry(205, rng.randint(10, 400), input_tokens_est=30))
+
+    result, = estimate_accuracy.summary(accuracy)
+    assert result["output_tokens"]["drift"] and result["cost"]["drift"] and result["input_tokens"]["drift"]
+    assert result["output_tokens"]["p90_error"] < 10
+
+
+def test_drift_is_logged_once_when_it_starts(log_file, caplog):
+    caplog.set_level(logging.INFO, logger=estimate_accuracy.__name__)
+    write(5, estimate=25)
+
+    messages = drift_records(caplog)
+    assert len(messages) == 2 and all(message.startswith("Estimate drift") for message in messages)
+    assert "output_tokens above its estimate in 100% of calls" in messages[0] and "cost" in messages[1]
+    accuracy, = get_estimate_accuracy()
+    assert accuracy["drift"] and accuracy["output_tokens"]["drift"] and not accuracy["input_tokens"]["drift"]
+
+
+@pytest.mark.parametrize("checkpoint", [True, False])
+def test_replay_at_startup_logs_nothing(log_file, caplog, monkeypatch, checkpoint):
+    write(5, estimate=25)
+    if checkpoint:
+        save_stats_checkpoint()
+        write(2, estimate=25)         # behind the checkpoint, replayed from the log
+    restart()
+
+    caplog.clear()
+    caplog.set_level(logging.INFO, logger=estimate_accuracy.__name__)
+    accuracy, = get_estimate_accuracy()
+
+    # The flag is rebuilt from the log, but the warning is not repeated
+    assert accuracy["output_tokens"]["drift"]
+    assert drift_records(caplog) == []
+
+    # Changes seen on new entries are logged again
+    monkeypatch.setattr(estimate_accuracy, "ACCURACY_EXCEEDED_THRESHOLD", 1.0)
+    write(1, estimate=100)
+    assert drift_records(caplog) == [
+        f"Estimates for {MODEL} / general {quantity} are back within the threshold" for quantity in ("output_tokens", "cost")
+    ]
+
+
+def test_checkpoint_without_exceeded_counts_is_rebuilt(log_file):
+    write(5, estimate=25)
+    save_stats_checkpoint()
+    checkpoint = logging_service._checkpoint_file()
+    saved = json.loads(checkpoint.read_text())
+    for state in saved["estimate_accuracy"][MODEL]["general"].values():
+        del state["exceeded"]          # as written before the field existed
+    checkpoint.write_text(json.dumps(saved))
+    restart()
+
+    accuracy, = get_estimate_accuracy()
+    assert accuracy["output_tokens"]["exceeded"] == 1.0 and accuracy["output_tokens"]["samples"] == 5
@@ -0,0 +1,106 @@
+"""Hedged requests: what the losing call costs."""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from backend import app as app_module
+from backend import latency_tracker, llm_client, response_cache
+from backend.cost_estimator import calculate_actual_cost
+from backend.logging_service import read_logs
+
+REQUEST = {"prompt": "Write a haiku about routers", "task_type": "general", "budget": 0.01, "hedge": True}
+
+
+@pytest.fixture(autouse=True)
+def hedge_quickly(monkeypatch):
+    """Hedge after 50 ms and make every call go to the (mock) model."""
+    monkeypatch.setattr(app_module, "HEDGE_DELAY_MS", 50)
+    monkeypatch.setattr(latency_tracker, "p95", lambda model_id: None)
+    monkeypatch.setattr(response_cache, "_cache", None)
+
+
+def stream(chunks: int, delay: float, usage: bool) -> httpx.Response:
+    """A streaming answer of `chunks` chunks, `delay` seconds apart, with usage at the end if `usage`."""
+
+    async def body():
+        for i in range(chunks):
+            await asyncio.sleep(delay)
+            yield ("data: " + json.dumps({"choices": [{"delta": {"content": f" word{i}"}}]}) + "\n\n").encode()
+        if usage:
+            yield ("data: " + json.dumps({"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": chunks}})
+                   + "\n\n").encode()
+        yield b"data: [DONE]\n\n"
+
+    return httpx.Response(200, content=body(), headers={"content-type": "text/event-stream"})
+
+
+def slow_primary_client(models: list[str]) -> httpx.AsyncClient:
+    """The first model called streams slowly (for two seconds), every other one answers at once.
+
+    Hedged calls always stream; `models` collects the model of every call.
+    """
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        models.append(body["model"])
+        if body["model"] == models[0]:
+            return stream(chunks=200, delay=0.01, usage=False)
+        return stream(chunks=5, delay=0, usage=True)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def post(client: httpx.AsyncClient, body: dict) -> dict:
+    response = await client.post("/route", json=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def run(*bodies: dict, stagger: float = 0.0) -> tuple[list[dict], list[str]]:
+    """POST the bodies to /route concurrently (each `stagger` s after the previous)."""
+    models: list[str] = []
+    llm_client.start_client(slow_primary_client(models))
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app_module.app), base_url="http://t") as client:
+            async def delayed(i, body):
+                await asyncio.sleep(i * stagger)
+                return await post(client, body)
+            results = await asyncio.gather(*(delayed(i, body) for i, body in enumerate(bodies)))
+        await asyncio.sleep(0.05)            # background settlements and log writes
+    finally:
+        await llm_client.close_client()
+    return results, models
+
+
+def test_cancelled_loser_is_billed_for_what_it_streamed(log_file, ledger):
+    (response,), models = asyncio.run(run(REQUEST))
+
+    assert response["hedged"] and response["model"] == models[1]
+    entries = {entry["hedge"]: entry for entry in read_logs()}
+    loser = entries["cancelled"]
+    # The prompt plus the chunks that arrived before the backup won (not just the input)
+    assert loser["model"] == models[0] and loser["output_tokens"] > 0
+    assert loser["actual_cost"] == calculate_actual_cost(models[0], loser["input_tokens"], loser["output_tokens"])
+    total = entries["backup"]["actual_cost"] + loser["actual_cost"]
+    assert response["actual_cost"] == pytest.approx(total)
+    assert ledger.usage("anonymous")["daily"]["spent"] == pytest.approx(total)
+
+
+def test_coalesced_loser_costs_nothing(log_file, ledger):
+    # The second request's primary call joins the first one's (same model and prompt)
+    (first, second), models = asyncio.run(run(REQUEST, REQUEST, stagger=0.01))
+
+    assert models.count(models[0]) == 1           # one primary call, shared
+    entries = list(read_logs())
+    backup_cost, = {entry["actual_cost"] for entry in entries if entry["hedge"] == "backup"}
+    # Neither pays for the shared call in its response: the first request's goes on for the
+    # second one, and the second one only waited for it
+    assert first["actual_cost"] == second["actual_cost"] == pytest.approx(backup_cost)
+    # Once nobody waits any more the call is cancelled and billed once, to the request that made it
+    cancelled, = [entry for entry in entries if entry["hedge"] == "cancelled"]
+    assert cancelled["model"] == models[0] and cancelled["output_tokens"] > 0
+    spent = ledger.usage("anonymous")["daily"]["spent"]
+    assert spent == pytest.approx(2 * backup_cost + cancelled["actual_cost"])
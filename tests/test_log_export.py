@@ -0,0 +1,139 @@
+"""GET /logs/export: cursor pagination across segments and the current file, filters, and bad cursors."""
+
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from backend import logging_service
+from backend.app import app
+from backend.logging_service import iter_log_records, log_request
+
+MODELS = ["llama-3.1-8b-instant", "openai/gpt-oss-20b"]
+START = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def segmented_log(log_file, monkeypatch):
+    """A log that only rotates when write() starts a new segment."""
+    monkeypatch.setattr(logging_service, "LOG_SEGMENT_SECONDS", 0)
+    monkeypatch.setattr(logging_service, "LOG_SEGMENT_MAX_BYTES", 0)
+    return monkeypatch
+
+
+def write(monkeypatch, *segments: int, start: int = 0) -> None:
+    """Log entries numbered from `start`, one minute apart, alternating between two models.
+
+    Each number in `segments` is the entry count of one segment; all but
+    the last are rotated out (and compacted), the last stays in the current file.
+    """
+    n = start
+    for count in segments:
+        for i in range(count):
+            # A size limit of 1 byte rotates before the first entry of each segment
+            monkeypatch.setattr(logging_service, "LOG_SEGMENT_MAX_BYTES", 1 if i == 0 else 0)
+            log_request({
+                "timestamp": (START + timedelta(minutes=n)).isoformat(),
+                "n": n, "model": MODELS[n % 2], "actual_cost": 0.001 * (n + 1),
+            })
+            n += 1
+    monkeypatch.setattr(logging_service, "LOG_SEGMENT_MAX_BYTES", 0)
+
+
+async def get(path: str, params: dict) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+        return await client.get(path, params=params)
+
+
+def export(**params) -> list[dict]:
+    """GET /logs/export as NDJSON and return the entries (with their _cursor)."""
+    response = asyncio.run(get("/logs/export", params))
+    assert response.status_code == 200, response.text
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def export_pages(limit: int, **params) -> list[list[dict]]:
+    """Fetch every page of `limit` entries, each continuing at the previous page's last cursor."""
+    pages = []
+    cursor = None
+    while True:
+        page = export(limit=limit, **params, **({"cursor": cursor} if cursor else {}))
+        if not page:
+            return pages
+        pages.append(page)
+        cursor = page[-1]["_cursor"]
+
+
+def test_pages_continue_across_segments_and_into_the_current_file(segmented_log):
+    write(segmented_log, 3, 3, 2)
+    assert len(logging_service._segment_paths()) == 2
+
+    pages = export_pages(limit=2)
+
+    assert [[entry["n"] for entry in page] for page in pages] == [[0, 1], [2, 3], [4, 5], [6, 7]]
+    # Page [2, 3] runs across a segment boundary; the page after [4, 5] starts in the current file
+    segment_of = {entry["n"]: entry["_cursor"].rsplit(":", 2)[0] for page in pages for entry in page}
+    assert segment_of[2] != segment_of[3] and segment_of[5] != segment_of[6]
+    assert segment_of[6] == logging_service._segment_name((START + timedelta(minutes=6)).isoformat())
+
+
+def test_cursor_into_a_segment_compacted_since_it_was_issued(segmented_log):
+    compact = logging_service._compact_segments
+    segmented_log.setattr(logging_service, "_compact_segments", lambda: None)
+    write(segmented_log, 3, 3, 1)
+    assert all(path.suffix == ".jsonl" for path in logging_service._segment_paths().values())
+    # Cursors into the middle of both .jsonl segments, with byte offsets
+    cursors = {entry["n"]: cursor for cursor, entry in iter_log_records()}
+    assert int(cursors[1].rsplit(":", 1)[1]) > 0
+
+    compact()
+
+    assert all(path.suffix == ".npz" for path in logging_service._segment_paths().values())
+    assert [entry["n"] for entry in export(cursor=cursors[1])] == [2, 3, 4, 5, 6]
+    assert [entry["n"] for entry in export(cursor=cursors[4], limit=1)] == [5]
+
+
+def test_cursor_into_the_current_file_after_it_was_rotated(segmented_log):
+    write(segmented_log, 3)
+    cursor = export()[1]["_cursor"]          # entry 1, in the current file
+
+    write(segmented_log, 2, start=3)         # rotates the current file, then two more entries
+
+    assert len(logging_service._segment_paths()) == 1
+    assert [entry["n"] for entry in export(cursor=cursor)] == [2, 3, 4]
+
+
+def test_model_time_and_cost_filters_with_pagination(segmented_log):
+    write(segmented_log, 4, 4, 4)           # entries 0-11, minutes 0-11, cost 0.001 * (n + 1)
+
+    def numbers(**params) -> list[int]:
+        return [entry["n"] for page in export_pages(limit=2, **params) for entry in page]
+
+    assert numbers(model=MODELS[1]) == [1, 3, 5, 7, 9, 11]
+    from_ms = int((START + timedelta(minutes=3)).timestamp() * 1000)
+    to_ms = int((START + timedelta(minutes=9)).timestamp() * 1000)
+    assert numbers(**{"from": from_ms, "to": to_ms}) == [3, 4, 5, 6, 7, 8]
+    assert numbers(min_cost=0.0095) == [9, 10, 11]
+    assert numbers(model=MODELS[0], min_cost=0.0045, **{"to": to_ms}) == [4, 6, 8]
+    assert export(model="unknown-model") == []
+
+
+def test_csv_export_carries_the_cursor(segmented_log):
+    write(segmented_log, 2, 1)
+    response = asyncio.run(get("/logs/export", {"format": "csv", "limit": 2}))
+
+    header, first, second = response.text.splitlines()
+    assert header.startswith("cursor,")
+    cursor = second.split(",", 1)[0]
+    assert [entry["n"] for entry in export(cursor=cursor)] == [2]
+
+
+@pytest.mark.parametrize("cursor", ["nonsense", "requests-x:1", "other-20260101T000000000000:0:0", "requests-x:0:-1"])
+def test_malformed_cursor_is_a_400(segmented_log, cursor):
+    write(segmented_log, 1)
+    response = asyncio.run(get("/logs/export", {"cursor": cursor}))
+
+    assert response.status_code == 400
+    assert "Invalid cursor" in response.json()["detail"]
@@ -0,0 +1,103 @@
+"""Request log segments: rotation, compaction, rebuilding the aggregate, and cursors."""
+
+import pytest
+
+from backend import log_segments, logging_service
+from backend.logging_service import get_stats, iter_log_records, log_request, read_logs, save_stats_checkpoint
+
+MODELS = ["llama-3.1-8b-instant", "openai/gpt-oss-20b"]
+
+
+@pytest.fixture
+def rotating_log(log_file, monkeypatch):
+    """A log that starts a new segment before every entry (any non-empty file is too big)."""
+    monkeypatch.setattr(logging_service, "LOG_SEGMENT_MAX_BYTES", 1)
+    return log_file
+
+
+def write(count: int, start: int = 0) -> None:
+    """Log `count` entries numbered from `start`, alternating between two models."""
+    for i in range(start, start + count):
+        log_request({
+            "n": i, "model": MODELS[i % 2], "input_tokens": 10, "output_tokens": 20,
+            "actual_cost": 0.001 * (i + 1), "latency_ms": 100.0,
+        })
+
+
+def restart() -> None:
+    """Forget the in-memory aggregate, as a new process would start without it."""
+    logging_service._stats = None
+
+
+def test_rotated_segments_are_compacted_and_read_in_order(rotating_log):
+    write(4)
+
+    segments = logging_service._segment_paths()
+    assert len(segments) == 3 and all(path.suffix == ".npz" for path in segments.values())
+    manifest = log_segments.load_manifest(logging_service._segments_dir())
+    assert [manifest[name]["rows"] for name in segments] == [1, 1, 1]
+    # Three closed segments plus the current file
+    assert [entry["n"] for entry in read_logs()] == [0, 1, 2, 3]
+    assert [entry["n"] for entry in read_logs(model=MODELS[1])] == [1, 3]
+    assert [entry["n"] for entry in read_logs(min_cost=0.0025)] == [2, 3]
+
+
+def test_aggregate_is_rebuilt_from_checkpoint_and_segments(rotating_log):
+    write(3)
+    save_stats_checkpoint()
+    write(2, start=3)                  # rotates the file the checkpoint was counting
+    expected = get_stats()
+    assert expected["total_requests"] == 5
+
+    restart()
+    assert get_stats() == expected
+
+    # Without a checkpoint everything is recounted from the segments and the current file
+    restart()
+    logging_service._checkpoint_file().unlink()
+    assert get_stats() == expected
+    assert expected["model_usage"] == {MODELS[0]: 3, MODELS[1]: 2}
+    assert expected["total_cost"] == pytest.approx(0.015)
+
+
+def test_segment_not_yet_compacted_is_counted_once(rotating_log, monkeypatch):
+    # A crash between rotation and compaction leaves the segment as .jsonl
+    compact = logging_service._compact_segments
+    monkeypatch.setattr(logging_service, "_compact_segments", lambda: None)
+    write(3)
+    assert all(path.suffix == ".jsonl" for path in logging_service._segment_paths().values())
+    restart()
+    assert get_stats()["total_requests"] == 3
+
+    compact()
+    assert all(path.suffix == ".npz" for path in logging_service._segment_paths().values())
+    assert get_stats()["total_requests"] == 3
+    restart()
+    assert get_stats()["total_requests"] == 3
+
+
+def test_cursor_resumes_across_rotation(rotating_log):
+    write(2)
+    records = list(iter_log_records())
+    cursor = records[-1][0]           # points into the current, not yet rotated file
+
+    write(2, start=2)                  # rotates the file the cursor points into
+
+    assert [entry["n"] for _, entry in iter_log_records(cursor=cursor)] == [2, 3]
+    first_cursor = records[0][0]
+    assert [entry["n"] for _, entry in iter_log_records(cursor=first_cursor)] == [1, 2, 3]
+
+
+def test_cursor_within_one_file(log_file):
+    write(5)
+    cursors = [cursor for cursor, _ in iter_log_records()]
+
+    assert [entry["n"] for _, entry in iter_log_records(cursor=cursors[2])] == [3, 4]
+    assert list(iter_log_records(cursor=cursors[-1])) == []
+
+
+@pytest.mark.parametrize("cursor", ["nonsense", "requests-x:1", "other-20260101T000000000000:0:0", "requests-x:-1:0"])
+def test_malformed_cursor_is_rejected(log_file, cursor):
+    write(1)
+    with pytest.raises(ValueError):
+        list(iter_log_records(cursor=cursor))
@@ -0,0 +1,140 @@
+"""Prometheus metrics: merging the snapshots of several workers."""
+
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from backend import app as app_module
+from backend import metrics
+
+# Process IDs above the kernel's maximum never belong to a running process
+STOPPED_PID = 99_999_999
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    """Share snapshots through a temporary directory, with this worker's metrics starting at zero."""
+    monkeypatch.setattr(metrics, "METRICS_DIR", tmp_path)
+    monkeypatch.setattr(metrics, "METRICS_FLUSH_INTERVAL", 5.0)
+    for metric in metrics.REGISTRY:
+        monkeypatch.setattr(metric, "values", {})
+    return tmp_path
+
+
+def other_worker(directory, name: str, coalesced: float, in_flight: float, age: float = 0.0) -> None:
+    """Write the snapshot of another worker that last wrote `age` seconds ago."""
+    path = directory / f"{name}.json"
+    path.write_text(json.dumps({
+        metrics.COALESCED.name: [[[], coalesced]],
+        metrics.IN_FLIGHT.name: [[[], in_flight]],
+    }))
+    written = time.time() - age
+    os.utime(path, (written, written))
+
+
+def value(text: str, name: str) -> float:
+    """Return the value of an unlabelled metric in /metrics output."""
+    line, = (line for line in text.splitlines() if line.startswith(f"{name} "))
+    return float(line.split()[1])
+
+
+def test_counters_of_stopped_workers_stay_in_the_total(metrics_dir):
+    metrics.COALESCED.inc()
+    metrics.IN_FLIGHT.inc()
+    other_worker(metrics_dir, "101-1", coalesced=2, in_flight=3)
+    other_worker(metrics_dir, "102-1", coalesced=4, in_flight=5, age=60)    # stopped a minute ago
+
+    text = metrics.render()
+
+    assert value(text, metrics.COALESCED.name) == 1 + 2 + 4
+    # A stopped worker has no requests in flight any more
+    assert value(text, metrics.IN_FLIGHT.name) == 1 + 3
+
+
+def test_own_snapshot_is_not_counted_twice(metrics_dir):
+    metrics.COALESCED.inc(amount=5)
+    metrics.write_snapshot(metrics.snapshot())
+
+    assert value(metrics.render(), metrics.COALESCED.name) == 5
+
+
+def test_restarted_process_id_does_not_replace_old_totals(metrics_dir, monkeypatch):
+    metrics.COALESCED.inc(amount=5)
+    metrics.write_snapshot(metrics.snapshot())
+
+    # A new worker process that got the same process ID
+    monkeypatch.setattr(metrics, "_worker", None)
+    monkeypatch.setattr(metrics.COALESCED, "values", {(): 1.0})
+    metrics.write_snapshot(metrics.snapshot())
+
+    assert len(list(metrics_dir.glob("*.json"))) == 2
+    assert value(metrics.render(), metrics.COALESCED.name) == 1 + 5
+
+
+def test_snapshots_of_stopped_workers_are_merged_and_deleted(metrics_dir):
+    other_worker(metrics_dir, f"{STOPPED_PID}-1", coalesced=2, in_flight=3, age=60)
+    other_worker(metrics_dir, f"{STOPPED_PID}-2", coalesced=4, in_flight=5, age=60)
+    # Stopped writing, but its process still runs (e.g. its event loop is blocked)
+    other_worker(metrics_dir, f"{os.getppid()}-1", coalesced=8, in_flight=1, age=60)
+    before = value(metrics.render(), metrics.COALESCED.name)
+
+    metrics.write_snapshot(metrics.snapshot())
+
+    names = sorted(path.name for path in metrics_dir.glob("*.json"))
+    assert names == sorted([f"{os.getppid()}-1.json", metrics._snapshot_name(), metrics.STOPPED_FILE])
+    stopped = json.loads((metrics_dir / metrics.STOPPED_FILE).read_text())
+    assert stopped["metrics"] == {metrics.COALESCED.name: [[[], 6]]}
+    assert value(metrics.render(), metrics.COALESCED.name) == before == 2 + 4 + 8
+
+    # A later stopped worker is added to the merged totals
+    other_worker(metrics_dir, f"{STOPPED_PID}-3", coalesced=16, in_flight=0, age=60)
+    metrics.write_snapshot(metrics.snapshot())
+    assert value(metrics.render(), metrics.COALESCED.name) == 2 + 4 + 8 + 16
+    assert not (metrics_dir / f"{STOPPED_PID}-3.json").exists()
+
+
+def test_merged_snapshot_still_on_disk_is_not_counted_twice(metrics_dir):
+    # As after a crash between writing STOPPED_FILE and deleting the snapshot
+    other_worker(metrics_dir, f"{STOPPED_PID}-1", coalesced=2, in_flight=0, age=60)
+    (metrics_dir / metrics.STOPPED_FILE).write_text(json.dumps({
+        "metrics": {metrics.COALESCED.name: [[[], 2]]}, "merged": [f"{STOPPED_PID}-1.json"],
+    }))
+    assert value(metrics.render(), metrics.COALESCED.name) == 2
+
+    metrics.write_snapshot(metrics.snapshot())
+
+    assert value(metrics.render(), metrics.COALESCED.name) == 2
+    assert not (metrics_dir / f"{STOPPED_PID}-1.json").exists()
+
+
+def test_snapshot_is_a_copy(metrics_dir):
+    metrics.STAGE_DURATION.observe(0.001, "compress")
+    data = metrics.snapshot()
+    metrics.STAGE_DURATION.observe(0.001, "compress")
+
+    (labels, counts), = data[metrics.STAGE_DURATION.name]
+    assert labels == ["compress"] and sum(counts[:-1]) == 1
+
+
+def test_flusher_survives_a_failed_write(metrics_dir, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_FLUSH_INTERVAL", 0.001)
+    calls = []
+
+    def write_snapshot(data):
+        calls.append(data)
+        if len(calls) == 1:
+            raise OSError("disk full")
+
+    monkeypatch.setattr(metrics, "write_snapshot", write_snapshot)
+
+    async def run():
+        flusher = asyncio.create_task(app_module.flush_metrics())
+        while len(calls) < 3:
+            await asyncio.sleep(0.001)
+        flusher.cancel()
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert len(calls) >= 3
@@ -0,0 +1,139 @@
+"""Model catalogue: hot reload, GET /models with ETag, and rate limiters following limit changes."""
+
+import asyncio
+import json
+import logging
+import os
+
+import httpx
+import pytest
+
+from backend import model_config, rate_limiter
+from backend.app import app
+from backend.model_config import get_catalogue, get_model, reload_catalogue
+
+LIMITED = "llama-3.3-70b-versatile"
+OTHER = "llama-3.1-8b-instant"
+
+
+@pytest.fixture
+def catalogue_file(tmp_path, monkeypatch):
+    """A copy of models.json, loaded as the current catalogue for one test."""
+    path = tmp_path / "models.json"
+    path.write_text(model_config.MODEL_CATALOG_PATH.read_text())
+    monkeypatch.setattr(model_config, "_catalogue", get_catalogue())
+    monkeypatch.setattr(model_config, "_retired", {})
+    monkeypatch.setattr(model_config, "_failed_signature", None)
+    model_config.set_catalogue(model_config.load_catalogue(path))
+    return path
+
+
+def edit(path, change) -> None:
+    """Apply change(data) to the catalogue file and give it a new modification time."""
+    data = json.loads(path.read_text())
+    change(data)
+    save(path, json.dumps(data))
+
+
+def save(path, text: str) -> None:
+    stat = path.stat()
+    path.write_text(text)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+async def get_models(headers: dict | None = None) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+        return await client.get("/models", headers=headers or {})
+
+
+def test_changed_file_is_loaded_with_a_new_etag(catalogue_file):
+    before = get_catalogue()
+    assert not reload_catalogue(catalogue_file)             # unchanged
+
+    edit(catalogue_file, lambda data: data["models"][OTHER].update(input_price_per_token=1e-06))
+    assert reload_catalogue(catalogue_file)
+
+    after = get_catalogue()
+    assert after.etag != before.etag and model_config.MODELS[OTHER]["input_price_per_token"] == 1e-06
+    response = asyncio.run(get_models())
+    assert response.headers["ETag"] == f'"{after.etag}"'
+    assert response.json()["models"][OTHER]["input_price_per_token"] == 1e-06
+
+
+def test_same_content_keeps_the_etag(catalogue_file):
+    etag = get_catalogue().etag
+    save(catalogue_file, json.dumps(json.loads(catalogue_file.read_text()), indent=4))
+
+    assert reload_catalogue(catalogue_file)
+    assert get_catalogue().etag == etag
+
+
+@pytest.mark.parametrize("content", ['{"models": {', '{"models": {}}', '{"models": {"x": {"name": "X"}}}'])
+def test_invalid_file_keeps_the_previous_catalogue(catalogue_file, caplog, content):
+    before = get_catalogue()
+    save(catalogue_file, content)
+
+    with caplog.at_level(logging.WARNING, logger=model_config.__name__):
+        assert not reload_catalogue(catalogue_file)
+        assert not reload_catalogue(catalogue_file)        # warned about once
+    assert get_catalogue() is before
+    assert len([record for record in caplog.records if "Keeping the current model catalogue" in record.message]) == 1
+
+    # Once the file is fixed it is loaded
+    save(catalogue_file, model_config.MODEL_CATALOG_PATH.read_text().replace("88", "87", 1))
+    assert reload_catalogue(catalogue_file) and get_catalogue().etag != before.etag
+
+
+def test_removed_model_stays_known_for_running_calls(catalogue_file):
+    edit(catalogue_file, lambda data: data["models"].pop(OTHER))
+    assert reload_catalogue(catalogue_file)
+
+    assert OTHER not in model_config.MODELS
+    assert get_model(OTHER)["name"]
+
+
+@pytest.mark.parametrize("header, status", [
+    (None, 200),
+    ("{etag}", 304),
+    ("W/{etag}", 304),
+    ('"stale", {etag}', 304),
+    ("*", 304),
+    ('"stale"', 200),
+])
+def test_if_none_match(catalogue_file, header, status):
+    etag = f'"{get_catalogue().etag}"'
+    headers = {"If-None-Match": header.format(etag=etag)} if header else {}
+
+    response = asyncio.run(get_models(headers))
+
+    assert response.status_code == status
+    assert response.headers["ETag"] == etag
+    if status == 304:
+        assert response.content == b""
+
+
+def test_rate_limiters_are_recreated_only_when_their_limits_change(catalogue_file, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+    monkeypatch.setattr(rate_limiter, "_catalogue_etag", None)
+    assert rate_limiter.try_acquire(LIMITED, 100) and rate_limiter.try_acquire(OTHER, 100)
+    limited, other = rate_limiter._limiters[LIMITED], rate_limiter._limiters[OTHER]
+    other.blocked_until = float("inf")          # e.g. told to wait by the provider
+
+    # A price change only: both limiters stay, with what they have used
+    edit(catalogue_file, lambda data: data["models"][LIMITED].update(input_price_per_token=1e-06))
+    assert reload_catalogue(catalogue_file)
+    rate_limiter.try_acquire(LIMITED, 100)
+    assert rate_limiter._limiters[LIMITED] is limited and rate_limiter._limiters[OTHER] is other
+
+    # New limits for one model: only its limiter is replaced
+    edit(catalogue_file, lambda data: data["models"][LIMITED].update(rpm=60, tpm=50_000))
+    assert reload_catalogue(catalogue_file)
+    rate_limiter.try_acquire(LIMITED, 100)
+    assert rate_limiter._limiters[LIMITED] is not limited and rate_limiter._limiters[LIMITED].limits == (60, 50_000)
+    assert rate_limiter._limiters[OTHER] is other
+
+    # Limits removed: no limiter, but a provider's block still applies
+    edit(catalogue_file, lambda data: [data["models"][OTHER].pop(key, None) for key in ("rpm", "tpm")])
+    assert reload_catalogue(catalogue_file)
+    assert not rate_limiter.try_acquire(OTHER, 100)
+    assert rate_limiter._limiters[OTHER].limits == (None, None)
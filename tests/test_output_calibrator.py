@@ -0,0 +1,59 @@
+"""Output calibration: P² quantiles and the lock-free ratios for routing."""
+
+import random
+import threading
+
+import pytest
+
+from backend import logging_service, output_calibrator
+from backend.logging_service import get_output_ratios, log_request
+
+
+@pytest.mark.parametrize("q", [0.5, 0.9])
+def test_p2_estimate_is_close_to_the_true_quantile(q):
+    rng = random.Random(7)
+    values = [rng.expovariate(1.0) for _ in range(20_000)]
+    state = output_calibrator.new_state(q)
+    for value in values:
+        output_calibrator.add(state, value)
+
+    exact = sorted(values)[int(q * len(values))]
+    assert output_calibrator.value(state) == pytest.approx(exact, rel=0.05)
+
+
+def test_few_observations_use_their_own_quantile():
+    state = output_calibrator.new_state(0.9)
+    for value in (3.0, 1.0, 2.0):
+        output_calibrator.add(state, value)
+
+    assert output_calibrator.value(state) == 3.0
+    assert output_calibrator.value(output_calibrator.new_state()) is None
+
+
+def test_only_real_calls_are_observed():
+    calibration = {}
+    base = {"model": "m", "task_type": "general", "input_tokens": 10, "output_tokens": 20}
+    for skipped in ({"cache_hit": True}, {"coalesced": True}, {"cancelled": True}, {"hedge": "cancelled"}):
+        output_calibrator.observe(calibration, {**base, **skipped})
+    assert calibration == {}
+
+    output_calibrator.observe(calibration, {**base, "max_tokens": 20})
+    # Cut off at max_tokens: counted with TRUNCATED_RATIO_FACTOR times its ratio
+    assert calibration["m"]["general"]["heights"] == [2.0 * output_calibrator.TRUNCATED_RATIO_FACTOR]
+
+
+def test_output_ratios_are_read_without_the_stats_lock(log_file, monkeypatch):
+    monkeypatch.setattr(output_calibrator, "OUTPUT_CALIBRATION_MIN_SAMPLES", 3)
+    for _ in range(3):
+        log_request({"model": "m", "task_type": "general", "input_tokens": 10, "output_tokens": 30})
+    assert get_output_ratios("general") == {"m": pytest.approx(3.0)}
+
+    # The log writer holds the lock while it writes and fsyncs; routing must not wait for it
+    result = []
+    with logging_service._stats_lock:
+        reader = threading.Thread(target=lambda: result.append(get_output_ratios("general")))
+        reader.start()
+        reader.join(timeout=2)
+        assert not reader.is_alive()
+    assert result == [{"m": pytest.approx(3.0)}]
+    assert get_output_ratios("summarization") == {}
@@ -0,0 +1,54 @@
+"""Prompt compression: cleanup, extractive ranking and when compression is applied."""
+
+from backend.cost_estimator import estimate_tokens
+from backend.prompt_compressor import compress_prompt, rank_sentences
+
+TOPIC = [
+    "The lighthouse keeper logged every ship that passed the lighthouse.",
+    "Storms damaged the lighthouse lamp twice during the winter.",
+    "The keeper repaired the lighthouse lamp with parts from the mainland.",
+    "My cousin once had a sandwich on a ferry.",
+    "Ships relied on the lighthouse lamp during storms.",
+]
+
+
+def test_single_line_prompt_is_compressed():
+    prompt = "Summarise the following notes: " + " ".join(
+        f"{sentence[:-1]} in year {year}." for year in range(1900, 1900 + 25) for sentence in TOPIC
+    )
+    assert "\n" not in prompt and len(prompt) > 7000
+
+    result = compress_prompt(prompt, "summarize")
+
+    assert result.applied
+    assert result.compressed_tokens <= estimate_tokens(prompt) * 0.6
+    assert result.prompt.startswith("Summarise the following notes: The lighthouse keeper")
+
+
+def test_first_sentence_is_kept_and_asides_go_first():
+    prompt = "Answer in one word. " + " ".join(TOPIC) + "\n\n" + " ".join(TOPIC[:3])
+
+    compressed = rank_sentences(prompt, estimate_tokens(prompt) // 3)
+
+    assert compressed.startswith("Answer in one word.")
+    assert "sandwich" not in compressed
+    # Repeated sentences are kept only once
+    assert compressed.count(TOPIC[0]) <= 1
+
+
+def test_repeated_lines_and_boilerplate_are_dropped():
+    body = "\n".join(TOPIC)
+    prompt = f"Summarise:\n{body}\n{body}\n\nSent from my iPhone\nAll rights reserved."
+
+    result = compress_prompt(prompt, "summarize", target_tokens=estimate_tokens(body) + 10)
+
+    assert result.prompt == f"Summarise:\n{body}"
+
+
+def test_code_keeps_its_lines():
+    prompt = "Fix this function:\n\ndef f(x):   \n    return x + 1\n\n\n\n" + "# comment\n" * 50
+
+    result = compress_prompt(prompt, "code")
+
+    assert result.prompt.splitlines().count("# comment") == 50
+    assert "    return x + 1" in result.prompt
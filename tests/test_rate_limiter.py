@@ -0,0 +1,161 @@
+"""Rate limiting: token buckets, provider headers, and how /route/batch reserves capacity."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from backend import llm_client, rate_limiter, response_cache
+from backend.app import app
+from backend.model_config import get_catalogue
+from backend.rate_limiter import ModelLimiter
+
+MODEL = "llama-3.1-8b-instant"
+
+
+@pytest.fixture
+def limiters(monkeypatch):
+    """Start from fresh limiters; returns a function that installs one with given limits."""
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+    monkeypatch.setattr(rate_limiter, "_catalogue_etag", get_catalogue().etag)
+
+    def install(model_id: str, rpm: float | None, tpm: float | None) -> ModelLimiter:
+        limiter = rate_limiter._limiters[model_id] = ModelLimiter(rpm, tpm)
+        return limiter
+
+    return install
+
+
+def test_saturated_model_is_refused_until_given_back(limiters):
+    limiters(MODEL, rpm=2, tpm=1000)
+
+    assert rate_limiter.try_acquire(MODEL, 400)
+    assert rate_limiter.try_acquire(MODEL, 400)
+    assert not rate_limiter.try_acquire(MODEL, 100)          # no requests left
+
+    rate_limiter.release(MODEL, 400)                         # a call that was never sent
+    assert rate_limiter.try_acquire(MODEL, 400)
+    assert not rate_limiter.try_acquire(MODEL, 100)
+
+
+def test_settle_returns_unused_tokens(limiters):
+    limiter = limiters(MODEL, rpm=None, tpm=1000)
+    rate_limiter.try_acquire(MODEL, 900)
+
+    rate_limiter.settle(MODEL, 900, 300)
+
+    assert limiter.tokens.available() == pytest.approx(700, abs=1)
+
+
+def test_acquire_waits_for_capacity(limiters):
+    limiter = limiters(MODEL, rpm=600, tpm=None)             # refills one request every 0.1 s
+    limiter.requests.level = 0
+
+    start = time.monotonic()
+    assert asyncio.run(rate_limiter.acquire(MODEL, 10, timeout=1.0))
+    assert 0.05 < time.monotonic() - start < 0.5
+
+
+def test_acquire_gives_up_without_reserving(limiters):
+    limiter = limiters(MODEL, rpm=60, tpm=None)
+    limiter.blocked_until = time.monotonic() + 5
+
+    start = time.monotonic()
+    assert not asyncio.run(rate_limiter.acquire(MODEL, 10, timeout=0.2))
+    # It knows up front that 0.2 s is not enough and does not sit out the timeout
+    assert time.monotonic() - start < 0.1
+    assert limiter.requests.available() == pytest.approx(60, abs=1)
+
+
+def ok_client() -> httpx.AsyncClient:
+    """Client whose model calls all succeed."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "ok"}}], "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+        })
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def post_batch(body: dict, status_code: int = 200) -> dict:
+    """POST /route/batch through the ASGI app with a mock model client."""
+    llm_client.start_client(ok_client())
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post("/route/batch", json=body)
+    finally:
+        await llm_client.close_client()
+    assert response.status_code == status_code
+    return response.json()
+
+
+def test_batch_items_wait_for_rate_limited_models(limiters, log_file, monkeypatch):
+    monkeypatch.setattr(response_cache, "_cache", None)
+    # Every model is blocked for a moment, as after a 429; planning alone must not fail the items
+    blocked_until = time.monotonic() + 0.3
+    for model_id in get_catalogue().models:
+        limiters(model_id, rpm=None, tpm=None).blocked_until = blocked_until
+
+    start = time.monotonic()
+    body = asyncio.run(post_batch({"requests": [
+        {"prompt": f"Question number {i}: what is {i} + {i}?", "task_type": "general", "budget": 0.01}
+        for i in range(3)
+    ]}))
+
+    assert [item["status_code"] for item in body["results"]] == [200, 200, 200]
+    assert time.monotonic() - start >= 0.3
+
+
+def test_rejected_batch_reserves_nothing(limiters, log_file, monkeypatch):
+    monkeypatch.setattr(response_cache, "_cache", None)
+    acquired = []
+    monkeypatch.setattr(rate_limiter, "try_acquire", lambda model_id, tokens: acquired.append(model_id) or True)
+    requests = [
+        {"prompt": f"Question number {i}: what is {i} + {i}?", "task_type": "general", "budget": 0.01}
+        for i in range(3)
+    ]
+
+    asyncio.run(post_batch({"requests": requests, "budget": 1e-9}, status_code=400))
+
+    assert acquired == []
+
+
+def test_token_headers_sync_the_bucket(limiters):
+    limiter = limiters(MODEL, rpm=30, tpm=6000)
+
+    rate_limiter.update_from_headers(MODEL, 200, {
+        "x-ratelimit-limit-tokens": "8000", "x-ratelimit-remaining-tokens": "1500",
+        # Groq counts requests per day; 14000 left today says nothing about this minute
+        "x-ratelimit-limit-requests": "14400", "x-ratelimit-remaining-requests": "14000",
+    })
+
+    assert limiter.tokens.capacity == 8000
+    assert limiter.tokens.available() == pytest.approx(1500, abs=1)
+    assert limiter.requests.server_level is None
+    assert limiter.requests.available() == pytest.approx(30, abs=1)
+
+
+def test_exhausted_daily_requests_block_until_reset(limiters):
+    limiter = limiters(MODEL, rpm=30, tpm=6000)
+
+    rate_limiter.update_from_headers(MODEL, 200, {
+        "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2m59.56s",
+    })
+
+    assert limiter.blocked_until - time.monotonic() == pytest.approx(179.56, abs=1)
+    assert not rate_limiter.try_acquire(MODEL, 10)
+
+
+def test_malformed_headers_are_ignored(limiters):
+    limiter = limiters(MODEL, rpm=30, tpm=6000)
+
+    rate_limiter.update_from_headers(MODEL, 200, {
+        "x-ratelimit-limit-tokens": "lots", "x-ratelimit-remaining-tokens": "nan",
+        "x-ratelimit-remaining-requests": "", "x-ratelimit-reset-tokens": "soon",
+    })
+
+    assert limiter.tokens.capacity == 6000
+    assert limiter.tokens.server_level is None
+    assert limiter.blocked_until == 0.0
@@ -0,0 +1,159 @@
+"""Response cache: expiry, eviction by size, and the shared SQLite backend."""
+
+import asyncio
+import json
+import sqlite3
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from backend import llm_client, response_cache
+from backend.app import app
+from backend.response_cache import MemoryCache, SQLiteCache
+
+# Every answer is this many bytes as JSON
+ANSWER_SIZE = len(json.dumps({"content": "a"}).encode())
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake clock for both backends, advanced with clock.advance(seconds)."""
+    now = [1_000_000.0]
+    fake = SimpleNamespace(time=lambda: now[0], monotonic=lambda: now[0])
+    fake.advance = lambda seconds: now.__setitem__(0, now[0] + seconds)
+    monkeypatch.setattr(response_cache, "time", fake)
+    return fake
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    """Return a function creating a cache of each backend."""
+    def make(ttl: float = 3600, max_bytes: int = 10**6):
+        if request.param == "memory":
+            return MemoryCache(ttl=ttl, max_bytes=max_bytes)
+        return SQLiteCache(tmp_path / "cache.sqlite3", ttl=ttl, max_bytes=max_bytes)
+    return make
+
+
+def size_of(cache) -> int:
+    return cache.size if isinstance(cache, MemoryCache) else cache.nbytes()
+
+
+def test_entries_expire_after_ttl(make_cache, clock):
+    cache = make_cache(ttl=60)
+    cache.set("a", {"content": "a"})
+
+    clock.advance(59)
+    assert cache.get("a") == {"content": "a"}
+    clock.advance(2)
+    assert cache.get("a") is None
+
+
+def test_least_recently_used_entries_are_evicted_by_size(make_cache, clock):
+    cache = make_cache(max_bytes=2 * ANSWER_SIZE)
+    cache.set("a", {"content": "a"})
+    clock.advance(100)
+    cache.set("b", {"content": "b"})
+    clock.advance(100)
+    assert cache.get("a") is not None          # now "b" is the least recently used
+
+    clock.advance(100)
+    cache.set("c", {"content": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert size_of(cache) == 2 * ANSWER_SIZE
+
+
+def test_replaced_entry_counts_once(make_cache, clock):
+    cache = make_cache()
+    cache.set("a", {"content": "a"})
+    cache.set("a", {"content": "b"})
+
+    assert cache.get("a") == {"content": "b"}
+    assert size_of(cache) == ANSWER_SIZE
+
+
+def test_answer_larger_than_the_cache_is_not_stored(make_cache, clock):
+    cache = make_cache(max_bytes=ANSWER_SIZE - 1)
+    cache.set("a", {"content": "a"})
+    assert cache.get("a") is None and size_of(cache) == 0
+
+
+def test_sqlite_cache_is_shared_and_keeps_its_size_total(tmp_path, clock):
+    path = tmp_path / "cache.sqlite3"
+    first, second = SQLiteCache(path), SQLiteCache(path)    # e.g. two worker processes
+    first.set("a", {"content": "a"})
+    second.set("b", {"content": "b"})
+
+    assert second.get("a") == {"content": "a"} and first.get("b") == {"content": "b"}
+    assert first.nbytes() == second.nbytes() == 2 * ANSWER_SIZE
+
+    clock.advance(3601)
+    second.set("c", {"content": "c"})           # drops the expired entries
+    assert first.nbytes() == ANSWER_SIZE
+
+
+def test_sqlite_size_total_is_built_for_an_existing_database(tmp_path, clock):
+    path = tmp_path / "cache.sqlite3"
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+        " expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+    )
+    db.execute("INSERT INTO responses VALUES ('a', '{}', 123, 9e9, 0)")
+    db.commit()
+    db.close()
+
+    assert SQLiteCache(path).nbytes() == 123
+
+
+def test_sqlite_errors_are_a_miss_or_a_skipped_store(tmp_path, clock):
+    path = tmp_path / "cache.sqlite3"
+    cache = SQLiteCache(path, timeout=0.05)
+    cache.set("a", {"content": "a"})
+
+    # Another worker holds the write lock: storing gives up after the timeout
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    cache.set("b", {"content": "b"})
+    assert cache.get("a") == {"content": "a"}   # reading needs no write lock
+    other.execute("ROLLBACK")
+    assert cache.get("b") is None
+
+    cache._db.close()
+    assert cache.get("a") is None
+
+
+def test_route_answers_when_the_sqlite_cache_fails(tmp_path, monkeypatch, log_file, ledger):
+    cache = SQLiteCache(tmp_path / "cache.sqlite3")
+    monkeypatch.setattr(response_cache, "_cache", cache)
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "Hi"}}], "usage": {"prompt_tokens": 5, "completion_tokens": 1},
+        })
+
+    async def post(client: httpx.AsyncClient) -> dict:
+        response = await client.post("/route", json={"prompt": "Say hi", "task_type": "general", "budget": 0.01})
+        assert response.status_code == 200, response.text
+        await asyncio.sleep(0.05)            # the store runs in the background
+        return response.json()
+
+    async def run():
+        llm_client.start_client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+                first, second = await post(client), await post(client)
+                cache._db.close()                # e.g. a corrupt or unreadable database
+                third = await post(client)
+        finally:
+            await llm_client.close_client()
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert (first["cached"], second["cached"], third["cached"]) == (False, True, False)
+    assert len(calls) == 2
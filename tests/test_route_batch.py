@@ -0,0 +1,110 @@
+"""POST /route/batch: the batch budget and the concurrency limits."""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from backend import app as app_module
+from backend import llm_client, rate_limiter, response_cache
+from backend.app import app
+from backend.logging_service import read_logs
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    """Call the (mock) model for every item, with rate limiters nothing else has used."""
+    monkeypatch.setattr(response_cache, "_cache", None)
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+
+
+def batch(count: int, task_type: str = "general") -> list[dict]:
+    """Distinct requests, so none of them share another's call."""
+    return [
+        {"prompt": f"Question number {i}: what is {i} + {i}?", "task_type": task_type, "budget": 0.01}
+        for i in range(count)
+    ]
+
+
+async def post_batch(body: dict, handler) -> httpx.Response:
+    """POST /route/batch through the ASGI app, with model answers from `handler`."""
+    llm_client.start_client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            return await client.post("/route/batch", json=body)
+    finally:
+        await llm_client.close_client()
+
+
+def answer(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={
+        "choices": [{"message": {"content": "ok"}}], "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+    })
+
+
+def test_batch_over_budget_is_rejected_as_a_whole(log_file, ledger):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return answer(request)
+
+    # The estimated costs of these items, from the same batch without a budget
+    response = asyncio.run(post_batch({"requests": batch(3)}, handler))
+    total = response.json()["total_estimated_cost"]
+    calls.clear()
+    spent = ledger.usage("anonymous")["daily"]["spent"]
+
+    # The first items fit, the whole batch does not
+    response = asyncio.run(post_batch({"requests": batch(3), "budget": total * 0.9}, handler))
+
+    assert response.status_code == 400
+    assert "exceeds the batch budget" in response.json()["detail"]
+    assert calls == []
+    assert len(list(read_logs())) == 3              # only the first batch
+    daily = ledger.usage("anonymous")["daily"]
+    assert daily["reserved"] == 0.0 and daily["spent"] == spent
+
+    response = asyncio.run(post_batch({"requests": batch(3), "budget": total}, handler))
+    assert [item["status_code"] for item in response.json()["results"]] == [200, 200, 200]
+    assert len(calls) == 3
+
+
+def test_items_that_cannot_be_routed_do_not_count_against_the_batch_budget(log_file, ledger):
+    requests = batch(2) + [{"prompt": "Too cheap", "task_type": "general", "budget": 1e-12}]
+
+    response = asyncio.run(post_batch({"requests": requests, "budget": 0.01}, answer))
+
+    assert response.status_code == 200
+    assert [item["status_code"] for item in response.json()["results"]] == [200, 200, 400]
+
+
+@pytest.mark.parametrize("per_model, overall", [(2, 16), (3, 4), (4, 2)])
+def test_per_model_concurrency_never_exceeds_the_limit(log_file, ledger, monkeypatch, per_model, overall):
+    monkeypatch.setattr(app_module, "BATCH_MAX_CONCURRENCY_PER_MODEL", per_model)
+    monkeypatch.setattr(app_module, "BATCH_MAX_CONCURRENCY", overall)
+    in_flight: dict[str, int] = {}
+    peak: dict[str, int] = {}
+    peak_overall = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal peak_overall
+        model = json.loads(request.content)["model"]
+        in_flight[model] = in_flight.get(model, 0) + 1
+        peak[model] = max(peak.get(model, 0), in_flight[model])
+        peak_overall = max(peak_overall, sum(in_flight.values()))
+        await asyncio.sleep(0.02)
+        in_flight[model] -= 1
+        return answer(request)
+
+    # Code and email requests go to different models
+    response = asyncio.run(post_batch({"requests": batch(10, "code") + batch(10, "email")}, handler))
+
+    results = response.json()["results"]
+    assert [item["status_code"] for item in results] == [200] * 20
+    assert len({item["result"]["model"] for item in results}) > 1
+    limit = min(per_model, overall)
+    assert max(peak.values()) == limit
+    assert all(count <= limit for count in peak.values())
+    assert peak_overall <= overall
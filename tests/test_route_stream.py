@@ -0,0 +1,170 @@
+"""POST /route/stream: the events sent, and settling, rate limiting and logging when the client goes away."""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from backend import circuit_breaker, llm_client, rate_limiter, response_cache
+from backend.app import app
+from backend.cost_estimator import calculate_actual_cost
+from backend.logging_service import read_logs
+
+REQUEST = {"prompt": "Tell me a long story about a lighthouse", "task_type": "general", "budget": 0.01}
+
+
+@pytest.fixture(autouse=True)
+def no_response_cache(monkeypatch):
+    """Make every request call the (mock) model instead of reusing an earlier test's answer."""
+    monkeypatch.setattr(response_cache, "_cache", None)
+
+
+def slow_stream_client(chunks: int = 50) -> httpx.AsyncClient:
+    """Client whose streaming answers arrive one chunk every 10 ms."""
+
+    async def body():
+        for i in range(chunks):
+            yield ("data: " + json.dumps({"choices": [{"delta": {"content": f" word{i}"}}]}) + "\n\n").encode()
+            await asyncio.sleep(0.01)
+        yield b"data: [DONE]\n\n"
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=body(), headers={"content-type": "text/event-stream"})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def sse_events(body: str) -> list[tuple[str, dict]]:
+    """Parse a Server-Sent Events body into (event, data) pairs."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = (line.split(": ", 1)[1] for line in block.splitlines())
+        events.append((event, json.loads(data)))
+    return events
+
+
+def post_stream(handler) -> list[tuple[str, dict]]:
+    """POST /route/stream with upstream answers from `handler` and return the events."""
+    async def run():
+        llm_client.start_client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+                response = await client.post("/route/stream", json=REQUEST)
+                await asyncio.sleep(0.05)        # background settlements
+        finally:
+            await llm_client.close_client()
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"].startswith("text/event-stream")
+        return sse_events(response.text)
+
+    return asyncio.run(run())
+
+
+async def stream_until(disconnect_after_tokens: int | None) -> list[bytes]:
+    """POST /route/stream through the ASGI app; disconnect after some token events (None = read it all)."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/route/stream", "raw_path": b"/route/stream", "query_string": b"",
+        "headers": [(b"content-type", b"application/json")], "client": ("test", 1), "server": ("test", 80),
+        "root_path": "", "app": app,
+    }
+    body = json.dumps(REQUEST).encode()
+    request_sent = False
+    gone = asyncio.Event()
+    received: list[bytes] = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            received.append(message["body"])
+            tokens = sum(chunk.count(b"event: token") for chunk in received)
+            if disconnect_after_tokens is not None and tokens >= disconnect_after_tokens:
+                gone.set()
+
+    llm_client.start_client(slow_stream_client())
+    try:
+        await app(scope, receive, send)
+        await asyncio.sleep(0.05)            # let the closed stream's cleanup run
+    finally:
+        await llm_client.close_client()
+    return received
+
+
+def test_completed_stream_settles_and_logs(log_file, ledger):
+    received = asyncio.run(stream_until(None))
+
+    assert b"event: done" in b"".join(received)
+    entries = list(read_logs())
+    assert len(entries) == 1 and entries[0]["stream"] and "cancelled" not in entries[0]
+    daily = ledger.usage("anonymous")["daily"]
+    assert daily["reserved"] == 0.0
+    assert daily["spent"] == entries[0]["actual_cost"] > 0
+
+
+def test_disconnect_mid_stream_charges_usage_so_far(log_file, ledger):
+    received = asyncio.run(stream_until(3))
+
+    assert b"event: done" not in b"".join(received)
+    entries = list(read_logs())
+    assert len(entries) == 1
+    entry = entries[0]
+    assert entry["cancelled"] is True and entry["stream"] is True
+    # The prompt and the chunks sent so far are billed, not the whole estimate
+    assert 0 < entry["output_tokens"] < entry["output_tokens_est"]
+    daily = ledger.usage("anonymous")["daily"]
+    assert daily["reserved"] == 0.0
+    assert daily["spent"] == entry["actual_cost"] > 0
+
+
+def test_disconnect_settles_the_rate_limiter(log_file, ledger, monkeypatch):
+    settled = []
+    monkeypatch.setattr(rate_limiter, "settle", lambda *args: settled.append(args))
+
+    asyncio.run(stream_until(3))
+
+    (model_id, reserved, actual), = settled
+    entry, = read_logs()
+    assert model_id == entry["model"]
+    assert actual == entry["input_tokens"] + entry["output_tokens"] < reserved
+
+
+def test_stream_sends_route_tokens_and_done_with_the_reported_usage(log_file, ledger):
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)["stream"] is True
+        chunks = [{"choices": [{"delta": {"content": word}}]} for word in ("Once", " upon", " a time")]
+        chunks.append({"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": 3}})
+        body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    events = post_stream(handler)
+
+    assert [event for event, _ in events] == ["route", "token", "token", "token", "done"]
+    route, done = events[0][1], events[-1][1]
+    assert "".join(data["content"] for event, data in events if event == "token") == "Once upon a time"
+    assert done["model"] == route["model"] and done["estimated_cost"] == route["estimated_cost"]
+    assert done["tokens_used"] == 15 and done["cached"] is False
+    assert done["actual_cost"] == calculate_actual_cost(done["model"], 12, 3)
+    entry, = read_logs()
+    assert entry["stream"] and (entry["input_tokens"], entry["output_tokens"]) == (12, 3)
+    assert ledger.usage("anonymous")["daily"]["spent"] == done["actual_cost"]
+
+
+def test_upstream_failure_is_an_error_event_and_costs_nothing(log_file, ledger, monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+
+    events = post_stream(lambda request: httpx.Response(500))
+
+    assert [event for event, _ in events] == ["route", "error"]
+    assert "Error calling LLM" in events[1][1]["detail"]
+    assert list(read_logs()) == []
+    daily = ledger.usage("anonymous")["daily"]
+    assert daily["reserved"] == daily["spent"] == 0.0
@@ -0,0 +1,59 @@
+"""Semantic cache: which near-duplicate prompts may reuse an answer."""
+
+import pytest
+
+from backend.semantic_cache import SemanticCache, prompt_numbers
+
+ANSWER = {"content": "4", "input_tokens": 8, "output_tokens": 1, "latency_ms": 300.0}
+
+
+def lookup(cached: str, prompt: str) -> tuple[dict, float] | None:
+    """Cache an answer to `cached` and look up `prompt`."""
+    cache = SemanticCache(threshold=0.95)
+    cache.set("model", "general", cached, ANSWER)
+    return cache.get("model", "general", prompt, 100)
+
+
+@pytest.mark.parametrize("cached, prompt", [
+    ("What is 2+2?", "What is 7+9?"),
+    ("Multiply 1234 by 5678 and show the steps.", "Multiply 4321 by 8765 and show the steps."),
+    (
+        "Write SQL for all orders with an amount above 100 placed in 2023.",
+        "Write SQL for all orders with an amount above 250 placed in 2021.",
+    ),
+    ("Round 3.14 to one decimal.", "Round 3.15 to one decimal."),
+])
+def test_prompts_with_other_numbers_miss(cached, prompt):
+    assert lookup(cached, prompt) is None
+
+
+@pytest.mark.parametrize("cached, prompt", [
+    ("Summarize the sales report of 2024-03-15 for the Berlin store.",
+     "Summarize the sales report of 2024-04-02 for the Berlin store."),
+    ("Summarize the sales report of 15/03/2024 for the Berlin store.",
+     "summarize the sales report of  2/4/24 for the Berlin store."),
+    ("Draft an agenda for the meeting on March 15, 2024 with the design team.",
+     "Draft an agenda for the meeting on 3rd of April with the design team."),
+])
+def test_prompts_with_other_dates_hit(cached, prompt):
+    hit = lookup(cached, prompt)
+    assert hit is not None
+    answer, similarity = hit
+    assert answer == ANSWER and similarity > 0.99
+
+
+def test_numbers_in_dates_are_not_compared():
+    assert prompt_numbers("Orders of 2024-03-15 above 100 euros, at most 20") == ("100", "20")
+    assert prompt_numbers("Report for March 15, 2024") == ()
+
+
+def test_expired_and_too_long_answers_miss():
+    cache = SemanticCache(ttl=0.0)
+    cache.set("model", "general", "What is 2+2?", ANSWER)
+    assert cache.get("model", "general", "What is 2+2?", 100) is None
+    assert len(cache) == 0
+
+    cache = SemanticCache()
+    cache.set("model", "general", "What is 2+2?", ANSWER)
+    assert cache.get("model", "general", "What is 2+2?", max_tokens=0) is None
+    assert cache.get("other-model", "general", "What is 2+2?", 100) is None
@@ -0,0 +1,99 @@
+"""Request coalescing: shared calls, cancellation of waiters, and errors."""
+
+import asyncio
+
+import pytest
+
+from backend import single_flight
+
+
+def slow_call(calls: list, result="answer", delay: float = 0.05):
+    """Return a call that records its start, sleeps and returns `result` (raises it if an exception)."""
+
+    async def call():
+        calls.append("started")
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            calls.append("cancelled")
+            raise
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return call
+
+
+def test_identical_requests_share_one_call():
+    calls = []
+
+    async def run():
+        leader = single_flight.start("key", slow_call(calls))
+        follower = single_flight.get("key")
+        assert follower is leader and single_flight.in_flight() == 1
+        return await asyncio.gather(leader.wait(), follower.wait())
+
+    assert asyncio.run(run()) == ["answer", "answer"]
+    assert calls == ["started"]
+    assert single_flight.get("key") is None
+
+
+def test_cancelled_waiter_does_not_cancel_the_call_for_others():
+    calls = []
+
+    async def run():
+        flight = single_flight.start("key", slow_call(calls))
+        leader = asyncio.ensure_future(flight.wait())
+        follower = asyncio.ensure_future(flight.wait())
+        await asyncio.sleep(0.01)
+        leader.cancel()                  # e.g. the leader's client disconnected
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == "answer"
+    assert calls == ["started"]
+
+
+def test_last_waiter_cancels_the_call():
+    calls = []
+
+    async def run():
+        flight = single_flight.start("key", slow_call(calls))
+        waiter = asyncio.ensure_future(flight.wait())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # Nobody can join the cancelled call; the next identical request starts its own
+        assert single_flight.get("key") is None
+        await asyncio.sleep(0)
+        return flight.task
+
+    task = asyncio.run(run())
+    assert task.cancelled()
+    assert calls == ["started", "cancelled"]
+
+
+def test_exception_is_raised_in_every_waiter():
+    calls = []
+
+    async def run():
+        flight = single_flight.start("key", slow_call(calls, result=RuntimeError("upstream failed")))
+        return await asyncio.gather(flight.wait(), flight.wait(), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [str(result) for result in results] == ["upstream failed"] * 2
+    assert single_flight.get("key") is None
+
+
+def test_coalescing_off_gives_every_request_its_own_call(monkeypatch):
+    monkeypatch.setattr(single_flight, "REQUEST_COALESCING", "off")
+    calls = []
+
+    async def run():
+        flight = single_flight.start("key", slow_call(calls))
+        assert single_flight.get("key") is None
+        return await flight.wait()
+
+    assert asyncio.run(run()) == "answer"
@@ -0,0 +1,128 @@
+"""Spend ledger: reservations, caps, expiry, and how the API uses it."""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from backend import app as app_module
+from backend import spend_ledger
+from backend.spend_ledger import SpendCapExceeded, SpendLedger
+
+
+def test_settle_replaces_reservation_with_actual_cost(ledger):
+    reservation = ledger.reserve("acme", 0.01)
+    assert ledger.usage("acme")["daily"]["reserved"] == 0.01
+
+    ledger.settle(reservation, 0.004)
+
+    for period in ("daily", "monthly"):
+        usage = ledger.usage("acme")[period]
+        assert usage["spent"] == 0.004
+        assert usage["reserved"] == 0.0
+
+
+def test_reservation_over_cap_is_rejected_and_not_booked(ledger):
+    ledger.settle(ledger.reserve("acme", 0.6), 0.6)
+    held = ledger.reserve("acme", 0.3)
+
+    with pytest.raises(SpendCapExceeded) as raised:
+        ledger.reserve("acme", 0.2)
+
+    assert raised.value.period == "daily"
+    assert raised.value.committed == pytest.approx(0.9)
+    assert ledger.usage("acme")["daily"]["reserved"] == pytest.approx(0.3)
+    ledger.settle(held, 0.0)
+    ledger.reserve("acme", 0.2)           # fits again once the reservation is gone
+
+
+def test_tenants_have_separate_budgets(ledger):
+    ledger.settle(ledger.reserve("acme", 0.9), 0.9)
+
+    ledger.reserve("globex", 0.9)
+
+    assert ledger.usage("globex")["daily"]["spent"] == 0.0
+
+
+def test_expired_reservations_are_given_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(spend_ledger, "_SWEEP_INTERVAL", 0)
+    ledger = SpendLedger(tmp_path / "ledger.sqlite3", daily_cap=1.0, reservation_ttl=-1)
+    stale = ledger.reserve("acme", 0.8)
+
+    # The next reservation sweeps the expired one first, so it fits under the cap
+    ledger.reserve("acme", 0.8)
+    assert ledger.usage("acme")["daily"]["reserved"] == pytest.approx(0.8)
+
+    # Settling an expired reservation only adds the actual cost
+    ledger.settle(stale, 0.1)
+    usage = ledger.usage("acme")["daily"]
+    assert usage["spent"] == pytest.approx(0.1)
+    assert usage["reserved"] == pytest.approx(0.8)
+
+
+def test_has_cap_follows_defaults_and_tenant_caps(tmp_path):
+    path = tmp_path / "ledger.sqlite3"
+    ledger = SpendLedger(path)
+    assert not ledger.has_cap("acme")
+
+    ledger.set_caps("acme", monthly=5.0)
+    assert ledger.has_cap("acme")
+    assert not ledger.has_cap("globex")
+
+    capped = SpendLedger(path, daily_cap=1.0)
+    capped.set_caps("globex", daily=0)       # 0 = unlimited, overrides the default
+    assert capped.has_cap("acme") and not capped.has_cap("globex")
+
+    # Caps set through another connection (worker) show up after refresh_caps
+    capped.set_caps("initech", daily=2.0)
+    assert not ledger.has_cap("initech")
+    ledger.refresh_caps()
+    assert ledger.has_cap("initech")
+
+
+def test_reserve_spend_skips_tenants_without_cap(ledger, monkeypatch):
+    plan = app_module.RoutePlan("llama-3.1-8b-instant", "test", 10, 20, 0.001)
+    ledger.set_caps("free", daily=0)
+    monkeypatch.setattr(ledger, "reserve", lambda *args: pytest.fail("uncapped tenant reached the ledger"))
+
+    assert asyncio.run(app_module.reserve_spend("free", plan)) is None
+
+
+def test_reserve_spend_runs_off_the_event_loop(ledger, monkeypatch):
+    plan = app_module.RoutePlan("llama-3.1-8b-instant", "test", 10, 20, 0.001)
+    threads = []
+    reserve = ledger.reserve
+    monkeypatch.setattr(ledger, "reserve", lambda *args: threads.append(threading.current_thread()) or reserve(*args))
+
+    async def run():
+        reservation = await app_module.reserve_spend("acme", plan)
+        await app_module.settle_spend(reservation, 0.0005)
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(run())
+
+    assert threads and threads[0] is not loop_thread
+    assert ledger.usage("acme")["daily"]["spent"] == 0.0005
+
+
+def test_reserve_spend_maps_cap_to_402(ledger):
+    plan = app_module.RoutePlan("llama-3.1-8b-instant", "test", 10, 20, 2.0)
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(app_module.reserve_spend("acme", plan))
+
+    assert raised.value.status_code == 402
+
+
+def test_tenant_headers_are_checked_against_configured_keys(monkeypatch):
+    assert app_module.get_tenant(None, "acme") == "acme"
+
+    monkeypatch.setattr(app_module, "ROUTER_API_KEYS", {"secret"})
+    with pytest.raises(HTTPException) as raised:
+        app_module.get_tenant("made-up", None)
+    assert raised.value.status_code == 401
+    with pytest.raises(HTTPException):
+        app_module.get_tenant(None, "acme")
+    # A valid key decides the tenant; the tenant header cannot override it
+    assert app_module.get_tenant("secret", "acme") == app_module.get_tenant("secret", None)
@@ -0,0 +1,99 @@
+"""Tokenizer: BPE counts, loading vocabularies, counting off the event loop, downloads."""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import threading
+
+import httpx
+import pytest
+
+from backend import app as app_module
+from backend import tokenizer
+
+# Single bytes plus a few merges: "lo", "low", "er", " low"
+MERGES = [b"lo", b"low", b"er", b" low"]
+
+
+def vocabulary_text() -> str:
+    tokens = [bytes([i]) for i in range(256)] + MERGES
+    return "".join(f"{base64.b64encode(token).decode()} {rank}\n" for rank, token in enumerate(tokens))
+
+
+@pytest.fixture
+def vocabularies(tmp_path, monkeypatch):
+    """A tokenizer directory with a tiny o200k_base vocabulary, using the pure-Python encoder."""
+    monkeypatch.setattr(tokenizer, "TOKENIZER_DIR", tmp_path)
+    monkeypatch.setattr(tokenizer, "tiktoken", None)
+    (tmp_path / "o200k_base.tiktoken").write_text(vocabulary_text())
+    tokenizer.clear_cache()
+    yield tmp_path
+    tokenizer.clear_cache()
+
+
+def test_bpe_applies_merges_in_rank_order(vocabularies):
+    # "lower" → "low" + "er"; " lowest" → " low" + "e" + "s" + "t"
+    assert tokenizer.count_tokens("o200k_base", "lower") == 2
+    assert tokenizer.count_tokens("o200k_base", " lowest") == 4
+    assert tokenizer.count_tokens_batch("o200k_base", ["lower", "lower", "xyz"]) == [2, 2, 3]
+
+
+def test_missing_vocabulary_is_reported_at_startup(vocabularies, caplog):
+    with caplog.at_level(logging.WARNING, logger=tokenizer.__name__):
+        tokenizer.load_tokenizers(["o200k_base", "llama3"])
+
+    assert tokenizer._tokenizers["o200k_base"] is not None
+    assert tokenizer.count_tokens("llama3", "lower") is None          # heuristic fallback
+    warning, = caplog.records
+    assert "llama3" in warning.getMessage() and "download" in warning.getMessage()
+
+
+def test_long_prompts_are_counted_in_a_worker_thread(vocabularies, monkeypatch):
+    monkeypatch.setattr(tokenizer, "TOKENIZER_THREAD_MIN_CHARS", 100)
+    index = type("Index", (), {"tokenizers": {"o200k_base": None}})
+    monkeypatch.setattr(app_module, "get_routing_index", lambda: index)
+    encoder = tokenizer.get_tokenizer("o200k_base")
+    threads = []
+    count_batch = encoder.count_batch
+
+    def record_thread(texts):
+        threads.append(threading.current_thread())
+        return count_batch(texts)
+
+    monkeypatch.setattr(encoder, "count_batch", record_thread)
+    long_prompt = "lower " * 50
+
+    async def run():
+        await app_module.count_tokens_in_thread(["short prompt", long_prompt])
+        # Routing on the event loop now finds the count in the cache
+        count = tokenizer.count_tokens("o200k_base", long_prompt)
+        return count, threading.current_thread()
+
+    count, loop_thread = asyncio.run(run())
+
+    assert count == 50 * 2 + 1            # "low"/" low" + "er" per word, plus the trailing space
+    assert len(threads) == 1 and threads[0] is not loop_thread
+
+
+def test_download_checks_the_checksum(tmp_path, monkeypatch):
+    content = vocabulary_text().encode()
+    client = httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=content)))
+    monkeypatch.setattr(tokenizer.httpx, "stream", client.stream)
+    monkeypatch.setattr(tokenizer, "TOKENIZER_DIR", tmp_path)
+    family = tokenizer.TOKENIZER_FAMILIES["o200k_base"]
+    monkeypatch.setitem(family, "sha256", hashlib.sha256(content).hexdigest())
+
+    assert tokenizer.download_vocabulary("o200k_base").read_bytes() == content
+
+    monkeypatch.setitem(family, "sha256", "0" * 64)
+    (tmp_path / "o200k_base.tiktoken").unlink()
+    with pytest.raises(RuntimeError):
+        tokenizer.download_vocabulary("o200k_base")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_gated_download_needs_a_token(monkeypatch):
+    monkeypatch.delenv("HF_TOKEN", raising=False)
+    with pytest.raises(RuntimeError, match="HF_TOKEN"):
+        tokenizer.download_vocabulary("llama3")